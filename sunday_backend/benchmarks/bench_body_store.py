@@ -0,0 +1,93 @@
+"""
+Размер хранения и стоимость чтения HTML-тел писем: сырой body_html против body_store.
+
+    python benchmarks/bench_body_store.py [--emails 200] [--html-dir path/to/*.html]
+
+Без --html-dir генерирует синтетические рассылки (таблочная верстка, инлайн-стили,
+трекинговые ссылки, повторяющийся футер) — по профилю близко к Substack/beehiiv.
+"""
+import argparse
+import glob
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import body_store
+
+WORDS = ("market growth founders capital model agents defense policy revenue launch "
+         "pricing infra latency compute chips regulation hiring funding startup").split()
+
+def synthetic_newsletter(rng):
+    paragraphs = []
+    for _ in range(rng.randint(8, 30)):
+        text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(40, 120)))
+        link = f"https://click.example.com/track?u={rng.getrandbits(64):x}&id={rng.getrandbits(32):x}"
+        paragraphs.append(
+            f'<tr><td style="padding:12px 24px;font-family:Georgia,serif;font-size:17px;line-height:1.6;color:#333">'
+            f'<p style="margin:0 0 16px 0">{text} <a href="{link}" style="color:#ff6719">Read more</a></p></td></tr>'
+        )
+    footer = ('<tr><td style="font-size:12px;color:#999;text-align:center">You are receiving this because you '
+              'subscribed. <a href="https://example.com/unsubscribe">Unsubscribe</a> · '
+              '<a href="https://example.com/prefs">Manage your preferences</a></td></tr>') * 3
+    return ('<html><head><style>' + "td{font-family:Arial} " * 50 + '</style></head><body>'
+            '<table width="100%" cellpadding="0" cellspacing="0">' + "".join(paragraphs) + footer +
+            '</table></body></html>')
+
+def load_corpus(args):
+    if args.html_dir:
+        paths = sorted(glob.glob(os.path.join(args.html_dir, "*.html")))[:args.emails]
+        return [open(p, encoding="utf-8", errors="ignore").read() for p in paths]
+    rng = random.Random(42)
+    return [synthetic_newsletter(rng) for _ in range(args.emails)]
+
+def measure(corpus, mode, codec):
+    os.environ["BODY_STORE"] = mode
+    os.environ["BODY_STORE_CODEC"] = codec
+
+    t0 = time.perf_counter()
+    rows = [body_store.store_html(html) for html in corpus]
+    store_ms = (time.perf_counter() - t0) * 1000
+
+    t0 = time.perf_counter()
+    for row, html in zip(rows, corpus):
+        assert body_store.load_html(row) == html
+    load_ms = (time.perf_counter() - t0) * 1000
+
+    # Сколько байт уходит из Postgres в ответе на select этой колонки
+    row_bytes = sum(len((r['body_html_ref'] or "").encode()) for r in rows)
+    return row_bytes, store_ms / len(corpus), load_ms / len(corpus)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--emails", type=int, default=200)
+    parser.add_argument("--html-dir", default=None)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args)
+    raw_bytes = sum(len(h.encode()) for h in corpus)
+    print(f"📚 {len(corpus)} emails, raw body_html: {raw_bytes / 1_000_000:.2f} MB "
+          f"(avg {raw_bytes / len(corpus) / 1000:.1f} KB)\n")
+    print(f"{'layout':<14}{'row bytes':>12}{'ratio':>8}{'store ms':>10}{'load ms':>10}")
+    print(f"{'raw column':<14}{raw_bytes:>12}{1.0:>8.2f}{0.0:>10.3f}{0.0:>10.3f}")
+
+    layouts = [("inline", "gz")]
+    if body_store.zstandard:
+        layouts.append(("inline", "zstd"))
+    layouts.append(("blob", body_store._codec()))
+
+    with tempfile.TemporaryDirectory() as blob_dir:
+        os.environ["BODY_STORE_DIR"] = blob_dir
+        for mode, codec in layouts:
+            row_bytes, store_ms, load_ms = measure(corpus, mode, codec)
+            label = f"{mode}/{codec}"
+            print(f"{label:<14}{row_bytes:>12}{row_bytes / raw_bytes:>8.2f}{store_ms:>10.3f}{load_ms:>10.3f}")
+            if mode == "blob":
+                disk = sum(os.path.getsize(p) for p in glob.glob(os.path.join(blob_dir, "*", "*")))
+                print(f"{'  blob files':<14}{disk:>12}{disk / raw_bytes:>8.2f}")
+
+if __name__ == "__main__":
+    main()
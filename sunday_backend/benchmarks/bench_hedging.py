@@ -0,0 +1,66 @@
+"""
+Хеджирование LLM-вызовов (hedging.Hedger) на синтетическом распределении задержек.
+
+    python benchmarks/bench_hedging.py [--calls 2000] [--workers 8] [--scale 0.002]
+
+Задержка вызова — логнормальная медиана + редкие «зависания» (как у Gemini:
+p99 в разы выше p50). scale переводит условные секунды в реальные, чтобы прогон
+занимал секунды. Печатает p50/p99 без хеджа и с хеджем, долю дублей и их выигрыши.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hedging import Hedger
+
+def make_call(scale, seed):
+    rng = random.Random(seed)
+    lock = threading.Lock()
+
+    def call():
+        with lock:
+            latency = rng.lognormvariate(2.0, 0.35)          # медиана ~7s
+            if rng.random() < 0.04:
+                latency += rng.uniform(20, 60)              # зависший запрос
+        time.sleep(latency * scale)
+        return latency
+    return call
+
+def run(fn, calls, workers, scale):
+    def timed(_):
+        started = time.perf_counter()
+        fn()
+        return (time.perf_counter() - started) / scale
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        timings = sorted(pool.map(timed, range(calls)))
+    return statistics.median(timings), timings[int(len(timings) * 0.99) - 1]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--scale", type=float, default=0.002)
+    parser.add_argument("--percentile", type=float, default=95)
+    parser.add_argument("--max-rate", type=float, default=0.05)
+    args = parser.parse_args()
+
+    p50, p99 = run(make_call(args.scale, 1), args.calls, args.workers, args.scale)
+    print(f"🐢 plain:  p50 {p50:.1f}s, p99 {p99:.1f}s")
+
+    hedger = Hedger(percentile=args.percentile, max_rate=args.max_rate, workers=args.workers * 2)
+    call = make_call(args.scale, 1)
+    p50, p99 = run(lambda: hedger.call(call), args.calls, args.workers, args.scale)
+    print(f"🪁 hedged: p50 {p50:.1f}s, p99 {p99:.1f}s")
+    print(f"   {hedger.summary()}")
+    # summary() печатает порог в реальных секундах прогона — здесь в условных
+    print(f"   threshold p{args.percentile:g}: {hedger.threshold() / args.scale:.1f}s")
+
+if __name__ == "__main__":
+    main()
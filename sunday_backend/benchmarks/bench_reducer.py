@@ -0,0 +1,107 @@
+"""
+Токены и задержка промпта Junior Chef: прежний срез body[:8000] против reducer.reduce_text.
+
+    python benchmarks/bench_reducer.py [--emails 200] [--txt-dir path/to/*.txt] [--live 10]
+
+Без --txt-dir генерирует синтетические рассылки: длинная статья, спонсорская вставка,
+список ссылок и повторяющийся футер. "coverage" — доля абзацев статьи, попавших в промпт.
+--live N дополнительно отправляет N писем в Gemini обоими способами (нужен GEMINI_API_KEY).
+"""
+import argparse
+import glob
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from reducer import reduce_text, estimate_tokens, JUNIOR_TOKENS, CHARS_PER_TOKEN
+
+WORDS = ("market growth founders capital model agents defense policy revenue launch "
+         "pricing infra latency compute chips regulation hiring funding startup").split()
+
+def synthetic_newsletter(rng):
+    header = "View this email in your browser\n\nThe Weekly Signal — Issue #%d" % rng.randint(1, 500)
+    article = []
+    for i in range(rng.randint(3, 40)):
+        text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(40, 120)))
+        article.append(f"Section {i}. {text}.")
+    sponsor = ("This issue is brought to you by Acme Cloud. Get 50% off your first month.\n"
+               "https://acme.example.com/?utm_source=newsletter")
+    links = "\n".join(f"- https://click.example.com/track?u={rng.getrandbits(64):x}" for _ in range(rng.randint(5, 20)))
+    footer = ("You are receiving this because you subscribed.\nUnsubscribe | Manage your preferences\n"
+              "Share this newsletter with a friend")
+    mid = rng.randint(1, len(article) - 1)
+    parts = [header] + article[:mid] + [sponsor, footer] + article[mid:] + [links, footer]
+    return "\n\n".join(parts), article
+
+def load_corpus(args):
+    if args.txt_dir:
+        paths = sorted(glob.glob(os.path.join(args.txt_dir, "*.txt")))[:args.emails]
+        return [(open(p, encoding="utf-8", errors="ignore").read(), None) for p in paths]
+    rng = random.Random(42)
+    return [synthetic_newsletter(rng) for _ in range(args.emails)]
+
+def coverage(prompt_body, article):
+    if not article:
+        return None
+    return sum(1 for p in article if p in prompt_body) / len(article)
+
+def live(corpus, n):
+    from pipeline import get_client
+
+    client = get_client()
+    if not client:
+        print("⚠️ --live skipped: no Gemini client")
+        return
+    timings = {"slice": [], "reduce": []}
+    for text, _ in corpus[:n]:
+        bodies = {"slice": text[:JUNIOR_TOKENS * CHARS_PER_TOKEN], "reduce": reduce_text(text, JUNIOR_TOKENS)[0]}
+        for name, body in bodies.items():
+            t0 = time.perf_counter()
+            client.models.generate_content(
+                model="gemini-3-pro-preview",
+                contents=f"Summarize this newsletter in 3 sentences as JSON {{\"summary\": ...}}.\n\n{body}",
+                config={'response_mime_type': 'application/json'},
+            )
+            timings[name].append((time.perf_counter() - t0) * 1000)
+    for name, values in timings.items():
+        print(f"  🌐 {name:<7} p50 {statistics.median(values):8.0f} ms   max {max(values):8.0f} ms")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--emails", type=int, default=200)
+    parser.add_argument("--txt-dir", default=None)
+    parser.add_argument("--budget", type=int, default=JUNIOR_TOKENS, help="токенов на письмо")
+    parser.add_argument("--live", type=int, default=0, help="писем для замера в Gemini")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args)
+    raw_tokens = sum(estimate_tokens(t) for t, _ in corpus)
+    print(f"📚 {len(corpus)} emails, {raw_tokens} tokens raw (avg {raw_tokens / len(corpus):.0f})\n")
+    print(f"{'method':<10}{'tokens':>10}{'ratio':>8}{'coverage':>10}{'ms/email':>10}")
+
+    results = {}
+    for name in ("slice", "reduce"):
+        t0 = time.perf_counter()
+        if name == "slice":
+            bodies = [t[:args.budget * CHARS_PER_TOKEN] for t, _ in corpus]
+        else:
+            bodies = [reduce_text(t, args.budget)[0] for t, _ in corpus]
+        ms = (time.perf_counter() - t0) * 1000 / len(corpus)
+        tokens = sum(estimate_tokens(b) for b in bodies)
+        covs = [c for c in (coverage(b, a) for b, (_, a) in zip(bodies, corpus)) if c is not None]
+        cov = f"{statistics.mean(covs):.2f}" if covs else "-"
+        results[name] = tokens
+        print(f"{name:<10}{tokens:>10}{tokens / raw_tokens:>8.2f}{cov:>10}{ms:>10.3f}")
+
+    saved = results["slice"] - results["reduce"]
+    print(f"\n✂️ Prompt tokens saved vs slicing: {saved} ({100 * saved / max(1, results['slice']):.0f}%)")
+
+    if args.live:
+        live(corpus, args.live)
+
+if __name__ == "__main__":
+    main()
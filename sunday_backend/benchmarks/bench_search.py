@@ -0,0 +1,89 @@
+"""
+Задержка локального поиска (search.InvertedIndex) на корпусе одного пользователя.
+
+    python benchmarks/bench_search.py [--docs 10000] [--queries 500] [--budget 100]
+
+Синтетические саммари и дайджесты (словарь с распределением Ципфа, как в реальных
+рассылках: пара частых слов и длинный хвост). Печатает время построения,
+p50/p99 запросов из 1-3 слов. Код возврата 1, если p99 выше --budget мс.
+Postgres-путь (RPC search_briefs) меряется на живой базе: EXPLAIN ANALYZE select * from search_briefs(...).
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from search import InvertedIndex, summary_document, digest_document
+
+def vocabulary(rng, size=20000):
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return ["".join(rng.choice(letters) for _ in range(rng.randint(3, 10))) for _ in range(size)]
+
+def corpus(n, rng):
+    vocab = vocabulary(rng)
+    weights = [1 / (i + 1) for i in range(len(vocab))]
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+    def words(k):
+        return " ".join(rng.choices(vocab, weights, k=k))
+
+    docs = []
+    for i in range(n):
+        created = (start + timedelta(hours=i)).isoformat()
+        if i % 20 == 0:
+            docs.append(digest_document({
+                "id": i, "created_at": created, "summary_text": words(60),
+                "structured_content": {"trends": [{"title": words(6), "insight": words(80)} for _ in range(4)]},
+            }))
+        else:
+            docs.append(summary_document({
+                "id": i, "digest_id": i - i % 20, "created_at": created,
+                "topic": words(8), "summary": words(rng.randint(40, 150)),
+            }))
+    return docs, vocab
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=10000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--budget", type=float, default=100, help="мс на p99")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    docs, vocab = corpus(args.docs, rng)
+
+    index = InvertedIndex()
+    started = time.perf_counter()
+    for doc in docs:
+        index.add(doc)
+    build = time.perf_counter() - started
+    print(f"📚 {len(index)} docs, {len(index.postings)} terms, built in {build:.2f}s "
+          f"({build / len(index) * 1e6:.0f} µs/doc incremental add)")
+
+    # Запросы: частые слова (длинные списки) вперемешку с хвостом
+    head = vocab[:200]
+    timings, hits = [], []
+    for _ in range(args.queries):
+        pool = head if rng.random() < 0.5 else vocab[:5000]
+        text = " ".join(rng.sample(pool, rng.randint(1, 3)))
+        started = time.perf_counter()
+        result = index.search(text)
+        timings.append((time.perf_counter() - started) * 1000)
+        hits.append(len(result))
+
+    timings.sort()
+    p50 = statistics.median(timings)
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+    print(f"🔎 {args.queries} queries: p50 {p50:.2f} ms, p99 {p99:.2f} ms, max {timings[-1]:.2f} ms, "
+          f"avg hits {statistics.mean(hits):.1f}")
+    ok = p99 <= args.budget
+    print(f"{'✅' if ok else '❌ over budget'} (budget {args.budget:.0f} ms)")
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Векторный индекс саммари (vector_index.py): построение, задержка top-k и recall графа.
+
+    python benchmarks/bench_vectors.py [--docs 20000] [--queries 200] [--k 10]
+
+Синтетические саммари: темы из общего словаря + шум, у каждой темы десятки вариантов
+(как одна история, которую пересказывают разные рассылки). Индекс пишется во временный
+каталог. Сначала меряется полный перебор, затем граф (build_graph() поверх тех же
+векторов) — его recall@k считается против перебора.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import vector_index
+from vector_index import VectorIndex
+
+def corpus(n, rng):
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    vocab = ["".join(rng.choice(letters) for _ in range(rng.randint(4, 9))) for _ in range(8000)]
+    topics = [rng.sample(vocab, 12) for _ in range(max(1, n // 30))]
+    rows = []
+    for i in range(n):
+        topic = rng.choice(topics)
+        words = rng.sample(topic, 8) + rng.sample(vocab, 25)
+        rng.shuffle(words)
+        rows.append({"id": i, "topic": " ".join(topic[:3]), "summary": " ".join(words),
+                     "created_at": f"2025-01-01T00:00:{i:08d}"})
+    return rows
+
+def measure(index, queries, k):
+    timings, results = [], []
+    for q in queries:
+        started = time.perf_counter()
+        results.append([h['id'] for h in index.search(q, k, min_similarity=-1)])
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.99) - 1], results
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    rows = corpus(args.docs, rng)
+    queries = [vector_index.summary_text(r) for r in rng.sample(rows, args.queries)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        index = VectorIndex("bench", tmp)
+        started = time.perf_counter()
+        for row in rows:
+            index.add_summary(row)
+        build = time.perf_counter() - started
+        print(f"🧮 {len(index)} vectors × {vector_index.DIM} in {build:.1f}s "
+              f"({build / len(index) * 1e3:.2f} ms/summary embed + append)")
+        p50, p99, exact = measure(index, queries, args.k)
+        print(f"🔎 brute force: p50 {p50:.2f} ms, p99 {p99:.2f} ms")
+
+        started = time.perf_counter()
+        index = VectorIndex("bench", tmp)
+        index.build_graph()
+        print(f"🕸️ graph built in {time.perf_counter() - started:.1f}s")
+        p50, p99, approx = measure(index, queries, args.k)
+        recall = statistics.mean(len(set(a) & set(e)) / max(1, len(e)) for a, e in zip(approx, exact))
+        print(f"🔎 graph: p50 {p50:.2f} ms, p99 {p99:.2f} ms, recall@{args.k} {recall:.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Время импорта точек входа (python -X importtime) против бюджета.
+
+    python benchmarks/import_time.py [--runs 5] [--top 8] [--only pipeline,dashboard]
+
+Каждая цель импортируется в чистом интерпретаторе; из отчета вычитаются модули,
+которые грузит сам интерпретатор (site, encodings). Берется медиана по --runs.
+Код возврата 1, если какая-то цель вышла за бюджет — годится для CI.
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DASHBOARD = os.path.join(os.path.dirname(BACKEND), "sunday_dashboard")
+
+# цель -> (что импортировать, бюджет в мс)
+TARGETS = {
+    "pipeline": ("import pipeline", 150),
+    "scheduler": ("import scheduler", 150),
+    "summarize_worker": ("import summarize_worker", 150),
+    "outbox": ("import outbox", 100),
+    # То, что app.py импортирует на холодном старте (без st.set_page_config и рендера)
+    "dashboard": ("import streamlit, extra_streamlit_components, dotenv, render, digest_index, db", 1500),
+}
+
+LINE_RE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|( *)(\S+)")
+
+def importtime(code):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([BACKEND, DASHBOARD]))
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                          capture_output=True, text=True, env=env, cwd=BACKEND)
+    rows = []
+    for line in proc.stderr.splitlines():
+        m = LINE_RE.match(line)
+        if m:
+            rows.append((m.group(4), int(m.group(1)), int(m.group(2)), len(m.group(3)) // 2))
+    error = proc.stderr.strip().splitlines()[-1] if proc.returncode else None
+    return rows, error
+
+def measure(code, baseline):
+    """(суммарное время верхнеуровневых импортов в мс, самые тяжелые модули, ошибка)"""
+    rows, error = importtime(code)
+    rows = [r for r in rows if r[0] not in baseline]
+    total_us = sum(cum for name, _, cum, depth in rows if depth == 0)
+    return total_us / 1000, rows, error
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=8, help="показать N самых тяжелых модулей")
+    parser.add_argument("--only", default=None, help="цели через запятую")
+    args = parser.parse_args()
+
+    baseline = {name for name, *_ in importtime("pass")[0]}
+    names = args.only.split(",") if args.only else list(TARGETS)
+
+    failed = False
+    print(f"{'target':<18}{'median ms':>10}{'budget':>8}  status")
+    for name in names:
+        code, budget = TARGETS[name]
+        runs, rows, error = [], [], None
+        for _ in range(args.runs):
+            ms, rows, error = measure(code, baseline)
+            if error:
+                break
+            runs.append(ms)
+        if error:
+            # Сломанный импорт — тоже провал бюджета, а не пропуск
+            print(f"{name:<18}{'-':>10}{budget:>8}  ❌ {error}")
+            failed = True
+            continue
+        median = statistics.median(runs)
+        ok = median <= budget
+        failed |= not ok
+        print(f"{name:<18}{median:>10.1f}{budget:>8}  {'✅' if ok else '❌ over budget'}")
+        for mod, self_us, cum_us, depth in sorted(rows, key=lambda r: -r[1])[:args.top]:
+            print(f"    {mod:<40} self {self_us / 1000:7.1f} ms   cumulative {cum_us / 1000:7.1f} ms")
+
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+"""
+Нагрузочный тест /webhook/email: сколько писем в секунду принимает main.py, пока задержка не разваливается.
+
+    # 1. (необязательно) записать реальный трафик: WEBHOOK_CAPTURE=payloads.jsonl uvicorn main:app
+    # 2. прогнать ступени нагрузки против локального uvicorn с заглушкой Supabase
+    python benchmarks/webhook_load.py --payloads payloads.jsonl --rates 10,25,50,100,200 --duration 10
+
+    # против уже запущенного сервера (без заглушки)
+    python benchmarks/webhook_load.py --target http://127.0.0.1:8000
+
+    # /webhook/email/batch: по 25 писем в gzip-пачке (rate — пачек в секунду)
+    python benchmarks/webhook_load.py --batch 25 --rates 1,2,4,8
+
+Нагрузка open-loop: запросы уходят по расписанию с заданной частотой, задержка
+считается от запланированного момента — очередь внутри клиента тоже видна в p99.
+Точка насыщения — последняя ступень, где сервер держит частоту (>= 90%), p99 в пределах
+--slo-ms и ошибок меньше 1%. Итог каждого прогона дописывается в results/webhook_load.jsonl.
+"""
+import argparse
+import bisect
+import gzip
+import http.client
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from email.message import EmailMessage
+from urllib.parse import urlparse
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+RESULTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results", "webhook_load.jsonl")
+HIST_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+STUB_USER_ID = "00000000-0000-0000-0000-000000000001"
+
+# --- ЗАГЛУШКА SUPABASE (для режима serve) ---
+
+class StubResponse:
+    def __init__(self, data):
+        self.data = data
+
+class StubQuery:
+    """Цепочка .select().eq()...execute() без сети; execute() ждет db_latency, как round-trip в Supabase"""
+
+    def __init__(self, table, latency):
+        self.table = table
+        self.latency = latency
+        self.op = "select"
+        self.values = None
+
+    def __getattr__(self, name):
+        # eq, in_, is_, limit, order, ... — фильтры не важны
+        return lambda *args, **kwargs: self
+
+    def insert(self, *args, **kwargs):
+        self.op = "insert"
+        return self
+
+    def in_(self, column, values):
+        self.values = values
+        return self
+
+    def execute(self):
+        if self.latency:
+            time.sleep(self.latency)
+        if self.table == "profiles" and self.op == "select":
+            # Любой inbox_email принадлежит тестовому пользователю
+            return StubResponse([{"id": STUB_USER_ID, "inbox_email": v} for v in self.values or [None]])
+        return StubResponse([])
+
+class StubSupabase:
+    def __init__(self, latency_ms=0):
+        self.latency = latency_ms / 1000
+
+    def table(self, name):
+        return StubQuery(name, self.latency)
+
+def serve(port, db_latency_ms):
+    """Поднимает main.app на uvicorn с заглушкой вместо Supabase (вызывается в подпроцессе)"""
+    import uvicorn
+
+    # create_client в main.py только валидирует параметры, в сеть не ходит
+    os.environ.setdefault("SUPABASE_URL", "http://stub.localhost")
+    os.environ.setdefault("SUPABASE_KEY", "stub")
+    os.environ.pop("WEBHOOK_CAPTURE", None)
+    import main
+
+    main.supabase = StubSupabase(db_latency_ms)
+    uvicorn.run(main.app, host="127.0.0.1", port=port, log_level="warning", access_log=False)
+
+def start_server(db_latency_ms):
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    proc = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "--serve", str(port), "--db-latency-ms", str(db_latency_ms)],
+        cwd=BACKEND, stdout=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        if proc.poll() is not None:
+            raise RuntimeError("stub server exited, see stderr above")
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", "/")
+            conn.getresponse().read()
+            return proc, url
+        except OSError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError("stub server did not start")
+
+# --- PAYLOADS ---
+
+WORDS = ("market growth founders capital model agents defense policy revenue launch "
+         "pricing infra latency compute chips regulation hiring funding startup").split()
+
+def synthetic_payload(rng):
+    text = "\n\n".join(" ".join(rng.choice(WORDS) for _ in range(rng.randint(40, 120)))
+                       for _ in range(rng.randint(5, 30)))
+    msg = EmailMessage()
+    msg["From"] = "Newsletter <news@example.com>"
+    msg["To"] = "inbox@sunday.dev"
+    msg["Subject"] = "Weekly issue"
+    msg.set_content(text)
+    msg.add_alternative("<html><body>" + "".join(f"<p style='margin:0 0 16px'>{p}</p>" for p in text.split("\n\n"))
+                        + "</body></html>", subtype="html")
+    return {"sender": msg["From"], "recipient": msg["To"], "subject": msg["Subject"], "raw_email": msg.as_string()}
+
+def load_payloads(path, count=50):
+    if path:
+        with open(path, encoding="utf-8") as f:
+            payloads = [json.loads(line) for line in f if line.strip()]
+        if payloads:
+            return payloads
+    rng = random.Random(42)
+    return [synthetic_payload(rng) for _ in range(count)]
+
+# --- ГЕНЕРАТОР НАГРУЗКИ ---
+
+class Client:
+    """Keep-alive соединение на поток"""
+
+    def __init__(self, url, timeout):
+        parsed = urlparse(url)
+        self.host, self.port = parsed.hostname, parsed.port or 80
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def post(self, path, body, headers):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = self.local.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        try:
+            conn.request("POST", path, body=body, headers=headers)
+            response = conn.getresponse()
+            data = response.read()
+            ok = response.status == 200 and b'"error"' not in data
+            return ok
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            self.local.conn = None
+            return False
+
+def make_requests(payloads, batch):
+    """(path, bodies, headers): по письму на запрос или gzip-пачки по batch писем"""
+    if not batch:
+        return "/webhook/email", [json.dumps(p).encode() for p in payloads], {"Content-Type": "application/json"}
+    chunks = [payloads[i:i + batch] for i in range(0, len(payloads), batch)]
+    chunks = [c for c in chunks if len(c) == batch] or chunks
+    bodies = [gzip.compress(json.dumps(c).encode()) for c in chunks]
+    return "/webhook/email/batch", bodies, {"Content-Type": "application/json", "Content-Encoding": "gzip"}
+
+def run_step(client, request, rate, duration, concurrency):
+    """Одна ступень: rate запросов/с в течение duration секунд"""
+    path, bodies, headers = request
+    total = int(rate * duration)
+    latencies, errors = [], 0
+    lock = threading.Lock()
+    start = time.perf_counter() + 0.05
+
+    def fire(i):
+        nonlocal errors
+        scheduled = start + i / rate
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        ok = client.post(path, bodies[i % len(bodies)], headers)
+        latency = (time.perf_counter() - scheduled) * 1000
+        with lock:
+            latencies.append(latency)
+            errors += not ok
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(fire, range(total)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    pct = lambda p: latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))]
+    histogram = [0] * (len(HIST_BUCKETS_MS) + 1)
+    for value in latencies:
+        histogram[bisect.bisect_left(HIST_BUCKETS_MS, value)] += 1
+    return {
+        "rate": rate,
+        "requests": total,
+        "achieved_rps": round(total / elapsed, 1),
+        "error_rate": round(errors / total, 4),
+        "p50_ms": round(pct(50), 1),
+        "p90_ms": round(pct(90), 1),
+        "p99_ms": round(pct(99), 1),
+        "max_ms": round(latencies[-1], 1),
+        "mean_ms": round(statistics.mean(latencies), 1),
+        "histogram": histogram,
+    }
+
+def healthy(step, slo_ms):
+    return step["achieved_rps"] >= 0.9 * step["rate"] and step["p99_ms"] <= slo_ms and step["error_rate"] < 0.01
+
+def print_histogram(step):
+    labels = [f"<{b}ms" for b in HIST_BUCKETS_MS] + [f">={HIST_BUCKETS_MS[-1]}ms"]
+    peak = max(step["histogram"]) or 1
+    for label, count in zip(labels, step["histogram"]):
+        if count:
+            print(f"      {label:>9} {'█' * max(1, int(30 * count / peak))} {count}")
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND, text=True).strip()
+    except Exception:
+        return None
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--payloads", default=None, help="JSONL из WEBHOOK_CAPTURE (иначе синтетика)")
+    parser.add_argument("--rates", default="10,25,50,100,200", help="ступени, запросов/с")
+    parser.add_argument("--duration", type=float, default=10, help="секунд на ступень")
+    parser.add_argument("--concurrency", type=int, default=64, help="одновременных запросов")
+    parser.add_argument("--slo-ms", type=float, default=1000, help="допустимый p99")
+    parser.add_argument("--db-latency-ms", type=float, default=20, help="имитация round-trip в Supabase")
+    parser.add_argument("--target", default=None, help="URL уже запущенного сервера (без заглушки)")
+    parser.add_argument("--batch", type=int, default=0, help="писем в пачке для /webhook/email/batch")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--no-save", action="store_true", help="не дописывать results/webhook_load.jsonl")
+    parser.add_argument("--serve", type=int, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.db_latency_ms)
+        return
+
+    payloads = load_payloads(args.payloads)
+    if args.batch and len(payloads) < args.batch:
+        payloads = (payloads * args.batch)[:args.batch]
+    request = make_requests(payloads, args.batch)
+    bodies = request[1]
+    per_request = args.batch or 1
+    print(f"📚 {len(payloads)} payloads -> {request[0]}, {per_request} email(s)/request, "
+          f"avg {sum(map(len, bodies)) / len(bodies) / 1000:.1f} KB on the wire")
+
+    proc = None
+    url = args.target
+    if not url:
+        proc, url = start_server(args.db_latency_ms)
+        print(f"🧪 Stub server at {url} (db latency {args.db_latency_ms} ms)")
+
+    steps, saturation = [], None
+    client = Client(url, args.timeout)
+    try:
+        for rate in [float(r) for r in args.rates.split(",")]:
+            step = run_step(client, request, rate, args.duration, args.concurrency)
+            step["emails_per_sec"] = round(step["achieved_rps"] * per_request, 1)
+            steps.append(step)
+            ok = healthy(step, args.slo_ms)
+            print(f"  {'✅' if ok else '❌'} {rate:>6.0f} rps -> {step['achieved_rps']:>6.1f} rps  "
+                  f"p50 {step['p50_ms']:>7.1f}  p99 {step['p99_ms']:>7.1f}  max {step['max_ms']:>7.1f} ms  "
+                  f"errors {100 * step['error_rate']:.1f}%  ({step['emails_per_sec']:.0f} emails/s)")
+            print_histogram(step)
+            if not ok:
+                break
+            saturation = rate
+    finally:
+        if proc:
+            proc.terminate()
+            proc.wait()
+
+    print(f"\n🏁 Saturation point: {f'{saturation:g}' if saturation else 'below first step'} rps "
+          f"(p99 <= {args.slo_ms:.0f} ms, errors < 1%)")
+
+    if not args.no_save:
+        os.makedirs(os.path.dirname(RESULTS_PATH), exist_ok=True)
+        with open(RESULTS_PATH, "a", encoding="utf-8") as f:
+            f.write(json.dumps({
+                "at": datetime.now(timezone.utc).isoformat(),
+                "commit": git_commit(),
+                "target": "stub" if proc else url,
+                "payloads": args.payloads or "synthetic",
+                "duration": args.duration,
+                "concurrency": args.concurrency,
+                "batch": args.batch,
+                "bytes_per_email": round(sum(map(len, bodies)) / len(bodies) / per_request),
+                "db_latency_ms": args.db_latency_ms,
+                "slo_ms": args.slo_ms,
+                "saturation_rps": saturation,
+                "steps": steps,
+            }) + "\n")
+        print(f"📝 Appended to {RESULTS_PATH}")
+
+if __name__ == "__main__":
+    main()
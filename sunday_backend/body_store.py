@@ -0,0 +1,112 @@
+import argparse
+import base64
+import gzip
+import hashlib
+import os
+
+# --- ХРАНЕНИЕ HTML-ТЕЛ ПИСЕМ ---
+# Пайплайну нужен только очищенный body_plain, а сырой body_html — мегабайты на рассылку.
+# Вместо raw_emails.body_html пишем body_html_ref:
+#   "gz:<base64>"    — сжатый HTML прямо в строке (по умолчанию)
+#   "zstd:<base64>"  — то же через zstandard, если пакет установлен
+#   "blob:<sha256>"  — контентно-адресуемый файл в BODY_STORE_DIR (локальная замена object storage;
+#                      на эфемерных хостах вроде Actions/Render нужен постоянный диск)
+# Одинаковые тела (один выпуск у многих подписчиков) в blob-режиме хранятся один раз.
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+def _mode():
+    return os.environ.get("BODY_STORE", "inline")
+
+def _codec():
+    codec = os.environ.get("BODY_STORE_CODEC", "zstd" if zstandard else "gz")
+    return "gz" if codec == "zstd" and not zstandard else codec
+
+def _blob_dir():
+    return os.environ.get("BODY_STORE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".body_store"))
+
+def compress(data, codec):
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=10).compress(data)
+    return gzip.compress(data, compresslevel=6)
+
+def decompress(data, codec):
+    if codec == "zstd":
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+def _blob_path(digest, codec):
+    return os.path.join(_blob_dir(), digest[:2], f"{digest}.{codec}")
+
+def store_html(html):
+    """
+    Колонки для вставки в raw_emails вместо сырого body_html:
+    {"body_html": None, "body_html_ref": ...}
+    """
+    if not html:
+        return {"body_html": None, "body_html_ref": None}
+
+    raw = html.encode("utf-8")
+    codec = _codec()
+
+    if _mode() == "blob":
+        digest = hashlib.sha256(raw).hexdigest()
+        path = _blob_path(digest, codec)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(compress(raw, codec))
+            os.replace(tmp, path)  # атомарно: читатели не увидят недописанный файл
+        return {"body_html": None, "body_html_ref": f"blob:{codec}:{digest}"}
+
+    packed = base64.b64encode(compress(raw, codec)).decode("ascii")
+    return {"body_html": None, "body_html_ref": f"{codec}:{packed}"}
+
+def load_html(row):
+    """HTML письма из строки raw_emails — и для новых (ref), и для старых (body_html) строк"""
+    if row.get('body_html'):
+        return row['body_html']
+    ref = row.get('body_html_ref')
+    if not ref:
+        return ""
+
+    scheme, _, payload = ref.partition(":")
+    if scheme == "blob":
+        codec, _, digest = payload.partition(":")
+        with open(_blob_path(digest, codec), "rb") as f:
+            return decompress(f.read(), codec).decode("utf-8")
+    return decompress(base64.b64decode(payload), scheme).decode("utf-8")
+
+def migrate(supabase, batch_size=100):
+    """Переносит body_html существующих raw_emails в хранилище и обнуляет колонку"""
+    moved = saved_bytes = 0
+    while True:
+        res = supabase.table("raw_emails") \
+            .select("id, body_html") \
+            .not_.is_("body_html", "null") \
+            .limit(batch_size) \
+            .execute()
+        if not res.data:
+            break
+        for row in res.data:
+            columns = store_html(row['body_html'])
+            supabase.table("raw_emails").update(columns).eq("id", row['id']).execute()
+            saved_bytes += len(row['body_html'].encode("utf-8")) - len((columns['body_html_ref'] or "").encode("utf-8"))
+            moved += 1
+        print(f"  📦 Moved {moved} bodies, saved ~{saved_bytes / 1_000_000:.1f} MB")
+    print(f"✅ Migration done: {moved} bodies moved.")
+    return moved
+
+if __name__ == "__main__":
+    from pipeline import get_supabase
+
+    supabase = get_supabase()
+
+    parser = argparse.ArgumentParser(description="Move raw_emails.body_html into the body store")
+    parser.add_argument("--batch", type=int, default=100)
+    args = parser.parse_args()
+    migrate(supabase, args.batch)
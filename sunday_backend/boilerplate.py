@@ -0,0 +1,192 @@
+import json
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+
+# --- ОБРЕЗКА ШАБЛОННЫХ ХВОСТОВ РАССЫЛОК ---
+# "Unsubscribe / Manage your preferences / View in browser" и т.п. есть в каждой рассылке
+# и потом оплачиваются токенами. Все фразы (на всех языках) собраны в одну
+# скомпилированную альтернацию — текст проходится один раз, сколько бы фраз ни было.
+#   cutoff — начало футера: все, что после первой такой фразы во второй половине текста, отрезаем
+#   strip  — сама фраза мусорная, но текст вокруг нее нужен ("View in browser" в шапке)
+# Плюс маркеры, выученные по отправителю: предложения, которые повторяются в хвостах
+# LEARN_MIN_SEEN его писем, становятся для него дополнительными cutoff-маркерами.
+
+PHRASES = {
+    "cutoff": {
+        "en": ["unsubscribe", "manage your preferences", "manage your subscription", "update your preferences",
+               "you are receiving this", "you're receiving this", "you received this email",
+               "forwarded this email", "no longer wish to receive", "email preferences"],
+        "ru": ["отписаться", "отказаться от рассылки", "вы получили это письмо", "вы подписаны на",
+               "управление подпиской", "настройки рассылки"],
+        "de": ["abmelden", "newsletter abbestellen", "sie erhalten diese e-mail"],
+        "fr": ["se désabonner", "se desinscrire", "vous recevez cet e-mail"],
+        "es": ["darse de baja", "cancelar suscripción", "recibes este correo"],
+    },
+    "strip": {
+        "en": ["view in browser", "view this email in your browser", "view online", "read online",
+               "sponsored by", "this issue is brought to you by", "advertise with us",
+               "share this newsletter", "share this post"],
+        "ru": ["посмотреть в браузере", "открыть в браузере", "реклама", "партнерский материал"],
+        "de": ["im browser ansehen", "online ansehen"],
+        "fr": ["voir dans le navigateur", "voir la version en ligne"],
+        "es": ["ver en el navegador", "ver en línea"],
+    },
+}
+
+CUTOFF_MIN_POSITION = 0.5   # футер ищем только во второй половине текста
+LEARN_MIN_SEEN = 3         # в скольких письмах отправителя предложение должно повториться
+LEARN_TAIL = 0.25           # учимся только на последней четверти текста
+LEARN_MIN_LENGTH = 20       # короткие предложения ("Thanks!") не учим
+SENTENCE_RE = re.compile(r"(?<=[.!?|·])\s+")
+
+def _phrase_kinds():
+    kinds = {}
+    for kind, by_lang in PHRASES.items():
+        for phrases in by_lang.values():
+            for phrase in phrases:
+                kinds[phrase.lower()] = kind
+    # Доп. фразы из окружения: BOILERPLATE_CUTOFF="a,b" / BOILERPLATE_STRIP="c"
+    for kind in PHRASES:
+        for phrase in os.environ.get(f"BOILERPLATE_{kind.upper()}", "").split(","):
+            if phrase.strip():
+                kinds[phrase.strip().lower()] = kind
+    return kinds
+
+def _alternation(phrases):
+    # Длинные фразы первыми: "view this email in your browser" выигрывает у "view online"
+    ordered = sorted(phrases, key=len, reverse=True)
+    # Только целые слова: в "overview online" и "spread online" нет "view online" / "read online"
+    return re.compile(r"(?<!\w)(?:" + "|".join(re.escape(p) for p in ordered) + r")(?!\w)", re.IGNORECASE)
+
+PHRASE_KINDS = _phrase_kinds()
+PHRASE_RE = _alternation(PHRASE_KINDS)
+
+# Фразы уже в нижнем регистре: поиск по text.lower() без IGNORECASE в разы быстрее
+# (нужен, когда позиции в исходном тексте не важны)
+PHRASE_LOWER_RE = re.compile(PHRASE_RE.pattern)
+
+def contains_boilerplate(text):
+    return PHRASE_LOWER_RE.search(text.lower()) is not None
+
+def count_boilerplate(text):
+    """Сколько шаблонных фраз в тексте"""
+    return len(PHRASE_LOWER_RE.findall(text.lower()))
+
+def _sentence_key(sentence):
+    return re.sub(r"\d+", "0", " ".join(sentence.lower().split()))
+
+def _key_pattern(key):
+    """Ключ обратно в регулярку по исходному тексту: 0 -> любые цифры, пробел -> любые пробелы"""
+    return "".join(r"\d+" if t == "0" else r"\s+" if t == " " else re.escape(t)
+                   for t in re.split(r"(0| )", key) if t)
+
+class BoilerplateTrimmer:
+    """
+    trim(text, sender) -> (text, stats). Потокобезопасен: один экземпляр на процесс.
+    state_path — JSON, куда сохраняются выученные маркеры между запусками.
+    """
+
+    def __init__(self, state_path=None):
+        self.state_path = state_path
+        self._seen = defaultdict(Counter)   # sender -> ключ предложения -> сколько раз в хвосте
+        self._learned = defaultdict(set)    # sender -> ключи-маркеры
+        self._compiled = {}
+        self._lock = threading.Lock()
+        if state_path and os.path.exists(state_path):
+            with open(state_path, encoding="utf-8") as f:
+                for sender, markers in json.load(f).items():
+                    self._learned[sender] = set(markers)
+
+    def save(self):
+        if not self.state_path:
+            return
+        with self._lock:
+            data = {s: sorted(m) for s, m in self._learned.items() if m}
+        tmp = f"{self.state_path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, self.state_path)
+
+    def learned_markers(self, sender):
+        return set(self._learned.get(sender, ()))
+
+    def _sender_re(self, sender):
+        with self._lock:
+            markers = self._learned.get(sender)
+            if not markers:
+                return None
+            cached = self._compiled.get(sender)
+            if cached and cached[0] == len(markers):
+                return cached[1]
+            ordered = sorted(markers, key=len, reverse=True)
+            pattern = re.compile("|".join(_key_pattern(k) for k in ordered), re.IGNORECASE)
+            self._compiled[sender] = (len(markers), pattern)
+            return pattern
+
+    def _learn(self, sender, head, tail):
+        # Предложения, которые есть и в теле письма, — контент (или рубрика), а не футер
+        keys = {_sentence_key(s) for s in SENTENCE_RE.split(tail)
+                if len(s) >= LEARN_MIN_LENGTH and s not in head}
+        with self._lock:
+            seen = self._seen[sender]
+            for key in keys:
+                seen[key] += 1
+                if seen[key] == LEARN_MIN_SEEN:
+                    self._learned[sender].add(key)
+
+    def trim(self, text, sender=None):
+        """
+        Обрезает футер и вырезает мусорные фразы.
+        stats: chars_in, chars_out, removed_chars, cutoff (какой маркер отрезал хвост), stripped.
+        """
+        stats = {"chars_in": len(text or ""), "chars_out": 0, "removed_chars": 0, "cutoff": None, "stripped": 0}
+        if not text:
+            return "", stats
+
+        min_pos = int(len(text) * CUTOFF_MIN_POSITION)
+        cut_at, cut_by = len(text), None
+        strips = []
+        # Один проход по всем фразам
+        for m in PHRASE_RE.finditer(text):
+            if PHRASE_KINDS[m.group(0).lower()] == "cutoff":
+                if m.start() >= min_pos:
+                    cut_at, cut_by = m.start(), m.group(0)
+                    break
+            else:
+                strips.append((m.start(), m.end()))
+
+        if sender:
+            tail_pos = int(len(text) * (1 - LEARN_TAIL))
+            sender_re = self._sender_re(sender)
+            if sender_re:
+                m = sender_re.search(text, tail_pos, cut_at)
+                if m:
+                    cut_at, cut_by = m.start(), "learned"
+            self._learn(sender, text[:tail_pos], text[tail_pos:])
+
+        parts, pos = [], 0
+        for start, end in strips:
+            if start >= cut_at:
+                break
+            parts.append(text[pos:start])
+            pos = end
+            stats["stripped"] += 1
+        parts.append(text[pos:cut_at])
+
+        # Пробелы на месте вырезанных фраз схлопываем, но абзацы (пустая строка) сохраняем
+        trimmed = re.sub(r"[^\S\n]{2,}", " ", "".join(parts))
+        trimmed = re.sub(r"[^\S\n]*\n\s*", lambda m: "\n\n" if m.group(0).count("\n") > 1 else "\n", trimmed)
+        trimmed = trimmed.strip(" |·-—\n")
+        stats.update(chars_out=len(trimmed), removed_chars=len(text) - len(trimmed), cutoff=cut_by)
+        return trimmed, stats
+
+_default = None
+
+def get_trimmer():
+    """Общий экземпляр; BOILERPLATE_STATE — путь к JSON с выученными маркерами"""
+    global _default
+    if _default is None:
+        _default = BoilerplateTrimmer(os.environ.get("BOILERPLATE_STATE"))
+    return _default
@@ -6,6 +6,9 @@ import re
 from dotenv import load_dotenv
 from bs4 import BeautifulSoup
 from supabase import create_client, Client
+from body_store import store_html
+from boilerplate import get_trimmer
+import deadline
 
 load_dotenv()
 
@@ -20,6 +23,8 @@ IMAP_SERVER = "imap.gmail.com" # Обычно это для Gmail, если др
 
 # Дата, с которой начинаем сканировать (формат: DD-Mon-YYYY)
 DATE_SINCE = "01-Dec-2025" 
+# Новое письмо не скачиваем, если от бюджета запуска осталось меньше — остальное заберет следующий запуск
+FETCH_RESERVE_SECONDS = 30
 
 def get_allowed_senders():
     """Берем список активных подписок из базы данных"""
@@ -33,10 +38,16 @@ def get_allowed_senders():
         print(f"❌ Ошибка получения подписок: {e}")
         return []
 
-def aggressive_clean_html(html_content):
-    """Жесткая очистка HTML для экономии токенов"""
+BLOCK_TAGS = ["p", "div", "br", "li", "tr", "table", "h1", "h2", "h3", "h4", "h5", "h6", "blockquote", "section", "article"]
+PARAGRAPH_MARK = "\u2029"  # разделитель абзацев Unicode: в HTML-тексте его не бывает
+
+def aggressive_clean_html(html_content, sender=None):
+    """
+    Жесткая очистка HTML для экономии токенов.
+    Возвращает (text, stats) — stats от обрезки шаблонных хвостов (boilerplate.py).
+    """
     if not html_content:
-        return ""
+        return "", None
     
     soup = BeautifulSoup(html_content, "html.parser")
     
@@ -50,31 +61,33 @@ def aggressive_clean_html(html_content):
     for element in soup(["footer", "header", "nav", "aside"]):
         element.extract()
 
-    # 3. Достаем текст
+    # 3. Достаем текст. Границы блоков помечаем, чтобы сохранить абзацы:
+    #    по ним reducer.py выбирает содержательные блоки, а не режет сплошную строку
+    for element in soup.find_all(BLOCK_TAGS):
+        element.append(PARAGRAPH_MARK)
     text = soup.get_text(separator=" ")
     
-    # 4. Чистим пробелы
-    text = re.sub(r'\s+', ' ', text).strip()
+    # 4. Чистим пробелы внутри абзацев, абзацы разделяем пустой строкой
+    paragraphs = (re.sub(r'\s+', ' ', p).strip() for p in text.split(PARAGRAPH_MARK))
+    text = "\n\n".join(p for p in paragraphs if p)
     
-    # 5. Удаляем фразы-паразиты
-    stop_phrases = ["Unsubscribe", "Manage your preferences", "View in browser", "Посмотреть в браузере", "Отписаться"]
-    for phrase in stop_phrases:
-        if phrase in text:
-            # Можно просто вырезать фразу, или обрезать текст после нее
-            pass 
-
-    return text
+    # 5. Удаляем фразы-паразиты и отрезаем футер (плюс выученные маркеры отправителя)
+    return get_trimmer().trim(text, sender)
 
 def connect_to_mail():
     try:
-        mail = imaplib.IMAP4_SSL(IMAP_SERVER)
+        mail = imaplib.IMAP4_SSL(IMAP_SERVER, timeout=deadline.current().timeout(deadline.IMAP_TIMEOUT))
         mail.login(EMAIL_USER, EMAIL_PASS)
         return mail
     except Exception as e:
         print(f"❌ Ошибка подключения к IMAP: {e}")
         exit()
 
-def fetch_emails():
+def fetch_emails(limit=None, dry_run=False):
+    """
+    Забирает письма подписок из IMAP в raw_emails.
+    limit — максимум сохраненных писем, dry_run — только показать, что было бы сохранено.
+    """
     # 1. Получаем список от кого искать
     allowed_senders = get_allowed_senders()
     if not allowed_senders:
@@ -86,8 +99,12 @@ def fetch_emails():
     mail.select("inbox")
     
     found_count = 0
+    budget = deadline.current()
 
     for sender_email in allowed_senders:
+        if not budget.allows(FETCH_RESERVE_SECONDS):
+            print(f"⏳ Бюджет запуска на исходе ({budget}), остальные отправители — в следующий раз")
+            break
         print(f"🔎 Ищем письма от: {sender_email}...")
         try:
             # Поиск писем от конкретного отправителя с даты X
@@ -105,8 +122,13 @@ def fetch_emails():
         print(f"   Найдено писем: {len(email_ids)}")
 
         for email_id in email_ids:
+            if limit is not None and found_count >= limit:
+                break
+            if not budget.allows(FETCH_RESERVE_SECONDS):
+                break
             try:
                 # Скачиваем письмо
+                mail.sock.settimeout(budget.timeout(deadline.IMAP_TIMEOUT))
                 status, msg_data = mail.fetch(email_id, "(RFC822)")
                 for response_part in msg_data:
                     if isinstance(response_part, tuple):
@@ -156,7 +178,9 @@ def fetch_emails():
                             except: pass
 
                         # --- Очистка и подготовка ---
-                        clean_text = aggressive_clean_html(body_content)
+                        clean_text, trim_stats = aggressive_clean_html(body_content, sender_email)
+                        if trim_stats and trim_stats['removed_chars']:
+                            print(f"   ✂️ Шаблонный текст: -{trim_stats['removed_chars']} симв. ({trim_stats['cutoff'] or 'фразы'})")
                         
                         if len(clean_text) > 20000:
                             clean_text = clean_text[:20000] + "..."
@@ -164,28 +188,38 @@ def fetch_emails():
                         if not clean_text: 
                             continue
 
+                        found_count += 1
+                        if dry_run:
+                            print(f"   🧪 [dry-run] {subject[:40]}... ({len(clean_text)} симв.)")
+                            continue
+
                         # --- Сохранение в Supabase ---
                         data = {
                             "sender": real_sender, # Или sender_email из цикла, если хотим точно
                             "recipient": EMAIL_USER,
                             "subject": subject,
                             "body_plain": clean_text,
-                            "body_html": html_content if html_content else body_content,
-                            "processed": False 
+                            "processed": False,
+                            **store_html(html_content if html_content else body_content) # HTML — сжатым
                         }
                         
                         # Вставляем данные. Используем insert.
                         # Если хотим избежать дубликатов, в будущем можно проверять по связке (sender + subject + date)
                         supabase.table("raw_emails").insert(data).execute()
-                        found_count += 1
                         print(f"   ✅ Сохранено: {subject[:40]}...")
 
             except Exception as e:
                 print(f"   ❌ Ошибка обработки письма ID {email_id}: {e}")
 
+        if limit is not None and found_count >= limit:
+            break
+
     mail.close()
     mail.logout()
+    if not dry_run:
+        get_trimmer().save()
     print(f"\n🏁 Готово! Всего сохранено в базу: {found_count} писем.")
+    return found_count
 
 if __name__ == "__main__":
     fetch_emails()
\ No newline at end of file
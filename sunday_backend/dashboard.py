@@ -1,8 +1,9 @@
 import streamlit as st
 from supabase import create_client, Client
 import os
-import json
 from dotenv import load_dotenv
+from render import get_rendered
+from digest_index import list_digest_index, index_label, fetch_digest
 
 # --- 1. PAGE CONFIG ---
 st.set_page_config(page_title="Sunday AI | Dashboard", page_icon="☀️", layout="wide")
@@ -13,6 +14,10 @@ st.markdown("""
     <style>
     .digest-card { padding: 1.2rem; border-radius: 0.8rem; border: 1px solid rgba(128,128,128,0.2); margin-bottom: 1rem; background-color: rgba(128,128,128,0.05); }
     .big-picture-box { padding: 1rem; border-left: 4px solid #2e86de; background-color: rgba(46,134,222,0.1); border-radius: 0.4rem; margin-bottom: 1.5rem; }
+    .insight-card { padding: 1.2rem; border-radius: 0.8rem; border: 1px solid rgba(128,128,128,0.2); margin-bottom: 1rem; background-color: rgba(128,128,128,0.05); }
+    .insight-title { color: #2e86de; font-weight: 700; margin: 0; }
+    .insight-body { margin-top: 10px; }
+    .action-item { padding: 0.6rem 0.8rem; border-radius: 0.4rem; margin-bottom: 0.5rem; background-color: rgba(219,39,119,0.08); }
     </style>
 """, unsafe_allow_html=True)
 
@@ -29,6 +34,19 @@ def init_connection():
 
 supabase = init_connection()
 
+# Страницы индекса кэшируются по курсору: rerun и "Load older briefs" догружают
+# только новую страницу, а не все пролистанные заново (как в sunday_dashboard/db.py)
+INDEX_TTL = 300
+DIGEST_TTL = 600
+
+@st.cache_data(ttl=INDEX_TTL, show_spinner=False)
+def fetch_index_page(user_id, cursor):
+    return list_digest_index(supabase, user_id, cursor)
+
+@st.cache_data(ttl=DIGEST_TTL, show_spinner=False)
+def fetch_digest_cached(digest_id):
+    return fetch_digest(supabase, digest_id)
+
 # --- 4. AUTH HELPERS ---
 def sign_in(email, password):
     try:
@@ -133,30 +151,27 @@ def main():
     # PAGE: BRIEFS
     elif page == "📊 My Briefs":
         st.header("Your Strategic Reports")
-        res = supabase.table("digests").select("*").eq("user_id", user_id).order("created_at", desc=True).execute()
+        # Индекс без structured_content; курсоры страниц копятся в session_state —
+        # по ключу пользователя, чтобы после смены аккаунта не листать чужие страницы
+        cursors = st.session_state.setdefault(f'brief_cursors:{user_id}', [None])
+        index, next_cursor = [], None
+        for cursor in cursors:
+            page_rows, next_cursor = fetch_index_page(user_id, cursor)
+            index.extend(page_rows)
         
-        if not res.data:
+        if not index:
             st.info("Your first brief will appear here soon.")
         else:
-            for d in res.data:
-                date_label = d['created_at'][:10]
-                with st.expander(f"📦 Brief from {date_label}: {d.get('subject', 'Weekly Update')}"):
-                    content = d.get('structured_content', {})
-                    if isinstance(content, str): content = json.loads(content)
-
-                    st.markdown(f"""
-                        <div class="big-picture-box">
-                            <strong>🌍 The Big Picture:</strong><br>{content.get('big_picture', 'N/A')}
-                        </div>
-                    """, unsafe_allow_html=True)
-                    
-                    for trend in content.get('trends', []):
-                        st.markdown(f"""
-                            <div class="digest-card">
-                                <h4 style="color:#2e86de; margin:0;">{trend.get('title', 'Trend')}</h4>
-                                <p style="margin-top:10px;">{trend.get('insight', '')}</p>
-                            </div>
-                        """, unsafe_allow_html=True)
+            options = {index_label(d): d['id'] for d in index}
+            sel = st.selectbox("📦 Brief", list(options.keys()))
+            if next_cursor and st.button("Load older briefs"):
+                cursors.append(next_cursor)
+                st.rerun()
+
+            # Полный дайджест грузим только для выбранного
+            d = fetch_digest_cached(options[sel])
+            if d:
+                st.markdown(get_rendered(d)['dashboard_html'], unsafe_allow_html=True)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
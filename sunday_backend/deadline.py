@@ -0,0 +1,72 @@
+import math
+import os
+import threading
+import time
+
+# --- БЮДЖЕТ ВРЕМЕНИ ЗАПУСКА ---
+# У каждого запуска (cron-шард, scheduler, outbox, ingest) есть слот. RUN_BUDGET_SECONDS
+# (или start(seconds)) задает его на весь процесс, а каждый внешний вызов берет таймаут
+# через timeout(cap): не больше своего потолка и не дольше остатка бюджета.
+# Планировщики спрашивают allows(reserve) перед новой единицей работы (пользователь,
+# письмо, пачка outbox) и, если времени мало, оставляют ее следующему запуску —
+# чекпоинты (migrations/011, 012) делают это безопасным.
+# Без RUN_BUDGET_SECONDS бюджет бесконечен, но потолки на вызовы действуют всегда:
+# зависший запрос больше не держит процесс до убийства.
+
+LLM_TIMEOUT = 120   # Gemini generate_content
+SMTP_TIMEOUT = 30
+IMAP_TIMEOUT = 60
+HTTP_TIMEOUT = 15   # Telegram Bot API и прочий HTTP
+DB_TIMEOUT = 30     # Supabase (PostgREST)
+MIN_CALL_SECONDS = 3  # если осталось меньше — вызов не начинаем
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+class Deadline:
+    def __init__(self, seconds=None):
+        self.seconds = seconds
+        self.expires_at = None if seconds is None else time.monotonic() + seconds
+
+    def remaining(self):
+        if self.expires_at is None:
+            return math.inf
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def allows(self, reserve):
+        """Хватит ли остатка на работу, которая может занять до reserve секунд"""
+        return self.remaining() >= reserve
+
+    def timeout(self, cap):
+        """Таймаут одного внешнего вызова; DeadlineExceeded, если бюджет уже исчерпан"""
+        left = self.remaining()
+        if left < MIN_CALL_SECONDS:
+            raise DeadlineExceeded(f"run budget exhausted ({left:.1f}s left)")
+        return min(cap, left)
+
+    def __str__(self):
+        if self.expires_at is None:
+            return "unlimited"
+        return f"{self.remaining():.0f}s of {self.seconds:.0f}s left"
+
+_current = None
+_lock = threading.Lock()
+
+def start(seconds=None):
+    """Бюджет процесса. seconds=None — из RUN_BUDGET_SECONDS (пусто — без лимита)."""
+    global _current
+    if seconds is None:
+        env = os.environ.get("RUN_BUDGET_SECONDS")
+        seconds = float(env) if env else None
+    with _lock:
+        _current = Deadline(seconds)
+    return _current
+
+def current():
+    if _current is None:
+        start()
+    return _current
+
+def llm_http_options(cap=LLM_TIMEOUT):
+    """http_options для google-genai: таймаут запроса в миллисекундах"""
+    return {"timeout": int(current().timeout(cap) * 1000)}
@@ -0,0 +1,147 @@
+import os
+import smtplib
+import socket
+import threading
+import time
+
+import deadline
+
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+
+# --- ТРАНСПОРТ ДОСТАВКИ ---
+# Переиспользуемые соединения для массовой рассылки: один HTTP-пул на Telegram
+# под глобальным лимитом, и по одному SMTP-соединению на поток вместо connect/login на письмо.
+
+# Переменные окружения читаются в конструкторах: модуль можно импортировать до load_dotenv().
+# requests тоже импортируется в конструкторе — pipeline/outbox грузятся без него.
+TG_RATE_PER_SEC = 30 # лимит Bot API на бота
+
+def fanout_workers():
+    return int(os.environ.get("FANOUT_WORKERS", 8))
+
+def build_email_message(from_header, to_email, subject, html_body):
+    """MIME-строка HTML-письма"""
+    msg = MIMEMultipart()
+    msg['From'] = from_header
+    msg['To'] = to_email
+    msg['Subject'] = subject
+    msg.attach(MIMEText(html_body, 'html'))
+    return msg.as_string()
+
+class RateLimiter:
+    """Token bucket: не больше rate операций в секунду на все потоки процесса"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class TelegramSender:
+    """Bot API через общую requests.Session (keep-alive) под глобальным лимитом"""
+
+    def __init__(self, token=None, rate=None, pool_size=None):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.token = token or os.environ.get("TELEGRAM_BOT_TOKEN")
+        self.limiter = RateLimiter(rate or float(os.environ.get("TELEGRAM_RATE_PER_SEC", TG_RATE_PER_SEC)))
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size or fanout_workers()))
+
+    def send(self, chat_id, text, parse_mode="Markdown", retries=2):
+        if not self.token:
+            print("⚠️ TG Error: TELEGRAM_BOT_TOKEN not found in .env")
+            return False
+        if not chat_id:
+            print("⚠️ TG Error: User has no Chat ID")
+            return False
+
+        url = f"https://api.telegram.org/bot{self.token}/sendMessage"
+        payload = {"chat_id": chat_id, "text": text, "parse_mode": parse_mode}
+        for _ in range(retries + 1):
+            self.limiter.acquire()
+            try:
+                r = self.session.post(url, json=payload, timeout=deadline.current().timeout(deadline.HTTP_TIMEOUT))
+                if r.status_code == 200:
+                    print(f"✈️ Telegram sent to {chat_id}")
+                    return True
+                if r.status_code == 429:
+                    # Telegram сам говорит, сколько подождать
+                    retry_after = r.json().get("parameters", {}).get("retry_after", 1)
+                    time.sleep(retry_after)
+                    continue
+                print(f"❌ Telegram Error: {r.text}")
+                return False
+            except Exception as e:
+                print(f"❌ Telegram Exception: {e}")
+                return False
+        return False
+
+class SMTPPool:
+    """
+    По одному залогиненному SMTP-соединению на поток, переиспользуется между письмами.
+    Оборванное соединение переподключается один раз.
+    """
+
+    def __init__(self, server=None, port=None, user=None, password=None):
+        self.server = server or os.environ.get("SMTP_SERVER", "smtp.gmail.com")
+        self.port = port or int(os.environ.get("SMTP_PORT", 587))
+        self.user = user or os.environ.get("EMAIL_USER")
+        self.password = password or os.environ.get("EMAIL_PASS")
+        self._local = threading.local()
+        self._all = []
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        conn = smtplib.SMTP(self.server, self.port, timeout=deadline.current().timeout(deadline.SMTP_TIMEOUT))
+        conn.starttls()
+        conn.login(self.user, self.password)
+        self._local.conn = conn
+        with self._lock:
+            self._all.append(conn)
+        return conn
+
+    def sendmail(self, from_addr, to_addr, message):
+        # Соединение живет между письмами: таймаут пересчитываем под остаток бюджета
+        timeout = deadline.current().timeout(deadline.SMTP_TIMEOUT)
+        conn = getattr(self._local, "conn", None) or self._connect()
+        try:
+            if conn.sock:
+                conn.sock.settimeout(timeout)
+            conn.sendmail(from_addr, to_addr, message)
+        except (smtplib.SMTPServerDisconnected, ConnectionError, socket.timeout):
+            # Сервер закрыл простаивающее соединение — закрываем старое и переподключаемся.
+            # Прочие SMTPException (получатель отклонен, ошибка DATA) — не обрыв: повтор их не исправит
+            self._discard(conn)
+            self._connect().sendmail(from_addr, to_addr, message)
+
+    def _discard(self, conn):
+        self._local.conn = None
+        with self._lock:
+            if conn in self._all:
+                self._all.remove(conn)
+        try: conn.close()
+        except Exception: pass
+
+    def close(self):
+        with self._lock:
+            conns, self._all = self._all, []
+        for conn in conns:
+            try: conn.quit()
+            except Exception: pass
+        self._local = threading.local()
@@ -0,0 +1,53 @@
+import re
+
+# --- ЛЕГКИЙ ИНДЕКС ДАЙДЖЕСТОВ ---
+# Для списка/селектбокса не нужен structured_content: берем только id, период и заголовок,
+# страницами по ключу (period_start, created_at). Полный дайджест грузится по id при выборе.
+
+# headline — начало summary_text (migrations/015), а не весь текст брифа
+INDEX_COLUMNS = "id, period_start, created_at, headline"
+PAGE_SIZE = 20
+HEADLINE_LEN = 80
+
+def headline(row):
+    """Первое предложение big picture, обрезанное до HEADLINE_LEN (из headline или summary_text)"""
+    text = re.sub(r"\s+", " ", row.get('headline') or row.get('summary_text') or "").strip()
+    if not text:
+        return "Weekly Update"
+    first = re.split(r"(?<=[.!?])\s", text, maxsplit=1)[0]
+    return first if len(first) <= HEADLINE_LEN else first[:HEADLINE_LEN - 1].rstrip() + "…"
+
+def index_label(row):
+    """'2025-01-05 · Заголовок · #1a2b' для селектбокса (id — чтобы метки не совпадали)"""
+    date = (row.get('period_start') or row.get('created_at') or "")[:10]
+    return f"{date} · {headline(row)} · #{str(row.get('id', '0'))[:4]}"
+
+def list_digest_index(supabase, user_id, cursor=None, limit=PAGE_SIZE):
+    """
+    Одна страница индекса, от новых к старым.
+    cursor — (period_start, created_at) последней строки предыдущей страницы.
+    Возвращает (rows, next_cursor); next_cursor=None, если страниц больше нет.
+    """
+    query = supabase.table("digests").select(INDEX_COLUMNS).eq("user_id", user_id)
+    if cursor:
+        period_start, created_at = cursor
+        query = query.or_(
+            f'period_start.lt."{period_start}",'
+            f'and(period_start.eq."{period_start}",created_at.lt."{created_at}")'
+        )
+    res = query.order("period_start", desc=True) \
+        .order("created_at", desc=True) \
+        .limit(limit + 1) \
+        .execute()
+
+    rows = res.data or []
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, (last['period_start'], last['created_at'])
+
+def fetch_digest(supabase, digest_id):
+    """Полная строка дайджеста (structured_content, rendered) — только для выбранного"""
+    res = supabase.table("digests").select("*").eq("id", digest_id).execute()
+    return res.data[0] if res.data else None
@@ -0,0 +1,222 @@
+import os
+import socket
+import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone
+
+# --- ОЧЕРЕДЬ raw_emails С ЗАХВАТОМ (CLAIM / LEASE) ---
+# pending -> processing (claimed_by + lease_expires_at) -> summarized
+#                                                       -> pending (fail, попытки остались;
+#                                                                   release — бюджет запуска кончился)
+#                                                       -> dead    (MAX_ATTEMPTS неудач)
+# Письмо, чей воркер умер, возвращается в работу после истечения lease.
+# Так несколько процессов-суммаризаторов (cron + "Generate Now" + воркеры)
+# не суммаризируют одно письмо дважды.
+
+LEASE_SECONDS = int(os.environ.get("EMAIL_QUEUE_LEASE_SECONDS", 300))
+MAX_ATTEMPTS = int(os.environ.get("EMAIL_QUEUE_MAX_ATTEMPTS", 3))
+# То же, что возвращает RPC claim_raw_emails (migrations/008): без body_html / body_html_ref
+CLAIM_COLUMNS = "id, user_id, sender, subject, body_plain, attempts"
+
+def make_worker_id(suffix=None):
+    """host:pid[:suffix] — кто держит письмо (видно в raw_emails.claimed_by)"""
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    return f"{worker}:{suffix}" if suffix is not None else worker
+
+def _now():
+    return datetime.now(timezone.utc)
+
+class SupabaseEmailQueue:
+    """
+    Очередь поверх raw_emails в Postgres. Захват — RPC claim_raw_emails
+    (FOR UPDATE SKIP LOCKED, см. migrations/004_raw_emails_queue.sql).
+    """
+
+    def __init__(self, supabase, lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS):
+        self.supabase = supabase
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+    def claim(self, worker_id, limit=5, user_id=None):
+        res = self.supabase.rpc("claim_raw_emails", {
+            "p_worker": worker_id,
+            "p_limit": limit,
+            "p_lease_seconds": self.lease_seconds,
+            "p_max_attempts": self.max_attempts,
+            "p_user_id": user_id,
+        }).execute()
+        return res.data or []
+
+    def pending_count(self, user_id=None):
+        query = self.supabase.table("raw_emails").select("id", count="exact") \
+            .in_("processing_status", ["pending", "processing"])
+        if user_id:
+            query = query.eq("user_id", user_id)
+        return query.limit(1).execute().count or 0
+
+    def heartbeat(self, email_ids, worker_id):
+        """Продлевает lease еще не обработанных писем воркера"""
+        if not email_ids:
+            return
+        self.supabase.table("raw_emails") \
+            .update({"lease_expires_at": (_now() + timedelta(seconds=self.lease_seconds)).isoformat()}) \
+            .in_("id", list(email_ids)) \
+            .eq("claimed_by", worker_id) \
+            .execute()
+
+    def ack(self, email_id, worker_id):
+        self.supabase.table("raw_emails") \
+            .update({"processing_status": "summarized", "claimed_by": None, "lease_expires_at": None, "last_error": None}) \
+            .eq("id", email_id) \
+            .eq("claimed_by", worker_id) \
+            .execute()
+
+    def fail(self, email, worker_id, error):
+        """Возвращает письмо в очередь или отправляет в dead-letter после MAX_ATTEMPTS"""
+        status = "dead" if (email.get('attempts') or 0) >= self.max_attempts else "pending"
+        self.supabase.table("raw_emails") \
+            .update({"processing_status": status, "claimed_by": None, "lease_expires_at": None, "last_error": str(error)[:500]}) \
+            .eq("id", email['id']) \
+            .eq("claimed_by", worker_id) \
+            .execute()
+        return status
+
+    def release(self, email_ids, worker_id):
+        """Возвращает захваченные, но не начатые письма в очередь без траты попытки (migrations/012)"""
+        if not email_ids:
+            return
+        self.supabase.rpc("release_raw_emails", {"p_ids": list(email_ids), "p_worker": worker_id}).execute()
+
+class SqliteEmailQueue:
+    """
+    Локальная замена для разработки и прогонов без Postgres: тот же интерфейс,
+    атомарность захвата обеспечивает BEGIN IMMEDIATE (блокировка записи на всю БД).
+    """
+
+    SCHEMA = """
+        create table if not exists raw_emails (
+            id integer primary key autoincrement,
+            user_id text,
+            sender text,
+            subject text,
+            body_plain text,
+            processing_status text not null default 'pending',
+            claimed_by text,
+            lease_expires_at text,
+            attempts integer not null default 0,
+            last_error text,
+            created_at text not null default (strftime('%Y-%m-%dT%H:%M:%f', 'now'))
+        )
+    """
+
+    def __init__(self, path, lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.execute(self.SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, email):
+        cur = self._conn().execute(
+            "insert into raw_emails (user_id, sender, subject, body_plain) values (?, ?, ?, ?)",
+            (email.get('user_id'), email.get('sender'), email.get('subject'), email.get('body_plain')),
+        )
+        return cur.lastrowid
+
+    def claim(self, worker_id, limit=5, user_id=None):
+        now = _now().isoformat()
+        lease = (_now() + timedelta(seconds=self.lease_seconds)).isoformat()
+        conn = self._conn()
+        conn.execute("begin immediate")
+        try:
+            # Зависшие (lease истек) письма, исчерпавшие попытки — в dead-letter
+            conn.execute(
+                "update raw_emails set processing_status = 'dead', claimed_by = null "
+                "where processing_status = 'processing' and lease_expires_at < ? and attempts >= ?",
+                (now, self.max_attempts),
+            )
+            rows = conn.execute(
+                "select id from raw_emails "
+                "where (processing_status = 'pending' or (processing_status = 'processing' and lease_expires_at < ?)) "
+                "and (? is null or user_id = ?) "
+                "order by created_at limit ?",
+                (now, user_id, user_id, limit),
+            ).fetchall()
+            ids = [r['id'] for r in rows]
+            if ids:
+                marks = ",".join("?" * len(ids))
+                conn.execute(
+                    f"update raw_emails set processing_status = 'processing', claimed_by = ?, "
+                    f"lease_expires_at = ?, attempts = attempts + 1 where id in ({marks})",
+                    (worker_id, lease, *ids),
+                )
+            conn.execute("commit")
+        except Exception:
+            conn.execute("rollback")
+            raise
+        if not ids:
+            return []
+        claimed = conn.execute(
+            f"select {CLAIM_COLUMNS} from raw_emails where id in ({marks}) order by created_at", ids
+        )
+        return [dict(r) for r in claimed.fetchall()]
+
+    def pending_count(self, user_id=None):
+        row = self._conn().execute(
+            "select count(*) from raw_emails where processing_status in ('pending', 'processing') "
+            "and (? is null or user_id = ?)",
+            (user_id, user_id),
+        ).fetchone()
+        return row[0]
+
+    def heartbeat(self, email_ids, worker_id):
+        if not email_ids:
+            return
+        ids = list(email_ids)
+        lease = (_now() + timedelta(seconds=self.lease_seconds)).isoformat()
+        self._conn().execute(
+            f"update raw_emails set lease_expires_at = ? where claimed_by = ? and id in ({','.join('?' * len(ids))})",
+            (lease, worker_id, *ids),
+        )
+
+    def ack(self, email_id, worker_id):
+        self._conn().execute(
+            "update raw_emails set processing_status = 'summarized', claimed_by = null, "
+            "lease_expires_at = null, last_error = null where id = ? and claimed_by = ?",
+            (email_id, worker_id),
+        )
+
+    def fail(self, email, worker_id, error):
+        status = "dead" if (email.get('attempts') or 0) >= self.max_attempts else "pending"
+        self._conn().execute(
+            "update raw_emails set processing_status = ?, claimed_by = null, lease_expires_at = null, "
+            "last_error = ? where id = ? and claimed_by = ?",
+            (status, str(error)[:500], email['id'], worker_id),
+        )
+        return status
+
+    def release(self, email_ids, worker_id):
+        if not email_ids:
+            return
+        ids = list(email_ids)
+        self._conn().execute(
+            "update raw_emails set processing_status = 'pending', claimed_by = null, lease_expires_at = null, "
+            f"attempts = max(attempts - 1, 0) where claimed_by = ? and id in ({','.join('?' * len(ids))})",
+            (worker_id, *ids),
+        )
+
+def get_email_queue(supabase):
+    """EMAIL_QUEUE_SQLITE=path/to/queue.db — локальная очередь вместо Postgres"""
+    sqlite_path = os.environ.get("EMAIL_QUEUE_SQLITE")
+    if sqlite_path:
+        return SqliteEmailQueue(sqlite_path)
+    return SupabaseEmailQueue(supabase)
@@ -0,0 +1,113 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# --- ХЕДЖИРОВАНИЕ LLM-ЗАПРОСОВ ---
+# Хвост задержки Gemini в разы длиннее медианы, и одно зависшее письмо держит весь
+# дайджест. Hedger запускает вызов и, если тот не ответил за адаптивный порог
+# (перцентиль последних задержек), шлет дубль — берется тот ответ, что придет первым.
+# Дублей не больше max_rate от всех вызовов, поэтому лишняя нагрузка ограничена.
+# Проигравший запрос не отменить (HTTP уже в полете): его ответ просто выбрасывается,
+# но задержка идет в окно — иначе порог считался бы только по быстрым ответам.
+#
+# Включается LLM_HEDGING=1; LLM_HEDGE_PERCENTILE (95), LLM_HEDGE_MAX_RATE (0.05).
+
+PERCENTILE = 95
+MAX_RATE = 0.05
+WINDOW = 200          # последних задержек для порога
+MIN_SAMPLES = 20      # пока меньше — не хеджируем: порог еще ничего не значит
+POOL_SIZE = 32
+
+class Hedger:
+    def __init__(self, percentile=PERCENTILE, max_rate=MAX_RATE, window=WINDOW,
+                 min_samples=MIN_SAMPLES, workers=POOL_SIZE):
+        self.percentile = percentile
+        self.max_rate = max_rate
+        self.min_samples = min_samples
+        self.latencies = deque(maxlen=window)
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="hedge")
+        self.lock = threading.Lock()
+        self.stats = {"calls": 0, "hedged": 0, "hedge_wins": 0, "skipped": 0, "errors": 0}
+
+    def threshold(self):
+        """Порог в секундах или None, пока окно не набрано"""
+        with self.lock:
+            if len(self.latencies) < self.min_samples:
+                return None
+            ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))]
+
+    def _observe(self, started):
+        def done(future):
+            if future.exception() is None:
+                with self.lock:
+                    self.latencies.append(time.monotonic() - started)
+        return done
+
+    def _submit(self, fn, args, kwargs):
+        started = time.monotonic()
+        future = self.pool.submit(fn, *args, **kwargs)
+        future.add_done_callback(self._observe(started))
+        return future
+
+    def _may_hedge(self):
+        with self.lock:
+            # +1: хедж, который мы собираемся отправить
+            if self.stats["hedged"] + 1 > self.max_rate * self.stats["calls"]:
+                self.stats["skipped"] += 1
+                return False
+            self.stats["hedged"] += 1
+            return True
+
+    def call(self, fn, *args, **kwargs):
+        """fn(*args, **kwargs) с хеджем; исключение — только если упали все попытки"""
+        with self.lock:
+            self.stats["calls"] += 1
+        delay = self.threshold()
+        primary = self._submit(fn, args, kwargs)
+        attempts = [primary]
+        done, _ = wait(attempts, timeout=delay)
+        if not done and self._may_hedge():
+            attempts.append(self._submit(fn, args, kwargs))
+
+        pending = set(attempts)
+        while True:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            # Сначала успешный из завершившихся; если первый ответ — ошибка, ждем второй
+            winner = next((f for f in done if f.exception() is None), None)
+            if winner is not None:
+                if winner is not primary:
+                    with self.lock:
+                        self.stats["hedge_wins"] += 1
+                return winner.result()
+            if not pending:
+                with self.lock:
+                    self.stats["errors"] += 1
+                raise next(iter(done)).exception()
+
+    def summary(self):
+        with self.lock:
+            s = dict(self.stats)
+        threshold = self.threshold()
+        win_rate = s["hedge_wins"] / s["hedged"] if s["hedged"] else 0.0
+        return (f"{s['calls']} calls, {s['hedged']} hedged ({s['hedged'] / max(1, s['calls']):.1%}), "
+                f"hedge won {win_rate:.0%}, {s['skipped']} over rate cap, "
+                f"p{self.percentile:g} threshold {'-' if threshold is None else f'{threshold:.1f}s'}")
+
+_hedger = None
+_hedger_lock = threading.Lock()
+
+def get_hedger():
+    """Общий Hedger процесса или None, если LLM_HEDGING не включен"""
+    global _hedger
+    if os.environ.get("LLM_HEDGING", "").lower() not in ("1", "true", "yes"):
+        return None
+    with _hedger_lock:
+        if _hedger is None:
+            _hedger = Hedger(
+                percentile=float(os.environ.get("LLM_HEDGE_PERCENTILE", PERCENTILE)),
+                max_rate=float(os.environ.get("LLM_HEDGE_MAX_RATE", MAX_RATE)),
+            )
+        return _hedger
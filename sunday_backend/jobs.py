@@ -0,0 +1,106 @@
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from pipeline import run_digest
+
+# --- ФОНОВЫЕ ЗАДАЧИ "GENERATE NOW" ---
+# Реестр живет в памяти процесса (Streamlit-сервера), поэтому переживает
+# обновление страницы в браузере: UI находит задачу по user_id и опрашивает прогресс.
+
+MAX_WORKERS = int(os.environ.get("DIGEST_JOB_WORKERS", 2))
+
+ACTIVE_STATUSES = ("queued", "running")
+
+_lock = threading.Lock()
+_jobs = {}         # job_id -> Job
+_user_jobs = {}    # user_id -> job_id последней задачи пользователя
+_executor = None
+
+class Job:
+    def __init__(self, user_id):
+        self.id = str(uuid.uuid4())
+        self.user_id = user_id
+        self.status = "queued"     # queued / running / done / failed
+        self.phase = None          # summarizing / synthesizing / delivering
+        self.progress = {}
+        self.result = None
+        self.error = None
+        self.created_at = datetime.now(timezone.utc).isoformat()
+        self.finished_at = None
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "user_id": self.user_id,
+            "status": self.status,
+            "phase": self.phase,
+            "progress": dict(self.progress),
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="digest-job")
+    return _executor
+
+def _run(job):
+    def progress(phase, **fields):
+        with _lock:
+            job.phase = phase
+            job.progress = fields
+
+    with _lock:
+        job.status = "running"
+    try:
+        # raise_errors: сбой пайплайна — статус failed, а не "недостаточно писем"
+        result = run_digest(job.user_id, progress=progress, raise_errors=True)
+        with _lock:
+            job.result = result
+            job.status = "done"
+    except Exception as e:
+        print(f"❌ Digest job {job.id} failed: {e}")
+        with _lock:
+            job.error = str(e)
+            job.status = "failed"
+    finally:
+        with _lock:
+            job.finished_at = datetime.now(timezone.utc).isoformat()
+
+def submit_digest_job(user_id):
+    """
+    Ставит run_digest в пул и сразу возвращает job_id.
+    Повторные клики того же пользователя склеиваются в уже идущую задачу.
+    """
+    with _lock:
+        current = _jobs.get(_user_jobs.get(user_id))
+        if current and current.status in ACTIVE_STATUSES:
+            return current.id
+
+        job = Job(user_id)
+        _jobs[job.id] = job
+        # Храним только последнюю задачу пользователя
+        if current:
+            _jobs.pop(current.id, None)
+        _user_jobs[user_id] = job.id
+
+    _get_executor().submit(_run, job)
+    return job.id
+
+def get_job(job_id):
+    """Снимок состояния задачи (dict) или None"""
+    with _lock:
+        job = _jobs.get(job_id)
+        return job.to_dict() if job else None
+
+def get_user_job(user_id):
+    """Последняя задача пользователя — чтобы найти ее после обновления страницы"""
+    with _lock:
+        job = _jobs.get(_user_jobs.get(user_id))
+        return job.to_dict() if job else None
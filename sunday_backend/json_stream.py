@@ -0,0 +1,99 @@
+import json
+
+# --- ПОТОКОВЫЙ РАЗБОР БРИФА ---
+# Head Chef отдает JSON кусками (generate_content_stream). BriefStream сканирует
+# их по мере прихода и отдает готовые части брифа, не дожидаясь конца ответа:
+# big_picture — как только строка закрыта, каждый тренд — как только закрыт его объект.
+# Сканер помнит только вложенность и состояние строки, поэтому каждый символ
+# просматривается один раз. Итоговый бриф по-прежнему берется из полного текста.
+
+STREAMED_FIELDS = ("big_picture",)   # строки верхнего уровня
+STREAMED_LISTS = ("trends",)         # массивы объектов верхнего уровня
+
+class BriefStream:
+    def __init__(self, on_piece=None):
+        """on_piece(key, value) — big_picture целиком или очередной элемент trends"""
+        self.on_piece = on_piece
+        self.partial = {}
+        self.text = ""
+        self.pos = 0
+        self.stack = []
+        self.in_string = False
+        self.escape = False
+        self.string_start = None
+        self.expect_key = False
+        self.key = None
+        self.item_start = None
+
+    def feed(self, chunk):
+        """Добавляет кусок ответа; возвращает список готовых (key, value)"""
+        if not chunk:
+            return []
+        self.text += chunk
+        pieces = []
+        text = self.text
+        for i in range(self.pos, len(text)):
+            ch = text[i]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+                    self._string_closed(text, i, pieces)
+                continue
+            if not self.stack:
+                # До корня может быть ```json — пропускаем все до первой {
+                if ch == "{":
+                    self.stack.append("{")
+                    self.expect_key = True
+                continue
+            if ch == '"':
+                self.in_string = True
+                self.string_start = i
+            elif ch in "{[":
+                if ch == "{" and self._in_streamed_list():
+                    self.item_start = i
+                self.stack.append(ch)
+            elif ch in "}]":
+                self.stack.pop()
+                if ch == "}" and self._in_streamed_list() and self.item_start is not None:
+                    self._emit(self.key, text[self.item_start:i + 1], pieces)
+                    self.item_start = None
+            elif len(self.stack) == 1:
+                if ch == ":":
+                    self.expect_key = False
+                elif ch == ",":
+                    self.expect_key = True
+        self.pos = len(text)
+        return pieces
+
+    def _in_streamed_list(self):
+        return len(self.stack) == 2 and self.stack[1] == "[" and self.key in STREAMED_LISTS
+
+    def _string_closed(self, text, i, pieces):
+        if len(self.stack) != 1:
+            return
+        raw = text[self.string_start:i + 1]
+        if self.expect_key:
+            self.key = json.loads(raw)
+        elif self.key in STREAMED_FIELDS:
+            self._emit(self.key, raw, pieces)
+
+    def _emit(self, key, raw, pieces):
+        try:
+            value = json.loads(raw)
+        except ValueError:
+            return
+        if key in STREAMED_LISTS:
+            self.partial.setdefault(key, []).append(value)
+        else:
+            self.partial[key] = value
+        pieces.append((key, value))
+        if self.on_piece:
+            self.on_piece(key, value)
+
+    def snapshot(self):
+        """Копия того, что уже готово: безопасно отдавать в другой поток"""
+        return {k: list(v) if isinstance(v, list) else v for k, v in self.partial.items()}
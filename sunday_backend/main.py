@@ -1,5 +1,8 @@
 import os
 import re
+import json
+import zlib
+import hashlib
 import email
 from email.policy import default
 from dotenv import load_dotenv
@@ -7,12 +10,17 @@ from dotenv import load_dotenv
 # 1. Загружаем переменные окружения
 load_dotenv()
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
 from typing import Optional
 from supabase import create_client
 from bs4 import BeautifulSoup # Для создания текста из HTML, если plain text отсутствует
+from body_store import store_html
+from repository import query, Profile
+from webhook_capture import capture
+from sender_index import get_sender_index
 
 app = FastAPI()
 
@@ -93,6 +101,136 @@ def parse_raw_email(raw_content):
     # Очистка от пробелов
     return (body_plain or "").strip(), (body_html or "").strip()
 
+def build_email_row(payload, user_id):
+    """EmailPayload -> строка raw_emails: MIME разобран, HTML сжат (body_store.py)"""
+    body_plain, body_html = parse_raw_email(payload.raw_email)
+
+    # Fallback: Если plain text пустой, вытаскиваем текст из HTML (ИИ нужен текст)
+    if not body_plain and body_html:
+        try:
+            body_plain = BeautifulSoup(body_html, "html.parser").get_text(separator="\n")
+        except Exception as e:
+            print(f"BS4 Error: {e}")
+            body_plain = body_html # На крайний случай сохраняем как есть
+
+    return {
+        "user_id": user_id,
+        "sender": payload.sender,
+        "subject": payload.subject,
+        "body_plain": body_plain,
+        "received_at": payload.timestamp,
+        "processing_status": "pending", # <-- Важно для Pipeline!
+        # Естественный ключ (migrations/014): повторная доставка того же письма не дублирует строку
+        "content_hash": hashlib.sha256(payload.raw_email.encode("utf-8", "surrogatepass")).hexdigest(),
+        **store_html(body_html)
+    }
+
+# --- BATCH: СЖАТЫЕ ПАЧКИ ПИСЕМ ---
+# Worker копит письма и шлет их одним запросом: gzip/zstd JSON-массив EmailPayload.
+# Ответ — результат по каждому элементу (index, status), поэтому при частичной
+# неудаче Worker переотправляет только элементы со status == "error";
+# success / ignored / invalid повторять не нужно. ignored — нет такого ящика
+# (user_not_found) или пользователь не подписан на отправителя (sender_not_subscribed).
+
+MAX_BATCH_ITEMS = int(os.environ.get("WEBHOOK_MAX_BATCH_ITEMS", 100))
+MAX_BATCH_BYTES = int(os.environ.get("WEBHOOK_MAX_BATCH_BYTES", 64 * 1024 * 1024)) # после распаковки
+
+def gunzip(body, limit):
+    """
+    gzip из нескольких членов (склеенные .gz) целиком, но не больше limit байт на все члены:
+    decompressobj останавливается на конце первого члена, остаток лежит в unused_data.
+    """
+    chunks, size = [], 0
+    while body and size < limit:
+        d = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        try:
+            chunk = d.decompress(body, limit - size)
+        except zlib.error as e:
+            raise HTTPException(status_code=400, detail=f"Invalid gzip body: {e}")
+        chunks.append(chunk)
+        size += len(chunk)
+        if not d.eof:
+            if d.unconsumed_tail:
+                break  # уперлись в limit — decompress_body ответит 413
+            raise HTTPException(status_code=400, detail="Truncated gzip body")
+        body = d.unused_data
+    return b"".join(chunks)
+
+def decompress_body(body, encoding):
+    """Распаковка с потолком размера (защита от zip-бомб)"""
+    encoding = (encoding or "identity").lower()
+    if encoding == "identity":
+        data = body
+    elif encoding == "gzip":
+        data = gunzip(body, MAX_BATCH_BYTES + 1)
+    elif encoding == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise HTTPException(status_code=415, detail="zstd is not supported on this server")
+        with zstandard.ZstdDecompressor().stream_reader(body) as reader:
+            data = reader.read(MAX_BATCH_BYTES + 1)
+    else:
+        raise HTTPException(status_code=415, detail=f"Unsupported Content-Encoding: {encoding}")
+    if len(data) > MAX_BATCH_BYTES:
+        raise HTTPException(status_code=413, detail="Batch too large")
+    return data
+
+def resolve_users(recipients):
+    """
+    inbox_email -> профиль (id, personal_email). Сначала индекс в памяти (sender_index.py),
+    в базу — одним запросом только за промахами; найденное запоминается в индексе.
+    """
+    index = get_sender_index(supabase)
+    users, missing = {}, []
+    for inbox in recipients:
+        profile = index.profile(inbox) if index else None
+        if profile:
+            users[inbox] = profile
+        else:
+            missing.append(inbox)
+    if missing:
+        res = query(supabase, Profile, "id", "inbox_email", "personal_email").in_("inbox_email", missing).execute()
+        for row in res.data or []:
+            users[row['inbox_email']] = row
+            if index:
+                index.remember(row['inbox_email'], row)
+    return users
+
+def sender_allowed(user, sender):
+    """Подписан ли пользователь на отправителя (sender_index.py) — до MIME-разбора"""
+    index = get_sender_index(supabase)
+    return index is None or index.allows(user['id'], sender, user.get('personal_email'))
+
+RAW_EMAIL_KEY = "user_id,content_hash"
+
+def save_rows(rows):
+    """Вставка с on conflict do nothing по (user_id, content_hash): повтор уже сохраненного — no-op"""
+    supabase.table("raw_emails").upsert(rows, on_conflict=RAW_EMAIL_KEY, ignore_duplicates=True).execute()
+
+def insert_rows(rows):
+    """
+    Одна вставка на пачку. Если она падает (одна битая строка валит весь insert),
+    повторяем построчно, чтобы отметить ошибкой только виноватые строки.
+    Bulk мог закоммититься до ошибки (таймаут ответа) — построчный повтор
+    такие строки пропускает по ключу, а не вставляет второй раз.
+    Возвращает {позиция в rows: текст ошибки}.
+    """
+    if not rows:
+        return {}
+    try:
+        save_rows(rows)
+        return {}
+    except Exception as e:
+        print(f"🔥 Bulk insert failed, retrying row by row: {e}")
+    errors = {}
+    for pos, row in enumerate(rows):
+        try:
+            save_rows(row)
+        except Exception as e:
+            errors[pos] = str(e)
+    return errors
+
 # --- РУЧКИ (ENDPOINTS) ---
 
 @app.get("/")
@@ -111,52 +249,101 @@ async def add_to_waitlist(data: WaitlistSchema):
         raise HTTPException(status_code=500, detail=str(e))
 
 # 2. Ручка для CLOUDFLARE (Входящие письма)
+# Ручки вебхука — обычные def: MIME-разбор и синхронный supabase-py блокируют,
+# FastAPI запускает такие ручки в своем пуле потоков, а не в event loop
 @app.post("/webhook/email")
-async def handle_email(payload: EmailPayload):
+def handle_email(payload: EmailPayload):
     print(f"📨 Incoming from Worker. To: {payload.recipient}")
+    capture(payload.model_dump())  # только если задан WEBHOOK_CAPTURE (нагрузочные тесты)
 
     # 1. Чистим адрес получателя (ключевой момент для роутинга)
     clean_recipient = extract_clean_email(payload.recipient)
     
-    # 2. Ищем пользователя по его inbox_email (адрес @sunday.dev)
-    res = supabase.table("profiles").select("*").eq("inbox_email", clean_recipient).execute()
+    # 2. Ищем пользователя по его inbox_email (адрес @sunday.dev): индекс в памяти, при промахе — база
+    user = resolve_users([clean_recipient]).get(clean_recipient)
     
-    if not res.data:
+    if not user:
         print(f"❌ User not found for inbox: {clean_recipient}")
         # Возвращаем 200, чтобы Cloudflare не пытался слать снова (или 404, если хочешь bouncing)
         return {"status": "ignored", "reason": "user_not_found"}
     
-    user = res.data[0]
     user_id = user['id']
     print(f"✅ User identified: {user_id}")
 
-    # 3. Парсим сырое письмо
-    body_plain, body_html = parse_raw_email(payload.raw_email)
-    
-    # Fallback: Если plain text пустой, вытаскиваем текст из HTML (ИИ нужен текст)
-    if not body_plain and body_html:
-        try:
-            body_plain = BeautifulSoup(body_html, "html.parser").get_text(separator="\n")
-        except Exception as e:
-            print(f"BS4 Error: {e}")
-            body_plain = body_html # На крайний случай сохраняем как есть
+    if not sender_allowed(user, payload.sender):
+        print(f"🚫 Not subscribed to {payload.sender}, dropped")
+        return {"status": "ignored", "reason": "sender_not_subscribed"}
 
-    # 4. Сохраняем в базу (без урезания длины, Postgres справится)
-    email_data = {
-        "user_id": user_id,
-        "sender": payload.sender,
-        "subject": payload.subject,
-        "body_plain": body_plain, 
-        "body_html": body_html,
-        "received_at": payload.timestamp,
-        "processing_status": "pending" # <-- Важно для Pipeline!
-    }
+    # 3. Парсим сырое письмо, 4. сохраняем в базу: текст — как есть, HTML — сжатым
+    email_data = build_email_row(payload, user_id)
     
     try:
-        supabase.table("raw_emails").insert(email_data).execute()
+        save_rows(email_data)
         print("💾 Email saved to DB")
         return {"status": "success"}
     except Exception as e:
         print(f"🔥 DB Error: {e}")
         # Не роняем воркер, просто логируем
-        return {"status": "error", "detail": str(e)}
\ No newline at end of file
+        return {"status": "error", "detail": str(e)}
+
+# 3. Ручка для CLOUDFLARE: пачка писем одним запросом
+@app.post("/webhook/email/batch")
+async def handle_email_batch(request: Request):
+    body = await request.body()
+    # Тело читаем в event loop, а распаковку, разбор и запись в базу — в пуле потоков
+    return await run_in_threadpool(process_batch, body, request.headers.get("content-encoding"))
+
+def process_batch(body, encoding):
+    raw = decompress_body(body, encoding)
+    try:
+        items = json.loads(raw)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Body must be a JSON array of EmailPayload")
+    if not isinstance(items, list):
+        raise HTTPException(status_code=400, detail="Body must be a JSON array of EmailPayload")
+    if len(items) > MAX_BATCH_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_ITEMS} emails per batch")
+
+    print(f"📦 Incoming batch from Worker: {len(items)} emails ({len(raw) / 1000:.0f} KB)")
+    results = [None] * len(items)
+    payloads = {}
+    for i, item in enumerate(items):
+        try:
+            payloads[i] = EmailPayload(**item)
+        except (ValidationError, TypeError) as e:
+            results[i] = {"index": i, "status": "invalid", "detail": str(e)[:300]}
+            continue
+        capture(payloads[i].model_dump())
+
+    try:
+        users = resolve_users({extract_clean_email(p.recipient) for p in payloads.values()})
+    except Exception as e:
+        # Без профилей ничего не сохранить — пусть Worker повторит всю пачку
+        print(f"🔥 DB Error: {e}")
+        raise HTTPException(status_code=503, detail="Profile lookup failed")
+
+    rows, row_index = [], []
+    for i, payload in payloads.items():
+        user = users.get(extract_clean_email(payload.recipient))
+        if not user:
+            results[i] = {"index": i, "status": "ignored", "reason": "user_not_found"}
+            continue
+        if not sender_allowed(user, payload.sender):
+            results[i] = {"index": i, "status": "ignored", "reason": "sender_not_subscribed"}
+            continue
+        try:
+            rows.append(build_email_row(payload, user['id']))
+            row_index.append(i)
+        except Exception as e:
+            results[i] = {"index": i, "status": "invalid", "detail": f"parse error: {e}"[:300]}
+
+    errors = insert_rows(rows)
+    for pos, i in enumerate(row_index):
+        if pos in errors:
+            results[i] = {"index": i, "status": "error", "detail": errors[pos]}
+        else:
+            results[i] = {"index": i, "status": "success"}
+
+    saved = len(rows) - len(errors)
+    print(f"💾 Batch saved: {saved}/{len(items)} emails")
+    return {"status": "success" if not errors else "partial", "saved": saved, "results": results}
\ No newline at end of file
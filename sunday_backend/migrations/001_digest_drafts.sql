@@ -0,0 +1,8 @@
+-- Черновик брифа на пользователя: обновляется инкрементально (pipeline.refresh_draft)
+-- и финализируется в digests в digest_time (pipeline.run_digest(..., incremental=True)).
+create table if not exists digest_drafts (
+    user_id uuid primary key references profiles(id) on delete cascade,
+    structured_content jsonb not null,
+    summary_ids jsonb not null default '[]'::jsonb,
+    updated_at timestamptz not null default now()
+);
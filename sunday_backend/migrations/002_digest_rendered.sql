@@ -0,0 +1,3 @@
+-- Готовые артефакты брифа (render.render_digest): {version, email_html, dashboard_html, text}.
+-- Старые строки дорендериваются командой: python render.py
+alter table digests add column if not exists rendered jsonb;
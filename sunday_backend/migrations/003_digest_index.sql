@@ -0,0 +1,8 @@
+-- Keyset-пагинация индекса дайджестов (digest_index.list_digest_index):
+-- ORDER BY period_start DESC, created_at DESC требует непустой period_start.
+update digests set period_start = created_at where period_start is null;
+alter table digests alter column period_start set default now();
+alter table digests alter column period_start set not null;
+
+create index if not exists digests_user_period_idx
+    on digests (user_id, period_start desc, created_at desc);
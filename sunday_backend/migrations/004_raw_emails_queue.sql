@@ -0,0 +1,50 @@
+-- raw_emails как очередь с захватом (email_queue.SupabaseEmailQueue).
+alter table raw_emails add column if not exists claimed_by text;
+alter table raw_emails add column if not exists lease_expires_at timestamptz;
+alter table raw_emails add column if not exists attempts int not null default 0;
+alter table raw_emails add column if not exists last_error text;
+
+update raw_emails set processing_status = 'pending' where processing_status is null;
+alter table raw_emails alter column processing_status set default 'pending';
+
+create index if not exists raw_emails_queue_idx
+    on raw_emails (processing_status, lease_expires_at)
+    where processing_status in ('pending', 'processing');
+
+-- Атомарный захват пачки писем: конкурирующие воркеры пропускают
+-- уже заблокированные строки (SKIP LOCKED) и никогда не берут одно письмо дважды.
+create or replace function claim_raw_emails(
+    p_worker text,
+    p_limit int default 5,
+    p_lease_seconds int default 300,
+    p_max_attempts int default 3,
+    p_user_id uuid default null
+) returns setof raw_emails
+language plpgsql
+as $$
+begin
+    -- Зависшие письма (воркер умер), исчерпавшие попытки — в dead-letter
+    update raw_emails
+       set processing_status = 'dead', claimed_by = null
+     where processing_status = 'processing'
+       and lease_expires_at < now()
+       and attempts >= p_max_attempts;
+
+    return query
+    update raw_emails r
+       set processing_status = 'processing',
+           claimed_by = p_worker,
+           lease_expires_at = now() + make_interval(secs => p_lease_seconds),
+           attempts = r.attempts + 1
+     where r.id in (
+        select q.id from raw_emails q
+         where (q.processing_status = 'pending'
+                or (q.processing_status = 'processing' and q.lease_expires_at < now()))
+           and (p_user_id is null or q.user_id = p_user_id)
+         order by q.created_at
+         limit p_limit
+         for update skip locked
+     )
+    returning r.*;
+end;
+$$;
@@ -0,0 +1,4 @@
+-- Метки запуска/шарда в run_logs: weekly_digest.py --report сводит итоги matrix-джоба.
+alter table run_logs add column if not exists run_id text;
+alter table run_logs add column if not exists shard text;
+create index if not exists run_logs_run_id_idx on run_logs (run_id);
@@ -0,0 +1,50 @@
+-- Outbox доставок: генерация только ставит сюда письма/сообщения,
+-- отправляет отдельный воркер (outbox.py) с ретраями и экспоненциальным backoff.
+create table if not exists delivery_outbox (
+    id bigserial primary key,
+    channel text not null check (channel in ('email', 'telegram')),
+    recipient text not null,
+    subject text,
+    body text not null,
+    from_addr text,
+    digest_id text,
+    status text not null default 'pending',   -- pending / sending / sent / failed
+    attempts int not null default 0,
+    next_attempt_at timestamptz not null default now(),
+    claimed_by text,
+    lease_expires_at timestamptz,
+    last_error text,
+    created_at timestamptz not null default now(),
+    sent_at timestamptz
+);
+
+create index if not exists delivery_outbox_due_idx
+    on delivery_outbox (next_attempt_at)
+    where status in ('pending', 'sending');
+
+-- Захват пачки готовых к отправке строк; зависшие 'sending' (воркер умер) берутся снова.
+create or replace function claim_outbox(
+    p_worker text,
+    p_limit int default 50,
+    p_lease_seconds int default 120
+) returns setof delivery_outbox
+language plpgsql
+as $$
+begin
+    return query
+    update delivery_outbox o
+       set status = 'sending',
+           claimed_by = p_worker,
+           lease_expires_at = now() + make_interval(secs => p_lease_seconds),
+           attempts = o.attempts + 1
+     where o.id in (
+        select q.id from delivery_outbox q
+         where (q.status = 'pending' and q.next_attempt_at <= now())
+            or (q.status = 'sending' and q.lease_expires_at < now())
+         order by q.next_attempt_at
+         limit p_limit
+         for update skip locked
+     )
+    returning o.*;
+end;
+$$;
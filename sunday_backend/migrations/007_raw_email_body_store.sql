@@ -0,0 +1,3 @@
+-- Сжатое/вынесенное хранение HTML писем (body_store.py).
+-- После применения перенести старые тела: python body_store.py
+alter table raw_emails add column if not exists body_html_ref text;
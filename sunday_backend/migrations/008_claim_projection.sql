@@ -0,0 +1,48 @@
+-- claim_raw_emails возвращал строки целиком (returns setof raw_emails), вместе с body_html /
+-- body_html_ref, хотя Junior Chef читает только body_plain. Возвращаем только нужные колонки.
+-- Тип результата меняется, поэтому функцию пересоздаем.
+drop function if exists claim_raw_emails(text, int, int, int, uuid);
+
+create function claim_raw_emails(
+    p_worker text,
+    p_limit int default 5,
+    p_lease_seconds int default 300,
+    p_max_attempts int default 3,
+    p_user_id uuid default null
+) returns table (
+    id raw_emails.id%type,
+    user_id raw_emails.user_id%type,
+    sender raw_emails.sender%type,
+    subject raw_emails.subject%type,
+    body_plain raw_emails.body_plain%type,
+    attempts raw_emails.attempts%type
+)
+language plpgsql
+as $$
+#variable_conflict use_column
+begin
+    -- Зависшие письма (воркер умер), исчерпавшие попытки — в dead-letter
+    update raw_emails
+       set processing_status = 'dead', claimed_by = null
+     where processing_status = 'processing'
+       and lease_expires_at < now()
+       and raw_emails.attempts >= p_max_attempts;
+
+    return query
+    update raw_emails r
+       set processing_status = 'processing',
+           claimed_by = p_worker,
+           lease_expires_at = now() + make_interval(secs => p_lease_seconds),
+           attempts = r.attempts + 1
+     where r.id in (
+        select q.id from raw_emails q
+         where (q.processing_status = 'pending'
+                or (q.processing_status = 'processing' and q.lease_expires_at < now()))
+           and (p_user_id is null or q.user_id = p_user_id)
+         order by q.created_at
+         limit p_limit
+         for update skip locked
+     )
+    returning r.id, r.user_id, r.sender, r.subject, r.body_plain, r.attempts;
+end;
+$$;
@@ -0,0 +1,25 @@
+-- Предпосчитанная статистика для дашборда (rollups.py): одна строка на пользователя и неделю,
+-- чтобы графики не сканировали raw_emails / email_summaries на каждый rerun.
+create table if not exists user_weekly_stats (
+    user_id uuid not null,
+    week_start date not null,               -- понедельник недели (UTC)
+    emails int not null default 0,          -- входящие письма (raw_emails)
+    summaries int not null default 0,       -- саммари Junior Chef
+    noise int not null default 0,           -- саммари с category = 'Noise' или importance <= 2
+    noise_ratio real,
+    avg_importance real,
+    importance_hist int[] not null default '{0,0,0,0,0}',  -- количество саммари с importance 1..5
+    categories jsonb not null default '{}'::jsonb,         -- category -> count
+    top_senders jsonb not null default '{}'::jsonb,        -- sender -> count (топ-10)
+    updated_at timestamptz not null default now(),
+    primary key (user_id, week_start)
+);
+
+-- Водяные знаки инкрементальных джобов: с какого created_at пересчитывать
+create table if not exists rollup_state (
+    name text primary key,
+    watermark timestamptz
+);
+
+create index if not exists raw_emails_created_at_idx on raw_emails (created_at);
+create index if not exists email_summaries_created_at_idx on email_summaries (created_at);
@@ -0,0 +1,63 @@
+-- Полнотекстовый поиск по брифам (search.py, строка поиска в дашборде).
+-- Индексируемый текст — генерируемые колонки: Postgres пересчитывает их на каждом
+-- insert/update, отдельного шага индексации нет. Конфигурация 'simple' — письма на разных
+-- языках, стемминг одного языка портит остальные.
+create extension if not exists btree_gin;  -- составной GIN (user_id, tsvector)
+
+alter table email_summaries add column if not exists search_tsv tsvector
+    generated always as (
+        setweight(to_tsvector('simple', coalesce(topic, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(summary, '')), 'B')
+    ) stored;
+
+-- structured_content: только строковые значения (тренды, инсайты, action items), без ключей JSON
+alter table digests add column if not exists search_tsv tsvector
+    generated always as (
+        setweight(to_tsvector('simple', coalesce(summary_text, '')), 'A') ||
+        setweight(jsonb_to_tsvector('simple', coalesce(structured_content::jsonb, '{}'::jsonb), '["string"]'), 'B')
+    ) stored;
+
+create index if not exists email_summaries_search_idx on email_summaries using gin (user_id, search_tsv);
+create index if not exists digests_search_idx on digests using gin (user_id, search_tsv);
+
+-- Ранжированный поиск по дайджестам и саммари пользователя.
+-- p_query — синтаксис websearch: слова через AND, "фраза", -исключение, or.
+-- ts_headline перепарсивает текст, поэтому сниппеты строятся только для строк в лимите.
+create or replace function search_briefs(
+    p_user_id uuid,
+    p_query text,
+    p_limit int default 20,
+    p_since timestamptz default null
+)
+returns table (kind text, id text, digest_id text, title text, snippet text, created_at timestamptz, rank real)
+language sql stable
+as $$
+    with q as (
+        select websearch_to_tsquery('simple', p_query) as query
+    ),
+    hits as (
+        select 'digest'::text as kind, d.id::text as id, d.id::text as digest_id,
+               d.summary_text as title, d.summary_text as body, d.created_at,
+               ts_rank(d.search_tsv, q.query, 1) as rank
+        from digests d, q
+        where d.user_id = p_user_id
+          and d.search_tsv @@ q.query
+          and (p_since is null or d.created_at >= p_since)
+        union all
+        select 'summary', s.id::text, s.digest_id::text,
+               s.topic, s.summary, s.created_at,
+               ts_rank(s.search_tsv, q.query, 1)
+        from email_summaries s, q
+        where s.user_id = p_user_id
+          and s.search_tsv @@ q.query
+          and (p_since is null or s.created_at >= p_since)
+        order by rank desc, created_at desc
+        limit p_limit
+    )
+    select h.kind, h.id, h.digest_id, h.title,
+           ts_headline('simple', coalesce(h.body, ''), q.query,
+                       'MaxWords=30, MinWords=12, MaxFragments=2, FragmentDelimiter=" … ", StartSel=**, StopSel=**'),
+           h.created_at, h.rank
+    from hits h, q
+    order by h.rank desc, h.created_at desc;
+$$;
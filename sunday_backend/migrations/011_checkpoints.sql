@@ -0,0 +1,32 @@
+-- Чекпоинты пайплайна (pipeline.py): перезапуск продолжает с места падения без повторных LLM-вызовов.
+
+-- 1. Одно саммари на письмо. Дубли от прошлых перезапусков: оставляем уже попавшее
+--    в дайджест, иначе самое раннее.
+delete from email_summaries where id in (
+    select id from (
+        select id, row_number() over (
+            partition by source_email_id
+            order by (digest_id is null), created_at, id
+        ) as rn
+        from email_summaries
+        where source_email_id is not null
+    ) ranked
+    where rn > 1
+);
+create unique index if not exists email_summaries_source_email_uidx on email_summaries (source_email_id);
+
+-- Письма, чье саммари уже записано, но ack не дошел (падение между insert и update статуса)
+update raw_emails r
+   set processing_status = 'summarized', claimed_by = null, lease_expires_at = null, last_error = null
+  from email_summaries s
+ where s.source_email_id = r.id
+   and r.processing_status in ('pending', 'processing', 'dead');
+
+-- 2. Ключ идемпотентности дайджеста: хэш пользователя и набора саммари.
+--    Повторная доставка того же набора возвращает уже созданную строку.
+alter table digests add column if not exists idempotency_key text;
+create unique index if not exists digests_idempotency_key_uidx on digests (idempotency_key);
+
+-- 3. Ключ дедупликации доставки: повторный enqueue того же дайджеста не шлет письмо дважды
+alter table delivery_outbox add column if not exists dedupe_key text;
+create unique index if not exists delivery_outbox_dedupe_key_uidx on delivery_outbox (dedupe_key);
@@ -0,0 +1,27 @@
+-- Бюджет времени запуска (deadline.py): то, что не успели, остается следующему запуску.
+
+-- Захваченные, но не начатые письма возвращаются в очередь без траты попытки
+-- (claim_raw_emails увеличил attempts при захвате).
+-- Массив от %type аргументом функции Postgres не принимает, поэтому тип явный:
+-- raw_emails.id — bigint (identity-ключ Supabase).
+create or replace function release_raw_emails(p_ids bigint[], p_worker text)
+returns void
+language sql
+as $$
+    update raw_emails
+       set processing_status = 'pending',
+           claimed_by = null,
+           lease_expires_at = null,
+           attempts = greatest(attempts - 1, 0)
+     where id = any(p_ids)
+       and claimed_by = p_worker;
+$$;
+
+-- Пользователи, чей слот доставки пришелся на запуск, которому не хватило времени:
+-- scheduler.py берет их первыми в следующий час.
+create table if not exists run_backlog (
+    user_id uuid primary key,
+    task text not null default 'deliver',
+    reason text,
+    created_at timestamptz not null default now()
+);
@@ -0,0 +1,21 @@
+-- Индекс подписок на вебхуке (sender_index.py): процесс держит подписки в памяти
+-- и доливает только изменившиеся строки по updated_at.
+
+alter table subscriptions add column if not exists updated_at timestamptz not null default now();
+
+create or replace function touch_subscription()
+returns trigger
+language plpgsql
+as $$
+begin
+    new.updated_at := now();
+    return new;
+end;
+$$;
+
+drop trigger if exists subscriptions_touch on subscriptions;
+create trigger subscriptions_touch
+    before update on subscriptions
+    for each row execute function touch_subscription();
+
+create index if not exists subscriptions_updated_at_idx on subscriptions (updated_at);
@@ -0,0 +1,5 @@
+-- Естественный ключ письма на вебхуке (main.py): sha256 сырого MIME.
+-- Повтор вставки (Worker переотправил пачку, построчный повтор после таймаута уже
+-- закоммиченного bulk insert) не создает вторую строку: upsert ... on conflict do nothing.
+alter table raw_emails add column if not exists content_hash text;
+create unique index if not exists raw_emails_user_content_hash_uidx on raw_emails (user_id, content_hash);
@@ -0,0 +1,4 @@
+-- Заголовок для индекса дайджестов (digest_index.INDEX_COLUMNS): начало summary_text,
+-- которого хватает на первое предложение. Индекс больше не тянет полный текст брифа.
+alter table digests add column if not exists headline text
+    generated always as (left(summary_text, 240)) stored;
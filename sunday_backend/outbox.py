@@ -0,0 +1,235 @@
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime, timedelta, timezone
+
+from delivery import TelegramSender, SMTPPool, build_email_message, fanout_workers
+from email_queue import make_worker_id
+import deadline
+
+# --- OUTBOX ДОСТАВОК ---
+# Генерация (pipeline / weekly_digest / summarize) только кладет доставки в delivery_outbox.
+# Отправляет отдельный воркер: пачками, с ретраями и экспоненциальным backoff,
+# поэтому медленный SMTP не тормозит LLM-работу, а падение после вставки дайджеста не теряет отправку.
+
+MAX_ATTEMPTS = int(os.environ.get("OUTBOX_MAX_ATTEMPTS", 6))
+BACKOFF_BASE_SECONDS = 30    # 30s, 1m, 2m, 4m, ...
+BACKOFF_MAX_SECONDS = 3600
+BATCH_SIZE = 50
+BATCH_RESERVE_SECONDS = 60  # новую пачку берем, только если от бюджета запуска осталось столько
+LEASE_SECONDS = 120          # p_lease_seconds в claim_outbox (migrations/006)
+HEARTBEAT_SECONDS = 30       # как часто продлевать lease еще не отправленных строк пачки
+
+def _now():
+    return datetime.now(timezone.utc)
+
+class PermanentDeliveryError(Exception):
+    """Повтор не поможет (нет получателя) — строка сразу уходит в failed"""
+
+# --- ПОСТАНОВКА В ОЧЕРЕДЬ ---
+
+def _recipient(value):
+    """Адрес / chat id или None: str(None) не должен стать получателем"""
+    if value is None:
+        return None
+    return str(value).strip() or None
+
+def email_item(to_email, subject, html_body, digest_id=None, from_addr=None, dedupe_key=None):
+    """
+    dedupe_key — повторный enqueue с тем же ключом игнорируется (migrations/011).
+    None, если получателя нет: enqueue такие пропускает.
+    """
+    recipient = _recipient(to_email)
+    if not recipient:
+        return None
+    item = {
+        "channel": "email",
+        "recipient": recipient,
+        "subject": subject,
+        "body": html_body,
+        "from_addr": from_addr,
+        "digest_id": str(digest_id) if digest_id is not None else None,
+    }
+    if dedupe_key:
+        item["dedupe_key"] = dedupe_key
+    return item
+
+def telegram_item(chat_id, text, digest_id=None, dedupe_key=None):
+    """None, если у пользователя нет Telegram chat id"""
+    recipient = _recipient(chat_id)
+    if not recipient:
+        return None
+    item = {
+        "channel": "telegram",
+        "recipient": recipient,
+        "body": text,
+        "digest_id": str(digest_id) if digest_id is not None else None,
+    }
+    if dedupe_key:
+        item["dedupe_key"] = dedupe_key
+    return item
+
+def enqueue(supabase, items):
+    """Одна вставка на любое количество доставок; None (нет получателя) пропускаются"""
+    items = [i for i in items if i]
+    if not items:
+        return 0
+    if any(i.get('dedupe_key') for i in items):
+        supabase.table("delivery_outbox").upsert(items, on_conflict="dedupe_key", ignore_duplicates=True).execute()
+    else:
+        supabase.table("delivery_outbox").insert(items).execute()
+    print(f"  📮 Queued {len(items)} deliveries")
+    return len(items)
+
+# --- ВОРКЕР ДОСТАВКИ ---
+
+def backoff_seconds(attempts):
+    return min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** max(0, attempts - 1))
+
+class DeliveryWorker:
+    def __init__(self, supabase, worker_id=None, workers=None):
+        self.supabase = supabase
+        self.worker_id = worker_id or make_worker_id("outbox")
+        self.telegram = TelegramSender()
+        self.smtp = SMTPPool()
+        self.email_user = os.environ.get("EMAIL_USER")
+        self.pool = ThreadPoolExecutor(max_workers=workers or fanout_workers(), thread_name_prefix="outbox")
+
+    def claim(self, limit=BATCH_SIZE):
+        res = self.supabase.rpc("claim_outbox", {"p_worker": self.worker_id, "p_limit": limit}).execute()
+        return res.data or []
+
+    def send(self, item):
+        """Бросает исключение при неудаче — строка уйдет на ретрай"""
+        if not item.get('recipient'):
+            # Старые строки, поставленные до проверки в email_item / telegram_item
+            raise PermanentDeliveryError(f"{item['channel']} delivery has no recipient")
+        if item['channel'] == "email":
+            from_header = item.get('from_addr') or f"Sunday AI <{self.email_user}>"
+            message = build_email_message(from_header, item['recipient'], item.get('subject') or "", item['body'])
+            self.smtp.sendmail(self.email_user, item['recipient'], message)
+            print(f"📨 Email sent to {item['recipient']}")
+        elif item['channel'] == "telegram":
+            if not self.telegram.send(item['recipient'], item['body']):
+                raise RuntimeError("telegram send failed")
+        else:
+            raise ValueError(f"unknown channel {item['channel']}")
+
+    def _deliver(self, item):
+        try:
+            self.send(item)
+            return item, None
+        except Exception as e:
+            return item, e
+
+    def heartbeat(self, item_ids):
+        """Продлевает lease строк, которые еще отправляются: медленную пачку не перехватит другой воркер"""
+        if not item_ids:
+            return
+        try:
+            self.supabase.table("delivery_outbox") \
+                .update({"lease_expires_at": (_now() + timedelta(seconds=LEASE_SECONDS)).isoformat()}) \
+                .in_("id", list(item_ids)) \
+                .eq("claimed_by", self.worker_id) \
+                .execute()
+        except Exception as e:
+            print(f"⚠️ Outbox heartbeat failed: {e}")
+
+    def _deliver_all(self, batch):
+        """Параллельная отправка пачки; пока она идет, раз в HEARTBEAT_SECONDS продлеваем lease"""
+        futures = {self.pool.submit(self._deliver, item): item['id'] for item in batch}
+        pending = set(futures)
+        while pending:
+            _, pending = wait(pending, timeout=HEARTBEAT_SECONDS)
+            if pending:
+                self.heartbeat([futures[f] for f in pending])
+        return [f.result() for f in futures]
+
+    def process_batch(self, limit=BATCH_SIZE):
+        """Одна пачка: claim -> параллельная отправка -> отметки. Возвращает размер пачки."""
+        batch = self.claim(limit)
+        if not batch:
+            return 0
+
+        sent, digest_ids = [], set()
+        for item, error in self._deliver_all(batch):
+            if error is None:
+                sent.append(item['id'])
+                if item['channel'] == "email" and item.get('digest_id'):
+                    digest_ids.add(item['digest_id'])
+                continue
+            attempts = item.get('attempts') or 1
+            if attempts >= MAX_ATTEMPTS or isinstance(error, PermanentDeliveryError):
+                print(f"  ☠️ Delivery {item['id']} failed permanently: {error}")
+                update = {"status": "failed"}
+            else:
+                delay = backoff_seconds(attempts)
+                print(f"  🔁 Delivery {item['id']} retry in {delay}s: {error}")
+                update = {"status": "pending", "next_attempt_at": (_now() + timedelta(seconds=delay)).isoformat()}
+            update.update({"claimed_by": None, "lease_expires_at": None, "last_error": str(error)[:500]})
+            self.supabase.table("delivery_outbox").update(update).eq("id", item['id']).execute()
+
+        if sent:
+            self.supabase.table("delivery_outbox") \
+                .update({"status": "sent", "sent_at": _now().isoformat(), "claimed_by": None, "lease_expires_at": None}) \
+                .in_("id", sent) \
+                .execute()
+        if digest_ids:
+            # Дайджест считается отправленным, когда ушло письмо
+            self.supabase.table("digests").update({"is_sent": True}).in_("id", list(digest_ids)).execute()
+        return len(batch)
+
+    def run(self, loop=False, idle_sleep=10, max_batches=None, max_items=None):
+        """Разбирает outbox до пустого (или бесконечно с loop=True); max_items — потолок доставок"""
+        total = batches = 0
+        budget = deadline.current()
+        try:
+            while (max_batches is None or batches < max_batches) and (max_items is None or total < max_items):
+                if not budget.allows(BATCH_RESERVE_SECONDS):
+                    # Незахваченные строки остаются pending — их заберет следующий запуск
+                    print(f"⏳ Outbox: run budget low ({budget}), stopping")
+                    break
+                n = self.process_batch(BATCH_SIZE if max_items is None else min(BATCH_SIZE, max_items - total))
+                batches += 1
+                total += n
+                if n:
+                    continue
+                if not loop:
+                    break
+                time.sleep(idle_sleep)
+        finally:
+            self.pool.shutdown()
+            self.smtp.close()
+        print(f"🏁 Outbox: processed {total} deliveries.")
+        return total
+
+def preview(supabase, limit=BATCH_SIZE):
+    """Что ушло бы следующей пачкой — без захвата и отправки"""
+    res = supabase.table("delivery_outbox") \
+        .select("id, channel, recipient, subject, attempts, next_attempt_at") \
+        .eq("status", "pending") \
+        .lte("next_attempt_at", _now().isoformat()) \
+        .order("next_attempt_at") \
+        .limit(limit) \
+        .execute()
+    for item in res.data or []:
+        print(f"  🧪 #{item['id']} {item['channel']} -> {item['recipient']} (attempt {item['attempts'] + 1})")
+    return res.data or []
+
+if __name__ == "__main__":
+    from pipeline import get_supabase
+
+    supabase = get_supabase()
+
+    parser = argparse.ArgumentParser(description="Sunday AI delivery worker")
+    parser.add_argument("--loop", action="store_true", help="не выходить, когда outbox пуст")
+    parser.add_argument("--workers", type=int, default=None, help="параллельных отправок")
+    parser.add_argument("--dry-run", action="store_true", help="только показать готовые к отправке")
+    args = parser.parse_args()
+
+    if args.dry_run:
+        preview(supabase)
+    else:
+        deadline.start()
+        DeliveryWorker(supabase, workers=args.workers).run(loop=args.loop)
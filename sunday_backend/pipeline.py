@@ -1,52 +1,101 @@
 import os
+import hashlib
 import json
 import re
 import smtplib
+import sys
+import threading
+import time
 from datetime import datetime, timedelta, timezone
-from dotenv import load_dotenv
-from google import genai
-from supabase import create_client, Client
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+from render import render_digest
+from email_queue import get_email_queue, make_worker_id
+from outbox import enqueue, email_item
+from repository import query, records, first, Profile, EmailSummary
+from reducer import reduce_text, describe, JUNIOR_TOKENS
+from hedging import get_hedger
+from json_stream import BriefStream
+import deadline
 
-# Загрузка .env
-load_dotenv()
-
-# --- CONFIG (БЕЗОПАСНАЯ ИНИЦИАЛИЗАЦИЯ) ---
-# Чтобы Streamlit не падал, если ключи еще не прогрузились
-try:
-    import streamlit as st
-    def get_secret(key): return os.environ.get(key) or st.secrets.get(key)
-except:
-    def get_secret(key): return os.environ.get(key)
-
-SUPABASE_URL = get_secret("SUPABASE_URL")
-SUPABASE_KEY = get_secret("SUPABASE_KEY")
-GEMINI_KEY = get_secret("GEMINI_API_KEY")
-EMAIL_USER = get_secret("EMAIL_USER")
-EMAIL_PASS = get_secret("EMAIL_PASS")
-
-# 1. Supabase Init
-if SUPABASE_URL and SUPABASE_KEY:
+# --- CONFIG (ЛЕНИВАЯ ИНИЦИАЛИЗАЦИЯ) ---
+# Импорт модуля ничего не создает: .env, Supabase и Gemini поднимаются при первом
+# обращении и кэшируются. Дашборд и cron-скрипты больше не платят за клиентов,
+# которые им в этом запуске не нужны. `from pipeline import supabase, client`
+# по-прежнему работает — через module __getattr__ ниже.
+
+_clients = {}
+_clients_lock = threading.Lock()
+_env_loaded = False
+
+def get_secret(key):
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _env_loaded = True
+    value = os.environ.get(key)
+    # Streamlit уже импортирован, если мы внутри дашборда; cron его не тянет
+    st = sys.modules.get("streamlit")
+    if not value and st is not None:
+        try:
+            value = st.secrets.get(key)
+        except Exception:
+            pass
+    return value
+
+def _memoized(name, factory):
+    """
+    Создает клиента один раз на процесс. Неудача не кэшируется: в Streamlit
+    ключи могут появиться позже, следующий вызов попробует снова.
+    """
+    if name in _clients:
+        return _clients[name]
+    with _clients_lock:
+        if name not in _clients:
+            instance = factory()
+            if instance is None:
+                return None
+            _clients[name] = instance
+        return _clients[name]
+
+def _create_supabase():
+    url, key = get_secret("SUPABASE_URL"), get_secret("SUPABASE_KEY")
+    if not (url and key):
+        print("⚠️ Supabase Keys Missing")
+        return None
     try:
-        supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+        from supabase import create_client, ClientOptions
+        return create_client(url, key, options=ClientOptions(postgrest_client_timeout=deadline.DB_TIMEOUT))
     except Exception as e:
         print(f"⚠️ Supabase Init Error: {e}")
-        supabase = None
-else:
-    print("⚠️ Supabase Keys Missing")
-    supabase = None
+        return None
 
-# 2. Gemini Init (БЕЗ ЭТОГО APP.PY УПАДЕТ ПРИ ИМПОРТЕ)
-if GEMINI_KEY:
+def _create_gemini():
+    api_key = get_secret("GEMINI_API_KEY")
+    if not api_key:
+        print("⚠️ GEMINI_API_KEY Missing")
+        return None
     try:
-        client = genai.Client(api_key=GEMINI_KEY)
+        from google import genai
+        return genai.Client(api_key=api_key)
     except Exception as e:
         print(f"⚠️ Gemini Client Error: {e}")
-        client = None
-else:
-    print("⚠️ GEMINI_API_KEY Missing")
-    client = None
+        return None
+
+def get_supabase():
+    return _memoized("supabase", _create_supabase)
+
+def get_client():
+    return _memoized("gemini", _create_gemini)
+
+def __getattr__(name):
+    # Совместимость со старыми `from pipeline import supabase, client`
+    if name == "supabase":
+        return get_supabase()
+    if name == "client":
+        return get_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # --- UTILS ---
 
@@ -56,57 +105,10 @@ def clean_json_response(text):
     return text.strip()
 
 def generate_email_html(digest_data):
-    summary = digest_data.get('big_picture', 'See details below.')
-    current_date = datetime.now().strftime('%B %d, %Y')
-    
-    html = f"""
-    <html>
-    <body style="font-family: 'Helvetica Neue', Helvetica, Arial, sans-serif; color: #333; max-width: 600px; margin: 0 auto; padding: 20px;">
-        <div style="text-align: center; margin-bottom: 30px;">
-            <h1 style="color: #111; margin: 0;">Sunday Brief ☕</h1>
-            <p style="color: #666; font-size: 14px;">{current_date}</p>
-        </div>
-        <div style="background: #eff6ff; padding: 25px; border-radius: 12px; margin-bottom: 30px; border-left: 6px solid #3b82f6;">
-            <h2 style="color: #1e3a8a; margin-top: 0; font-size: 18px;">🌍 The Big Picture</h2>
-            <p style="line-height: 1.6; font-size: 16px; color: #1e40af; margin-bottom: 0;">{summary}</p>
-        </div>
-        <h3 style="border-bottom: 2px solid #eee; padding-bottom: 10px; margin-top: 30px;">📊 Key Strategic Insights</h3>
-    """
-    
-    trends = digest_data.get('trends', [])
-    if not trends:
-        html += "<p style='color: #777; font-style: italic;'>No major trends detected this week.</p>"
-    
-    for t in trends:
-        title = t.get('title', 'Insight')
-        body = t.get('insight', '')
-        html += f"""
-        <div style="margin-bottom: 25px;">
-            <h4 style="margin: 0 0 8px 0; color: #111827; font-size: 16px; font-weight: 700;">{title}</h4>
-            <p style="margin: 0; color: #4b5563; font-size: 15px; line-height: 1.5;">{body}</p>
-        </div>
-        """
-
-    actions = digest_data.get('action_items', [])
-    if actions:
-        html += """
-        <div style="background: #fff1f2; padding: 20px; border-radius: 12px; margin-top: 30px; border: 1px solid #fecdd3;">
-            <h3 style="color: #9f1239; margin-top: 0; font-size: 16px;">🚀 Action Items</h3>
-            <ul style="margin-bottom: 0; padding-left: 20px;">"""
-        for act in actions:
-            html += f"<li style='color: #881337; margin-bottom: 8px; font-size: 15px;'>{act}</li>"
-        html += "</ul></div>"
-
-    html += """
-        <div style="margin-top: 40px; padding-top: 20px; border-top: 1px solid #eee; text-align: center;">
-            <p style="color: #9ca3af; font-size: 12px;">by Sunday AI</p>
-        </div>
-    </body>
-    </html>
-    """
-    return html
+    return render_digest(digest_data)['email_html']
 
 def send_email(to_email, subject, html_body):
+    EMAIL_USER, EMAIL_PASS = get_secret("EMAIL_USER"), get_secret("EMAIL_PASS")
     if not EMAIL_USER or not EMAIL_PASS:
         print("⚠️ SMTP credentials missing.")
         return False
@@ -119,7 +121,7 @@ def send_email(to_email, subject, html_body):
         msg['Subject'] = subject
         msg.attach(MIMEText(html_body, 'html'))
         
-        with smtplib.SMTP(smtp_server, 587) as server:
+        with smtplib.SMTP(smtp_server, 587, timeout=deadline.current().timeout(deadline.SMTP_TIMEOUT)) as server:
             server.starttls()
             server.login(EMAIL_USER, EMAIL_PASS)
             server.sendmail(EMAIL_USER, to_email, msg.as_string())
@@ -136,8 +138,13 @@ def summarize_single_email(email_body, sender, subject):
     """
     Анализирует ОДНО письмо.
     """
+    client = get_client()
     if not client: return None
 
+    # Вместо среза [:8000] — самые содержательные блоки в том же бюджете
+    email_body, stats = reduce_text(email_body, JUNIOR_TOKENS)
+    print(f"    ✂️ Body reduced: {describe(stats)}")
+
     # ТВОЙ ОРИГИНАЛЬНЫЙ ПРОМПТ
     prompt = f"""
     ROLE: You are an Expert Content Analyst for a Newsletter Aggregator.
@@ -153,7 +160,7 @@ def summarize_single_email(email_body, sender, subject):
     INPUT EMAIL:
     From: {sender}
     Subject: {subject}
-    Body: {email_body[:8000]} (truncated)
+    Body: {email_body} (reduced)
 
     OUTPUT JSON format only:
     {{
@@ -163,12 +170,18 @@ def summarize_single_email(email_body, sender, subject):
         "importance": 1-5 (5 = High Signal Newsletter, 1 = Spam/Noise)
     }}
     """
-    try:
-        response = client.models.generate_content(
+    def generate():
+        # Таймаут считается в момент отправки: у хеджа он свой, от остатка бюджета
+        return client.models.generate_content(
             model="gemini-3-pro-preview", # <-- ТВОЯ МОДЕЛЬ
             contents=prompt,
-            config={'response_mime_type': 'application/json'}
+            config={'response_mime_type': 'application/json', 'http_options': deadline.llm_http_options()}
         )
+
+    try:
+        # LLM_HEDGING=1: дубль запроса, если ответ задерживается дольше обычного (hedging.py)
+        hedger = get_hedger()
+        response = hedger.call(generate) if hedger else generate()
         return json.loads(clean_json_response(response.text))
     except Exception as e:
         print(f"⚠️ Junior Chef Error: {e}")
@@ -177,10 +190,14 @@ def summarize_single_email(email_body, sender, subject):
 # ==========================================
 # 👨‍🍳 STAGE 2: HEAD CHEF (Smart Contextual Synthesis)
 # ==========================================
-def synthesize_weekly_report(summaries, user_profile):
+def synthesize_weekly_report(summaries, user_profile, prior=None, on_partial=None):
     """
     Пишет отчет, учитывая РАЗНЫЕ интересы пользователя.
+    prior — похожие саммари из прошлых брифов (pipeline.prior_context) для преемственности.
+    on_partial(brief) — потоковый режим: вызывается с готовой частью брифа
+    (big_picture, затем тренды по одному), пока модель еще пишет остальное.
     """
+    client = get_client()
     if not client: return None
 
     context_text = ""
@@ -190,6 +207,13 @@ def synthesize_weekly_report(summaries, user_profile):
     role = user_profile.get('role', 'Founder')
     focus_areas = ", ".join(user_profile.get('focus_areas', []) or ["General Tech"])
 
+    prior_text = ""
+    if prior:
+        prior_text = "PRIOR COVERAGE (already in the user's earlier briefs; use only for continuity, " \
+                     "say what changed, never re-report it as new):\n"
+        for item in prior:
+            prior_text += f"- [{item.get('topic')}] ({(item.get('created_at') or '')[:10]}): {item.get('summary')}\n"
+
     # ТВОЙ ОРИГИНАЛЬНЫЙ ПРОМПТ
     prompt = f"""
     ROLE: You are an Elite Strategic Advisor for a {role}.
@@ -224,107 +248,447 @@ def synthesize_weekly_report(summaries, user_profile):
 
     DATA:
     {context_text}
+    {prior_text}
     """
     
+    config = {'response_mime_type': 'application/json', 'http_options': deadline.llm_http_options()}
+    try:
+        if on_partial:
+            stream = BriefStream(lambda key, value: on_partial(stream.snapshot()))
+            for chunk in client.models.generate_content_stream(
+                model="gemini-3-flash-preview", contents=prompt, config=config
+            ):
+                stream.feed(chunk.text)
+            text = stream.text
+        else:
+            response = client.models.generate_content(
+                model="gemini-3-flash-preview", # <-- ТВОЯ МОДЕЛЬ
+                contents=prompt,
+                config=config
+            )
+            text = response.text
+        return json.loads(clean_json_response(text))
+    except Exception as e:
+        print(f"⚠️ Head Chef Error: {e}")
+        return None
+
+# ==========================================
+# 🔁 STAGE 1.5: DRAFT MERGE (Incremental Synthesis)
+# ==========================================
+def merge_into_brief(brief, new_summaries, user_profile):
+    """
+    Дописывает в уже готовый черновик только НОВЫЕ саммари (дельту).
+    """
+    client = get_client()
+    if not client: return None
+
+    context_text = ""
+    for item in new_summaries:
+        context_text += f"- [{item['topic']}] ({item['category']}): {item['summary']} (Signal: {item['importance']}/5)\n\n"
+
+    role = user_profile.get('role', 'Founder')
+    focus_areas = ", ".join(user_profile.get('focus_areas', []) or ["General Tech"])
+
+    prompt = f"""
+    ROLE: You are an Elite Strategic Advisor for a {role}.
+    **Their Focus Areas:** {focus_areas}.
+
+    TASK:
+    Below is a DRAFT "Deep-Dive Strategic Brief" and a few NEW items that arrived after it was written.
+    Update the draft so it covers the new items too.
+
+    RULES:
+    1. If a new item fits an existing trend, enrich that trend's insight instead of adding a duplicate.
+    2. Add a new trend only for a genuinely new theme.
+    3. Keep everything else from the draft as is. Update "big_picture" and "action_items" only if the new items change them.
+    4. Return the FULL updated brief in the same JSON format as the draft.
+
+    DRAFT JSON:
+    {json.dumps(brief, ensure_ascii=False)}
+
+    NEW ITEMS:
+    {context_text}
+    """
+
     try:
         response = client.models.generate_content(
-            model="gemini-3-flash-preview", # <-- ТВОЯ МОДЕЛЬ
+            model="gemini-3-flash-preview",
             contents=prompt,
-            config={'response_mime_type': 'application/json'}
+            config={'response_mime_type': 'application/json', 'http_options': deadline.llm_http_options()}
         )
         return json.loads(clean_json_response(response.text))
     except Exception as e:
-        print(f"⚠️ Head Chef Error: {e}")
+        print(f"⚠️ Draft Merge Error: {e}")
         return None
 
+# ==========================================
+# 🧺 PIPELINE STEPS
+# ==========================================
+
+def report_progress(progress, phase, **fields):
+    """progress — необязательный колбэк progress(phase, **fields), например от jobs.py"""
+    if progress:
+        try: progress(phase, **fields)
+        except Exception as e: print(f"⚠️ Progress callback error: {e}")
+
+def cook_raw_emails(user_id=None, progress=None, worker_id=None, batch_size=5, limit=None):
+    """
+    Junior Chef: превращает необработанные письма в email_summaries.
+    Письма берутся из очереди с захватом (email_queue.py), поэтому параллельные
+    запуски не суммаризируют одно письмо дважды. user_id=None — письма всех пользователей.
+    limit — не больше стольких писем за вызов.
+    """
+    supabase = get_supabase()
+    queue = get_email_queue(supabase)
+    worker_id = worker_id or make_worker_id()
+
+    total = queue.pending_count(user_id)
+    if limit is not None:
+        total = min(total, limit)
+    if not total:
+        return 0
+
+    print(f"  🍳 Cooking {total} raw emails...")
+    cooked = done = 0
+    report_progress(progress, "summarizing", done=0, total=total)
+    budget = deadline.current()
+    while done < total or limit is None:
+        if not budget.allows(EMAIL_RESERVE_SECONDS):
+            print(f"  ⏳ Run budget low ({budget}): leaving {total - done} emails for the next run")
+            break
+        batch = queue.claim(worker_id, min(batch_size, total - done) if limit is not None else batch_size, user_id)
+        if not batch:
+            break
+        remaining = {e['id'] for e in batch}
+        # Чекпоинт: саммари уже записано прошлым запуском (упал до ack) — LLM не зовем
+        checkpointed = summarized_email_ids(supabase, list(remaining))
+        for email in batch:
+            if not budget.allows(EMAIL_RESERVE_SECONDS):
+                # Захваченные, но не начатые — обратно в очередь без траты попытки
+                queue.release(remaining, worker_id)
+                print(f"  ⏳ Run budget low ({budget}): released {len(remaining)} claimed emails")
+                return cooked
+            remaining.discard(email['id'])
+            try:
+                if email['id'] in checkpointed:
+                    print(f"  ♻️ Email {email['id']} already summarized, acking")
+                    queue.ack(email['id'], worker_id)
+                else:
+                    summary_data = summarize_single_email(
+                        email['body_plain'], email['sender'], email['subject']
+                    )
+                    if not summary_data:
+                        raise ValueError("empty summary")
+
+                    # source_email_id уникален (migrations/011): гонка двух воркеров не дает дубля
+                    saved = supabase.table("email_summaries").upsert({
+                        "user_id": email['user_id'],
+                        "source_email_id": email['id'],
+                        "topic": summary_data.get('topic', 'No Topic'),
+                        "summary": summary_data.get('summary', ''),
+                        "category": summary_data.get('category', 'Noise'),
+                        "importance": summary_data.get('importance', 1)
+                    }, on_conflict="source_email_id", ignore_duplicates=True).execute().data
+
+                    queue.ack(email['id'], worker_id)
+                    index_summary(email['user_id'], saved[0] if saved else None)
+                cooked += 1
+            except Exception as e:
+                status = queue.fail(email, worker_id, e)
+                print(f"  ⚠️ Email {email['id']} failed ({status}): {e}")
+            # Продлеваем lease писем пачки, до которых еще не дошли
+            queue.heartbeat(remaining, worker_id)
+            done += 1
+            report_progress(progress, "summarizing", done=min(done, total), total=total)
+    hedger = get_hedger()
+    if hedger:
+        print(f"  🪁 Hedging: {hedger.summary()}")
+    return cooked
+
+def summarized_email_ids(supabase, email_ids):
+    """Из email_ids — те, для которых email_summaries уже есть (один запрос на пачку)"""
+    if not email_ids:
+        return set()
+    res = query(supabase, EmailSummary, "source_email_id").in_("source_email_id", email_ids).execute()
+    return {row['source_email_id'] for row in res.data or []}
+
+# --- ВЕКТОРНЫЙ ИНДЕКС (vector_index.py) ---
+# Новые саммари сразу попадают в индекс пользователя; перед синтезом Head Chef получает
+# похожие саммари из прошлых брифов — преемственность сюжетов без лишнего LLM-вызова.
+
+PRIOR_CONTEXT_LIMIT = 6
+SYNTHESIS_ATTEMPTS = 2
+SYNTHESIS_RETRY_SECONDS = 5
+# Сколько должно оставаться от бюджета запуска (deadline.py), чтобы начать письмо / синтез
+EMAIL_RESERVE_SECONDS = 60
+SYNTHESIS_RESERVE_SECONDS = 150
+
+def index_summary(user_id, row):
+    """Сбой индекса не роняет пайплайн: sync() дотянет саммари при следующем запросе"""
+    if not row or row.get('category') == "Noise":
+        return
+    try:
+        from vector_index import get_vector_index  # numpy — только когда индекс нужен
+        get_vector_index(user_id).add_summary(row)
+    except Exception as e:
+        print(f"  ⚠️ Vector index error: {e}")
+
+def prior_context(user_id, summaries):
+    """Прошлые саммари, близкие к новым (кроме самих новых): [{topic, summary, created_at, score}]"""
+    try:
+        from vector_index import get_vector_index, summary_text
+        index = get_vector_index(user_id)
+        if not len(index):
+            # Локального индекса нет (новый раннер без кэша) — не тянем всю историю ради
+            # нескольких подсказок; индекс наполнят index_summary() и vector_index.py
+            return []
+        index.sync(get_supabase())
+        return index.related_to([summary_text(s) for s in summaries], k=PRIOR_CONTEXT_LIMIT,
+                                exclude={s['id'] for s in summaries})
+    except Exception as e:
+        print(f"  ⚠️ Prior context unavailable: {e}")
+        return []
+
+# Все, что пайплайн читает из профиля (синтез + доставка)
+PIPELINE_PROFILE_COLUMNS = ("id", "personal_email", "role", "focus_areas")
+
+def fetch_pending_summaries(user_id):
+    """Саммари, которые еще не попали ни в один дайджест."""
+    res = query(get_supabase(), EmailSummary, "id", "topic", "summary", "category", "importance") \
+        .eq("user_id", user_id) \
+        .is_("digest_id", "null") \
+        .gt("importance", 2) \
+        .execute()
+    return records(EmailSummary, res)
+
+def get_draft(user_id):
+    res = get_supabase().table("digest_drafts").select("*").eq("user_id", user_id).execute()
+    return res.data[0] if res.data else None
+
+def save_draft(user_id, brief, summary_ids):
+    get_supabase().table("digest_drafts").upsert({
+        "user_id": user_id,
+        "structured_content": brief,
+        "summary_ids": summary_ids,
+        "updated_at": datetime.now(timezone.utc).isoformat()
+    }).execute()
+
+def digest_key(user_id, summary_ids):
+    """Ключ идемпотентности дайджеста: тот же пользователь и набор саммари -> тот же дайджест"""
+    raw = f"{user_id}:" + ",".join(sorted(str(i) for i in summary_ids))
+    return hashlib.sha256(raw.encode()).hexdigest()[:32]
+
+def deliver_brief(user, final_brief, summaries):
+    """
+    Сохраняет готовый бриф в digests, ставит письмо в outbox и привязывает к дайджесту саммари.
+    Отправляет outbox.py; is_sent станет True после реальной отправки.
+    Каждый шаг идемпотентен (digests.idempotency_key, delivery_outbox.dedupe_key), поэтому
+    повтор после падения на любом шаге доводит доставку до конца без дублей.
+    """
+    supabase = get_supabase()
+    user_id = user['id']
+    summary_ids = [s['id'] for s in summaries]
+    key = digest_key(user_id, summary_ids)
+    # Рендерим один раз: письмо, дашборд и текст хранятся вместе с дайджестом
+    rendered = render_digest(final_brief)
+    digest_res = supabase.table("digests").upsert({
+        "user_id": user_id,
+        "user_email": user.get('personal_email'),
+        "summary_text": final_brief.get('big_picture'),
+        "structured_content": final_brief, 
+        "rendered": rendered,
+        "period_start": (datetime.now(timezone.utc) - timedelta(days=7)).isoformat(),
+        "period_end": datetime.now(timezone.utc).isoformat(),
+        "is_sent": False,
+        "idempotency_key": key,
+    }, on_conflict="idempotency_key", ignore_duplicates=True).execute()
+
+    if digest_res.data:
+        new_digest_id = digest_res.data[0]['id']
+        print("  ✨ Digest Created!")
+    else:
+        existing = supabase.table("digests").select("id, rendered").eq("idempotency_key", key).execute().data[0]
+        new_digest_id = existing['id']
+        rendered = existing.get('rendered') or rendered
+        print("  ♻️ Digest already created by an earlier run, resuming delivery")
+
+    # Письмо ставим до привязки саммари: после нее повторный запуск уже не увидит этот набор
+    enqueue(supabase, [
+        email_item(user.get('personal_email'), "☕ Your Sunday Brief", rendered['email_html'], new_digest_id,
+                   dedupe_key=f"digest:{new_digest_id}:email")
+    ])
+
+    supabase.table("email_summaries").update({"digest_id": new_digest_id}) \
+        .in_("id", summary_ids).execute()
+
+    # Черновик больше не нужен: все его саммари уже в дайджесте
+    supabase.table("digest_drafts").delete().eq("user_id", user_id).execute()
+    return new_digest_id
+
+def synthesize_checkpointed(user, summaries, progress=None):
+    """
+    Синтез с чекпоинтом в digest_drafts: если бриф на этот же набор саммари уже собран
+    (прошлый запуск упал на доставке), он берется без LLM. Готовый бриф сохраняется
+    до доставки; неудачный синтез повторяется SYNTHESIS_ATTEMPTS раз.
+    """
+    user_id = user['id']
+    pending_ids = {s['id'] for s in summaries}
+    draft = get_draft(user_id)
+    if draft and set(draft.get('summary_ids') or []) == pending_ids:
+        print("  ♻️ Reusing the brief checkpointed by an earlier run")
+        return draft['structured_content']
+
+    if not deadline.current().allows(SYNTHESIS_RESERVE_SECONDS):
+        print(f"  ⏳ Run budget low ({deadline.current()}): synthesis deferred, summaries stay pending")
+        return None
+
+    print(f"  👨‍🍳 Head Chef synthesising {len(summaries)} items...")
+    report_progress(progress, "synthesizing", items=len(summaries))
+    prior = prior_context(user_id, summaries)
+    # Кто-то смотрит на прогресс (jobs.py -> дашборд) — стримим бриф по частям
+    def on_partial(partial):
+        report_progress(progress, "synthesizing", items=len(summaries), partial=partial)
+    for attempt in range(1, SYNTHESIS_ATTEMPTS + 1):
+        brief = synthesize_weekly_report(summaries, user, prior, on_partial if progress else None)
+        if brief:
+            save_draft(user_id, brief, sorted(pending_ids))
+            return brief
+        if attempt < SYNTHESIS_ATTEMPTS:
+            print(f"  🔁 Synthesis attempt {attempt} failed, retrying...")
+            time.sleep(SYNTHESIS_RETRY_SECONDS)
+    return None
+
+# ==========================================
+# 📝 PUBLIC FUNCTION: REFRESH DRAFT
+# ==========================================
+
+def refresh_draft(user_id, user=None, progress=None):
+    """
+    Инкрементальный режим: держит черновик брифа в digest_drafts актуальным.
+    Вызывается по расписанию между доставками, чтобы к digest_time
+    оставалось только финализировать черновик.
+    Возвращает (brief, summaries) или (None, []), если контента нет.
+    """
+    supabase = get_supabase()
+    if not supabase or not get_client():
+        print("❌ Draft halted: Missing API Keys.")
+        return None, []
+
+    if user is None:
+        user = first(Profile, query(supabase, Profile, *PIPELINE_PROFILE_COLUMNS).eq("id", user_id).execute())
+        if not user:
+            print("❌ User not found")
+            return None, []
+
+    cook_raw_emails(user_id, progress)
+    summaries = fetch_pending_summaries(user_id)
+    if not summaries:
+        return None, []
+
+    draft = get_draft(user_id)
+    pending_ids = {s['id'] for s in summaries}
+    draft_ids = set(draft.get('summary_ids') or []) if draft else set()
+
+    # 1. Ничего нового — черновик уже актуален
+    if draft and draft_ids == pending_ids:
+        return draft['structured_content'], summaries
+
+    if not deadline.current().allows(SYNTHESIS_RESERVE_SECONDS):
+        # Без LLM-вызова: черновик как есть и только те саммари, что в нем уже учтены
+        print(f"  ⏳ Run budget low ({deadline.current()}): draft update deferred")
+        if draft and draft_ids <= pending_ids:
+            return draft['structured_content'], [s for s in summaries if s['id'] in draft_ids]
+        return None, []
+
+    # 2. Только новые саммари — мержим дельту в существующий черновик
+    brief = None
+    new_items = [s for s in summaries if s['id'] not in draft_ids]
+    if draft and draft_ids <= pending_ids:
+        print(f"  📝 Merging {len(new_items)} new items into draft...")
+        report_progress(progress, "synthesizing", items=len(new_items))
+        brief = merge_into_brief(draft['structured_content'], new_items, user)
+
+    # 3. Черновика нет, часть его саммари уже ушла в дайджест или мерж не удался —
+    #    пересобираем с нуля
+    if not brief:
+        print(f"  📝 Synthesising draft from {len(summaries)} items...")
+        report_progress(progress, "synthesizing", items=len(summaries))
+        brief = synthesize_weekly_report(summaries, user, prior_context(user_id, summaries))
+        if not brief:
+            return None, []
+
+    save_draft(user_id, brief, sorted(pending_ids))
+    return brief, summaries
+
 # ==========================================
 # 🚀 PUBLIC FUNCTION: RUN DIGEST
 # ==========================================
 
-def run_digest(user_id):
-    if not supabase or not client:
+def run_digest(user_id, incremental=False, progress=None, raise_errors=False):
+    """
+    incremental=True: финализирует черновик из digest_drafts (доливая в него
+    только то, что пришло после последнего refresh_draft) вместо полного синтеза.
+    progress: колбэк progress(phase, **fields) — фазы summarizing / synthesizing / delivering.
+    False — дайджеста нет. Ошибки тоже дают False, а с raise_errors=True пробрасываются:
+    фоновой задаче (jobs.py) и планировщику нужно отличать сбой от "нет новых писем".
+    """
+    supabase = get_supabase()
+    if not supabase or not get_client():
         print("❌ Pipeline halted: Missing API Keys.")
+        if raise_errors:
+            raise RuntimeError("Pipeline is not configured: missing API keys")
         return False
 
     print(f"🚀 Starting pipeline for user: {user_id}")
+    # Каждая фаза чекпоинтится (саммари по source_email_id, бриф в digest_drafts,
+    # дайджест по idempotency_key): после падения повторный run_digest продолжит с нее
+    phase = "profile"
     
     try:
         # 1. Получаем профиль
-        user_res = supabase.table("profiles").select("*").eq("id", user_id).execute()
-        if not user_res.data:
+        user = first(Profile, query(supabase, Profile, *PIPELINE_PROFILE_COLUMNS).eq("id", user_id).execute())
+        if not user:
             print("❌ User not found")
+            if raise_errors:
+                raise LookupError(f"user {user_id} not found")
             return False
-        
-        user = user_res.data[0]
+
+        if incremental:
+            phase = "draft"
+            final_brief, pending_summaries = refresh_draft(user_id, user, progress)
+            if not final_brief:
+                print("  💤 Not enough content (high importance) for a digest.")
+                return False
+            phase = "delivery"
+            report_progress(progress, "delivering")
+            deliver_brief(user, final_brief, pending_summaries)
+            return True
         
         # 2. Обработка сырых писем (Junior Chef)
-        raw_emails = supabase.table("raw_emails") \
-            .select("*") \
-            .eq("user_id", user_id) \
-            .neq("processing_status", "summarized") \
-            .execute()
-        
-        if raw_emails.data:
-            print(f"  🍳 Cooking {len(raw_emails.data)} raw emails...")
-            for email in raw_emails.data:
-                summary_data = summarize_single_email(
-                    email['body_plain'], email['sender'], email['subject']
-                )
-                if summary_data:
-                    supabase.table("email_summaries").insert({
-                        "user_id": user_id,
-                        "source_email_id": email['id'],
-                        "topic": summary_data.get('topic', 'No Topic'),
-                        "summary": summary_data.get('summary', ''),
-                        "category": summary_data.get('category', 'Noise'),
-                        "importance": summary_data.get('importance', 1)
-                    }).execute()
-                    
-                    supabase.table("raw_emails").update({"processing_status": "summarized"}) \
-                        .eq("id", email['id']).execute()
+        phase = "summarization"
+        cook_raw_emails(user_id, progress)
 
         # 3. Генерация отчета (Head Chef)
-        pending_summaries = supabase.table("email_summaries") \
-            .select("*") \
-            .eq("user_id", user_id) \
-            .is_("digest_id", "null") \
-            .gt("importance", 2) \
-            .execute()
+        phase = "synthesis"
+        pending_summaries = fetch_pending_summaries(user_id)
             
-        if not pending_summaries.data:
+        if not pending_summaries:
             print("  💤 Not enough content (high importance) for a digest.")
             return False
-            
-        print(f"  👨‍🍳 Head Chef synthesising {len(pending_summaries.data)} items...")
-        
-        final_brief = synthesize_weekly_report(pending_summaries.data, user)
+
+        final_brief = synthesize_checkpointed(user, pending_summaries, progress)
         
         if final_brief:
-            digest_res = supabase.table("digests").insert({
-                "user_id": user_id,
-                "user_email": user.get('personal_email'),
-                "summary_text": final_brief.get('big_picture'),
-                "structured_content": final_brief, 
-                "period_start": (datetime.now(timezone.utc) - timedelta(days=7)).isoformat(),
-                "period_end": datetime.now(timezone.utc).isoformat(),
-                "is_sent": True 
-            }).execute()
-            
-            new_digest_id = digest_res.data[0]['id']
-            summary_ids = [s['id'] for s in pending_summaries.data]
-            supabase.table("email_summaries").update({"digest_id": new_digest_id}) \
-                .in_("id", summary_ids).execute()
-
-            print("  ✨ Digest Created!")
-
-            email_html = generate_email_html(final_brief)
-            send_email(user.get('personal_email'), f"☕ Your Sunday Brief", email_html)
-            
+            phase = "delivery"
+            report_progress(progress, "delivering")
+            deliver_brief(user, final_brief, pending_summaries)
             return True
         
         return False
     except Exception as e:
-        print(f"❌ CRITICAL PIPELINE ERROR: {e}")
+        print(f"❌ CRITICAL PIPELINE ERROR ({phase}): {e}. Checkpoints kept; the next run resumes here.")
+        if raise_errors:
+            raise
         return False
 
 if __name__ == "__main__":
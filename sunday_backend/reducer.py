@@ -0,0 +1,134 @@
+import re
+
+from boilerplate import count_boilerplate
+
+# --- СОКРАЩЕНИЕ ТЕЛА ПИСЬМА ПЕРЕД ПРОМПТОМ ---
+# Вместо слепого body[:N] режем письмо на блоки (абзацы), выкидываем повторы строк,
+# спонсорские вставки, списки ссылок и футеры, а из оставшегося берем самые
+# "плотные" блоки в пределах бюджета токенов — в исходном порядке.
+# Токены считаем грубо (4 символа ≈ 1 токен): точный токенизатор Gemini не нужен,
+# чтобы сравнивать до/после и держать промпт в бюджете.
+
+CHARS_PER_TOKEN = 4
+
+# Бюджеты соответствуют прежним срезам: [:8000], [:30000], [:1000] символов
+JUNIOR_TOKENS = 2000
+SUMMARY_TOKENS = 7500
+WEEKLY_TOKENS = 250
+
+# Блок короче этого с шаблонной фразой — футер / спонсорская строка, выкидываем целиком.
+# В длинном блоке фраза скорее упоминание ("реклама" в статье про рекламу): только штраф
+SHORT_BLOCK_WORDS = 25
+MARKER_PENALTY_WORDS = 8    # одна фраза "съедает" столько слов блока
+MIN_MARKER_FACTOR = 0.3
+
+URL_RE = re.compile(r"https?://\S+|www\.\S+")
+WORD_RE = re.compile(r"[^\W\d_]{2,}")
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN if text else 0
+
+def _line_key(line):
+    """Ключ для поиска повторов: без регистра, ссылок и цифр"""
+    line = URL_RE.sub("", line.lower())
+    return re.sub(r"\d+", "0", " ".join(line.split()))
+
+def split_blocks(text):
+    """Абзацы по пустым строкам; одна длинная "простыня" режется по строкам"""
+    blocks = [b.strip() for b in re.split(r"\n\s*\n", text) if b.strip()]
+    if len(blocks) == 1 and blocks[0].count("\n") > 3:
+        blocks = [l.strip() for l in blocks[0].splitlines() if l.strip()]
+    return blocks
+
+def _dedupe(blocks):
+    """Убирает строки, уже встречавшиеся выше (повторяющиеся футеры, шапки, CTA)"""
+    seen, out, dropped = set(), [], 0
+    for block in blocks:
+        lines = []
+        for line in block.splitlines():
+            key = _line_key(line)
+            if key and key in seen:
+                dropped += 1
+                continue
+            if key:
+                seen.add(key)
+            lines.append(line)
+        if lines:
+            out.append("\n".join(lines))
+    return out, dropped
+
+def density(block):
+    """
+    Ценность блока на символ, 0..1: доля текста в словах, минус ссылки.
+    Короткие шаблонные блоки (футеры, спонсоры) — 0, длинные со шаблонной фразой — со штрафом.
+    """
+    link_chars = sum(len(m) for m in URL_RE.findall(block))
+    words = WORD_RE.findall(block)
+    if not words:
+        return 0.0
+    markers = count_boilerplate(block)
+    marker_factor = 1.0
+    if markers:
+        if len(words) < SHORT_BLOCK_WORDS:
+            return 0.0
+        marker_factor = max(MIN_MARKER_FACTOR, 1 - markers * MARKER_PENALTY_WORDS / len(words))
+    word_chars = sum(len(w) for w in words)
+    text_ratio = word_chars / max(1, len(block) - link_chars)
+    link_penalty = 1 - link_chars / len(block)
+    # Короткие строки (заголовки, кнопки) сами по себе малоценны
+    length_factor = min(1.0, len(words) / 12)
+    return text_ratio * link_penalty * length_factor * marker_factor
+
+def reduce_text(text, max_tokens):
+    """
+    Возвращает (сокращенный текст, stats).
+    stats: tokens_in, tokens_out, blocks_in, blocks_kept, repeated_lines, boilerplate_blocks.
+    """
+    text = text or ""
+    stats = {"tokens_in": estimate_tokens(text), "tokens_out": 0, "blocks_in": 0,
+             "blocks_kept": 0, "repeated_lines": 0, "boilerplate_blocks": 0}
+    if not text.strip():
+        return "", stats
+
+    blocks = split_blocks(text)
+    stats["blocks_in"] = len(blocks)
+    blocks, stats["repeated_lines"] = _dedupe(blocks)
+
+    scored = []
+    for i, block in enumerate(blocks):
+        value = density(block)
+        if value == 0.0:
+            stats["boilerplate_blocks"] += 1
+            continue
+        # Лид письма обычно важнее хвоста
+        value *= 1.0 + 0.3 * (1 - i / len(blocks))
+        scored.append((value, i, block))
+
+    budget = max_tokens * CHARS_PER_TOKEN
+    kept, used = [], 0
+    for value, i, block in sorted(scored, key=lambda s: (-s[0], s[1])):
+        size = len(block) + 2
+        if used + size > budget:
+            if kept:
+                continue
+            # Даже лучший блок не влезает — берем его начало
+            block = block[:budget]
+            size = len(block)
+        kept.append((i, block))
+        used += size
+
+    if not kept:
+        # Ничего содержательного не нашли — ведем себя как прежний срез
+        reduced = text[:budget]
+    else:
+        reduced = "\n\n".join(block for _, block in sorted(kept))
+
+    stats["blocks_kept"] = len(kept)
+    stats["tokens_out"] = estimate_tokens(reduced)
+    return reduced, stats
+
+def describe(stats):
+    saved = stats["tokens_in"] - stats["tokens_out"]
+    pct = 100 * saved / stats["tokens_in"] if stats["tokens_in"] else 0
+    return (f"{stats['tokens_in']}→{stats['tokens_out']} tokens (-{pct:.0f}%), "
+            f"blocks {stats['blocks_kept']}/{stats['blocks_in']}")
@@ -0,0 +1,169 @@
+import json
+from datetime import datetime
+from html import escape
+from string import Template
+
+# Меняем при любой правке шаблонов: строки digests со старой версией
+# перерендерятся при просмотре (и бэкфилом ниже)
+RENDER_VERSION = 1
+
+# --- ШАБЛОНЫ (компилируются один раз при импорте) ---
+
+EMAIL_PAGE = Template("""
+    <html>
+    <body style="font-family: 'Helvetica Neue', Helvetica, Arial, sans-serif; color: #333; max-width: 600px; margin: 0 auto; padding: 20px;">
+        <div style="text-align: center; margin-bottom: 30px;">
+            <h1 style="color: #111; margin: 0;">Sunday Brief ☕</h1>
+            <p style="color: #666; font-size: 14px;">$date</p>
+        </div>
+        <div style="background: #eff6ff; padding: 25px; border-radius: 12px; margin-bottom: 30px; border-left: 6px solid #3b82f6;">
+            <h2 style="color: #1e3a8a; margin-top: 0; font-size: 18px;">🌍 The Big Picture</h2>
+            <p style="line-height: 1.6; font-size: 16px; color: #1e40af; margin-bottom: 0;">$big_picture</p>
+        </div>
+        <h3 style="border-bottom: 2px solid #eee; padding-bottom: 10px; margin-top: 30px;">📊 Key Strategic Insights</h3>
+        $trends
+        $actions
+        <div style="margin-top: 40px; padding-top: 20px; border-top: 1px solid #eee; text-align: center;">
+            <p style="color: #9ca3af; font-size: 12px;">by Sunday AI</p>
+        </div>
+    </body>
+    </html>
+""")
+EMAIL_TREND = Template("""
+        <div style="margin-bottom: 25px;">
+            <h4 style="margin: 0 0 8px 0; color: #111827; font-size: 16px; font-weight: 700;">$title</h4>
+            <p style="margin: 0; color: #4b5563; font-size: 15px; line-height: 1.5;">$insight</p>
+        </div>""")
+EMAIL_NO_TRENDS = "<p style='color: #777; font-style: italic;'>No major trends detected this week.</p>"
+EMAIL_ACTIONS = Template("""
+        <div style="background: #fff1f2; padding: 20px; border-radius: 12px; margin-top: 30px; border: 1px solid #fecdd3;">
+            <h3 style="color: #9f1239; margin-top: 0; font-size: 16px;">🚀 Action Items</h3>
+            <ul style="margin-bottom: 0; padding-left: 20px;">$items</ul></div>""")
+EMAIL_ACTION = Template("<li style='color: #881337; margin-bottom: 8px; font-size: 15px;'>$item</li>")
+
+# Классы (.big-picture-box, .insight-card, .action-item) определены в CSS дашбордов
+DASHBOARD_PAGE = Template("""<h3>🌍 The Big Picture</h3>
+<div class="big-picture-box">$big_picture</div>
+<hr>
+<h3>📊 Key Insights</h3>
+$trends
+<hr>
+<h3>🚀 Action Items</h3>
+$actions""")
+DASHBOARD_TREND = Template('<div class="insight-card"><div class="insight-title">$title</div><div class="insight-body">$insight</div></div>')
+DASHBOARD_NO_TRENDS = '<p class="insight-body"><em>No trends found.</em></p>'
+DASHBOARD_ACTION = Template('<div class="action-item">☐ $item</div>')
+
+TEXT_PAGE = Template("""SUNDAY BRIEF — $date
+
+THE BIG PICTURE
+$big_picture
+
+KEY INSIGHTS
+$trends
+$actions
+-- by Sunday AI
+""")
+
+# --- РЕНДЕРИНГ ---
+
+def normalize_brief(digest_row):
+    """
+    Приводит строку digests к формату брифа {big_picture, trends, action_items}.
+    Старые строки хранят structured_content строкой JSON или только списком трендов.
+    """
+    content = digest_row.get('structured_content') or {}
+    if isinstance(content, str):
+        try: content = json.loads(content)
+        except ValueError: content = {}
+    if isinstance(content, list):
+        content = {"trends": content}
+
+    brief = dict(content)
+    if not brief.get('big_picture'):
+        brief['big_picture'] = digest_row.get('summary_text') or ''
+    return brief
+
+def render_digest(digest_data, date=None):
+    """
+    Рендерит бриф за один проход в три артефакта: HTML письма, HTML дашборда и plain text.
+    Результат сохраняется в digests.rendered.
+    """
+    date_label = (date or datetime.now()).strftime('%B %d, %Y')
+    big_picture = digest_data.get('big_picture') or 'See details below.'
+    big_picture_html = escape(str(big_picture))
+
+    email_trends, dash_trends, text_trends = [], [], []
+    for t in digest_data.get('trends') or []:
+        title = str(t.get('title') or 'Insight')
+        insight = str(t.get('insight') or '')
+        fields = {"title": escape(title), "insight": escape(insight)}
+        email_trends.append(EMAIL_TREND.substitute(fields))
+        dash_trends.append(DASHBOARD_TREND.substitute(fields))
+        text_trends.append(f"* {title}\n  {insight}\n")
+
+    email_actions, dash_actions, text_actions = [], [], []
+    for act in digest_data.get('action_items') or []:
+        item = escape(str(act))
+        email_actions.append(EMAIL_ACTION.substitute(item=item))
+        dash_actions.append(DASHBOARD_ACTION.substitute(item=item))
+        text_actions.append(f"[ ] {act}")
+
+    email_html = EMAIL_PAGE.substitute(
+        date=date_label,
+        big_picture=big_picture_html,
+        trends="".join(email_trends) or EMAIL_NO_TRENDS,
+        actions=EMAIL_ACTIONS.substitute(items="".join(email_actions)) if email_actions else "",
+    )
+    dashboard_html = DASHBOARD_PAGE.substitute(
+        big_picture=big_picture_html,
+        trends="".join(dash_trends) or DASHBOARD_NO_TRENDS,
+        actions="".join(dash_actions),
+    )
+    text = TEXT_PAGE.substitute(
+        date=date_label,
+        big_picture=big_picture,
+        trends="\n".join(text_trends) or "No major trends detected this week.\n",
+        actions=("ACTION ITEMS\n" + "\n".join(text_actions) + "\n") if text_actions else "",
+    )
+
+    return {
+        "version": RENDER_VERSION,
+        "email_html": email_html,
+        "dashboard_html": dashboard_html,
+        "text": text,
+    }
+
+def get_rendered(digest_row):
+    """
+    Готовые артефакты из строки digests; для старых строк (без rendered
+    или со старой версией шаблонов) рендерит на лету.
+    """
+    rendered = digest_row.get('rendered')
+    if isinstance(rendered, dict) and rendered.get('version') == RENDER_VERSION:
+        return rendered
+    return render_digest(normalize_brief(digest_row))
+
+def backfill_rendered(supabase):
+    """Дорендеривает digests, у которых нет актуальных артефактов"""
+    updated = 0
+    res = supabase.table("digests") \
+        .select("id, summary_text, structured_content, rendered, created_at") \
+        .execute()
+    for row in res.data or []:
+        rendered = row.get('rendered')
+        if isinstance(rendered, dict) and rendered.get('version') == RENDER_VERSION:
+            continue
+        created = row.get('created_at')
+        date = datetime.fromisoformat(created[:19]) if created else None
+        artifacts = render_digest(normalize_brief(row), date)
+        supabase.table("digests").update({"rendered": artifacts}).eq("id", row['id']).execute()
+        updated += 1
+        if updated % 100 == 0:
+            print(f"  🖨️ Rendered {updated} digests...")
+    print(f"✅ Backfill done: {updated} digests rendered.")
+    return updated
+
+if __name__ == "__main__":
+    from pipeline import get_supabase
+    backfill_rendered(get_supabase())
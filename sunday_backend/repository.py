@@ -0,0 +1,70 @@
+# --- ТИПИЗИРОВАННЫЙ СЛОЙ ЧТЕНИЯ ---
+# select("*") тянет из raw_emails мегабайты HTML, которые пайплайну не нужны.
+# Здесь — легкие записи на __slots__ по таблицам, а каждый вызов явно перечисляет
+# нужные колонки: query(supabase, RawEmail, "id", "sender", ...).
+#
+# Записи ведут себя как dict на чтение (rec['topic'], rec.get('role')), поэтому
+# функции пайплайна, принимающие строки Supabase, работают с ними без изменений.
+# Обращение к невыбранной колонке — AttributeError/KeyError, а не тихий None.
+
+class Record:
+    __slots__ = ()
+    TABLE = None
+
+    @classmethod
+    def from_row(cls, row):
+        rec = cls.__new__(cls)
+        for name, value in row.items():
+            if name in cls.__slots__:
+                setattr(rec, name, value)
+        return rec
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__ if hasattr(self, name)}
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+class Profile(Record):
+    TABLE = "profiles"
+    __slots__ = ("id", "email", "personal_email", "inbox_email", "role", "focus_areas",
+                 "digest_day", "digest_time", "telegram_chat_id")
+
+class RawEmail(Record):
+    TABLE = "raw_emails"
+    __slots__ = ("id", "user_id", "sender", "recipient", "subject", "body_plain", "body_html",
+                 "body_html_ref", "received_at", "processing_status", "processed", "attempts", "content_hash",
+                 "created_at")
+
+class EmailSummary(Record):
+    TABLE = "email_summaries"
+    __slots__ = ("id", "user_id", "source_email_id", "topic", "summary", "category",
+                 "importance", "digest_id", "created_at")
+
+class Subscription(Record):
+    TABLE = "subscriptions"
+    __slots__ = ("id", "user_id", "sender_email", "is_active", "updated_at")
+
+def query(supabase, record_cls, *columns):
+    """table().select() только по перечисленным колонкам (проверяются по __slots__)"""
+    unknown = [c for c in columns if c not in record_cls.__slots__]
+    if not columns or unknown:
+        raise ValueError(f"{record_cls.__name__}: unknown or missing columns {unknown}")
+    return supabase.table(record_cls.TABLE).select(", ".join(columns))
+
+def records(record_cls, response):
+    """Ответ Supabase -> список записей"""
+    return [record_cls.from_row(row) for row in response.data or []]
+
+def first(record_cls, response):
+    rows = response.data or []
+    return record_cls.from_row(rows[0]) if rows else None
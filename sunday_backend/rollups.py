@@ -0,0 +1,156 @@
+import argparse
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+
+# --- НЕДЕЛЬНЫЕ РОЛЛАПЫ ДЛЯ ДАШБОРДА ---
+# Инкрементально сводит raw_emails и email_summaries в user_weekly_stats (migrations/009):
+# письма, отправители, распределение importance, доля шума — по пользователю и неделе.
+# 1. По водяному знаку находим (пользователь, неделя), в которые пришли новые строки.
+# 2. Эти недели пересчитываем целиком векторными group-by и upsert'им — повторный
+#    запуск идемпотентен, поэтому водяной знак сдвигается с запасом OVERLAP.
+
+STATE_NAME = "user_weekly_stats"
+PAGE_SIZE = 1000
+USER_CHUNK = 100
+UPSERT_CHUNK = 500
+TOP_SENDERS = 10
+OVERLAP = timedelta(minutes=10)  # строки, вставленные во время прошлого прогона
+
+SENDER_RE = r"([\w.+-]+@[\w-]+(?:\.[\w-]+)+)"
+
+def _fetch(supabase, table, columns, since=None, user_ids=None):
+    """Все строки таблицы (постранично), опционально с created_at >= since и по списку пользователей"""
+    chunks = [user_ids[i:i + USER_CHUNK] for i in range(0, len(user_ids), USER_CHUNK)] if user_ids else [None]
+    rows = []
+    for chunk in chunks:
+        offset = 0
+        while True:
+            q = supabase.table(table).select(columns).order("created_at").order("id")
+            if since is not None:
+                q = q.gte("created_at", since)
+            if chunk is not None:
+                q = q.in_("user_id", chunk)
+            page = q.range(offset, offset + PAGE_SIZE - 1).execute().data or []
+            rows.extend(page)
+            if len(page) < PAGE_SIZE:
+                break
+            offset += PAGE_SIZE
+    return pd.DataFrame(rows, columns=[c.strip() for c in columns.split(",")])
+
+def _with_week(df):
+    """Колонка week_start — понедельник недели created_at (UTC)"""
+    df = df.dropna(subset=["user_id", "created_at"]).copy()
+    created = pd.to_datetime(df["created_at"], utc=True, format="ISO8601")
+    df["week_start"] = (created.dt.tz_localize(None).dt.to_period("W-SUN").dt.start_time).dt.date
+    return df
+
+KEYS = ["user_id", "week_start"]
+
+def _counts_by(df, column):
+    """{(user_id, week_start): {значение column: count}} — счет векторный, в dict только результат"""
+    if df.empty:
+        return {}
+    counts = df.groupby(KEYS + [column]).size().rename("n").reset_index()
+    counts = counts.sort_values("n", ascending=False)
+    return {key: dict(zip(g[column], g["n"].tolist())) for key, g in counts.groupby(KEYS)}
+
+def aggregate(emails, summaries):
+    """
+    emails: user_id, sender, created_at; summaries: user_id, category, importance, created_at.
+    Возвращает DataFrame по (user_id, week_start) с колонками user_weekly_stats.
+    """
+    emails, summaries = _with_week(emails), _with_week(summaries)
+    pairs = set(zip(emails["user_id"], emails["week_start"])) | set(zip(summaries["user_id"], summaries["week_start"]))
+    if not pairs:
+        return pd.DataFrame(columns=KEYS)
+    index = pd.MultiIndex.from_tuples(sorted(pairs), names=KEYS)
+    out = pd.DataFrame(index=index)
+
+    senders = emails["sender"].fillna("").str.extract(SENDER_RE, expand=False)
+    emails = emails.assign(sender=senders.fillna(emails["sender"]).fillna("unknown").str.lower())
+    out["emails"] = emails.groupby(KEYS).size().reindex(index, fill_value=0)
+
+    importance = pd.to_numeric(summaries["importance"], errors="coerce").fillna(1).clip(1, 5).astype(int)
+    category = summaries["category"].fillna("Unknown")
+    summaries = summaries.assign(importance=importance, category=category,
+                                 noise=(category == "Noise") | (importance <= 2))
+    grouped = summaries.groupby(KEYS)
+    out["summaries"] = grouped.size().reindex(index, fill_value=0)
+    out["noise"] = grouped["noise"].sum().reindex(index, fill_value=0)
+    out["avg_importance"] = grouped["importance"].mean().reindex(index)
+
+    hist = summaries.groupby(KEYS + ["importance"]).size().unstack(fill_value=0)
+    hist = hist.reindex(index=index, columns=range(1, 6), fill_value=0)
+    out["importance_hist"] = hist.to_numpy().astype(int).tolist()
+
+    by_category, by_sender = _counts_by(summaries, "category"), _counts_by(emails, "sender")
+    out["categories"] = [by_category.get(key, {}) for key in index]
+    out["top_senders"] = [dict(list(by_sender.get(key, {}).items())[:TOP_SENDERS]) for key in index]
+
+    out = out.reset_index()
+    for col in ("emails", "summaries", "noise"):
+        out[col] = out[col].astype(int)
+    out["noise_ratio"] = np.where(out["summaries"] > 0, out["noise"] / out["summaries"].clip(lower=1), np.nan)
+    return out
+
+def _to_rows(df):
+    rows = []
+    for rec in df.to_dict("records"):
+        rec["week_start"] = rec["week_start"].isoformat()
+        for col in ("noise_ratio", "avg_importance"):
+            rec[col] = None if pd.isna(rec[col]) else round(float(rec[col]), 4)
+        rec["importance_hist"] = [int(x) for x in rec["importance_hist"]]
+        rec["updated_at"] = datetime.now(timezone.utc).isoformat()
+        rows.append(rec)
+    return rows
+
+def run(supabase, full=False):
+    """Пересчитывает затронутые недели; full=True — все недели всех пользователей"""
+    started = datetime.now(timezone.utc)
+    state = supabase.table("rollup_state").select("watermark").eq("name", STATE_NAME).execute().data
+    since = None if full or not state or not state[0]['watermark'] else state[0]['watermark']
+
+    users, touched = None, None
+    if since:
+        new = pd.concat([
+            _fetch(supabase, "raw_emails", "user_id, created_at", since),
+            _fetch(supabase, "email_summaries", "user_id, created_at", since),
+        ])
+        new = _with_week(new)
+        if new.empty:
+            print("📊 Rollups: nothing new.")
+            _save_watermark(supabase, started)
+            return 0
+        touched = set(zip(new["user_id"], new["week_start"]))
+        users = sorted({u for u, _ in touched})
+        # Недели пересчитываем целиком: берем все строки с начала самой ранней затронутой
+        since = datetime.combine(min(w for _, w in touched), datetime.min.time(), timezone.utc).isoformat()
+
+    emails = _fetch(supabase, "raw_emails", "user_id, sender, created_at", since, users)
+    summaries = _fetch(supabase, "email_summaries", "user_id, category, importance, created_at", since, users)
+    stats = aggregate(emails, summaries)
+    if touched is not None:
+        stats = stats[[key in touched for key in zip(stats["user_id"], stats["week_start"])]]
+
+    rows = _to_rows(stats)
+    for i in range(0, len(rows), UPSERT_CHUNK):
+        supabase.table("user_weekly_stats").upsert(rows[i:i + UPSERT_CHUNK], on_conflict="user_id,week_start").execute()
+    _save_watermark(supabase, started)
+    print(f"📊 Rollups: {len(rows)} user-weeks updated from {len(emails)} emails / {len(summaries)} summaries.")
+    return len(rows)
+
+def _save_watermark(supabase, started):
+    supabase.table("rollup_state").upsert({
+        "name": STATE_NAME,
+        "watermark": (started - OVERLAP).isoformat(),
+    }, on_conflict="name").execute()
+
+if __name__ == "__main__":
+    from pipeline import get_supabase
+
+    parser = argparse.ArgumentParser(description="Aggregate per-user weekly stats for the dashboard")
+    parser.add_argument("--full", action="store_true", help="пересчитать все недели")
+    args = parser.parse_args()
+    run(get_supabase(), full=args.full)
@@ -0,0 +1,158 @@
+import argparse
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import deadline
+from pipeline import get_supabase, refresh_draft, run_digest
+
+# --- ЧАСОВОЙ ЗАПУСК (digest_cron.yml) ---
+# Каждый шард крона берет своих пользователей (стабильный хэш id) и идет по plan():
+# перенесенные доставки, доставки этого часа, затем обновление черновиков.
+# Итог по пользователям пишется в run_logs — шаг merge сводит их weekly_digest.py --report.
+
+DEFAULT_DAY = "Sunday"
+DEFAULT_HOUR = "09"
+# Нового пользователя не начинаем, если от бюджета запуска осталось меньше
+USER_RESERVE_SECONDS = 180
+RUN_ID = os.environ.get("GITHUB_RUN_ID", "local")
+
+def shard_of(user_id, shard_count):
+    """Стабильный номер шарда по id профиля (не зависит от процесса, в отличие от hash())"""
+    digest = hashlib.sha1(str(user_id).encode()).hexdigest()
+    return int(digest, 16) % shard_count
+
+def parse_shard(value):
+    """'i/N' -> (i, N)"""
+    index, count = (int(x) for x in value.split("/"))
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"bad shard '{value}', expected i/N with 0 <= i < N")
+    return index, count
+
+def is_delivery_slot(user, now):
+    """Совпадает ли текущий час (UTC) с digest_day / digest_time пользователя"""
+    day = user.get('digest_day') or DEFAULT_DAY
+    hour = str(user.get('digest_time') or DEFAULT_HOUR)[:2]
+    return now.strftime("%A") == day and now.strftime("%H") == hour
+
+def load_backlog(supabase):
+    """Доставки, которые прошлый запуск не успел (migrations/012_run_budget.sql)"""
+    try:
+        res = supabase.table("run_backlog").select("user_id").order("created_at").execute()
+        return [r['user_id'] for r in res.data or []]
+    except Exception as e:
+        print(f"⚠️ run_backlog unavailable: {e}")
+        return []
+
+def defer(supabase, user_ids, reason):
+    if not user_ids:
+        return
+    rows = [{"user_id": uid, "task": "deliver", "reason": reason} for uid in user_ids]
+    try:
+        # ignore_duplicates: created_at остается от первого переноса — очередность сохраняется
+        supabase.table("run_backlog").upsert(rows, on_conflict="user_id", ignore_duplicates=True).execute()
+    except Exception as e:
+        print(f"⚠️ Could not defer {len(rows)} deliveries: {e}")
+
+def plan(users, backlog, now):
+    """Порядок работы: перенесенные доставки, доставки этого часа, затем обновление черновиков"""
+    known = {u['id'] for u in users}
+    carried = [uid for uid in backlog if uid in known]
+    carried_set = set(carried)
+    due = [u['id'] for u in users if is_delivery_slot(u, now) and u['id'] not in carried_set]
+    refresh = [u['id'] for u in users if not is_delivery_slot(u, now) and u['id'] not in carried_set]
+    return [(uid, "deliver") for uid in carried + due] + [(uid, "refresh") for uid in refresh]
+
+def log_event(supabase, user_id, status, shard, error_msg=None):
+    """Строка run_logs в формате weekly_digest.log_event: по ним merge сводит шарды"""
+    try:
+        supabase.table("run_logs").insert({
+            "user_id": user_id,
+            "status": status,
+            "emails_processed": 0,
+            "error_message": error_msg,
+            "run_id": RUN_ID,
+            "shard": shard
+        }).execute()
+    except Exception as e:
+        print(f"⚠️ run_logs write failed: {e}")
+
+def run_task(supabase, user_id, task, backlog, shard):
+    budget = deadline.current()
+    if not budget.allows(USER_RESERVE_SECONDS):
+        # Черновик доживет до следующего часа, а доставка уходит в run_backlog
+        if task == "deliver":
+            defer(supabase, [user_id], "budget")
+            log_event(supabase, user_id, "deferred", shard)
+        return "skipped"
+    try:
+        if task == "deliver":
+            # Время доставки: просто финализируем черновик
+            delivered = run_digest(user_id, incremental=True, raise_errors=True)
+            if not delivered and not budget.allows(USER_RESERVE_SECONDS):
+                # Черновик не успели дособрать внутри run_digest — доставим в следующий час
+                defer(supabase, [user_id], "budget")
+                log_event(supabase, user_id, "deferred", shard)
+                return "deferred"
+            if user_id in backlog:
+                supabase.table("run_backlog").delete().eq("user_id", user_id).execute()
+            if delivered:
+                log_event(supabase, user_id, "success", shard)
+            return "delivered" if delivered else "empty"
+        # Между доставками: доливаем новые саммари в черновик
+        refresh_draft(user_id)
+        return "refreshed"
+    except deadline.DeadlineExceeded as e:
+        # Бюджет кончился посреди вызова — чекпоинты целы, доставим в следующий час
+        print(f"⏳ {user_id}: {e}")
+        if task == "deliver":
+            defer(supabase, [user_id], "budget")
+            log_event(supabase, user_id, "deferred", shard)
+        return "deferred"
+    except Exception as e:
+        print(f"❌ Scheduler error for {user_id}: {e}")
+        log_event(supabase, user_id, "error", shard, str(e)[:500])
+        return "error"
+
+def main(shard=(0, 1), concurrency=1):
+    now = datetime.now(timezone.utc)
+    budget = deadline.start()
+    shard_index, shard_count = shard
+    shard_label = f"{shard_index}/{shard_count}"
+    print(f"🗓️ Sunday AI Scheduler | {now.strftime('%A %H:00')} UTC | shard {shard_label} | budget {budget}")
+
+    supabase = get_supabase()
+    if not supabase:
+        print("❌ Scheduler halted: Missing API Keys.")
+        return
+
+    users = supabase.table("profiles").select("id, digest_day, digest_time").execute()
+    my_users = [u for u in users.data or [] if shard_of(u['id'], shard_count) == shard_index]
+    if not my_users:
+        print("💤 No users.")
+        return
+
+    backlog = load_backlog(supabase)
+    work = plan(my_users, backlog, now)
+    print(f"👥 {len(my_users)} users in shard, {sum(1 for _, t in work if t == 'deliver')} deliveries due")
+
+    def run(item):
+        return run_task(supabase, item[0], item[1], backlog, shard_label)
+
+    # plan() уже упорядочил работу: пул берет задачи по порядку, доставки раньше черновиков
+    if concurrency > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(run, work))
+    else:
+        results = [run(item) for item in work]
+
+    counts = {r: results.count(r) for r in sorted(set(results))}
+    print(f"🏁 Scheduler done ({budget}): " + ", ".join(f"{k} {v}" for k, v in counts.items()))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sunday AI hourly scheduler: deliver in slot, refresh drafts otherwise")
+    parser.add_argument("--shard", type=parse_shard, default=(0, 1), help="i/N: обработать только свой шард пользователей")
+    parser.add_argument("--concurrency", type=int, default=1, help="пользователей параллельно внутри шарда")
+    args = parser.parse_args()
+    main(args.shard, args.concurrency)
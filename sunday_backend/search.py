@@ -0,0 +1,231 @@
+import heapq
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+
+from digest_index import headline
+
+# --- ПОЛНОТЕКСТОВЫЙ ПОИСК ПО БРИФАМ ---
+# "Что мои рассылки писали про X в прошлом месяце" — поиск по digests (summary_text +
+# structured_content) и email_summaries (topic + summary) одного пользователя.
+# Основной путь — Postgres: tsvector-колонки + GIN и RPC search_briefs (migrations/010);
+# индекс обновляется самим insert'ом.
+# SEARCH_LOCAL=1 — инвертированный индекс в памяти процесса (BM25) для стенда без миграции:
+# строится из Supabase при первом поиске, дальше дотягивает только новые строки по created_at.
+#
+# Результат в обоих случаях — список dict:
+# {kind: digest|summary, id, digest_id, title, snippet, created_at, rank}
+
+DEFAULT_LIMIT = 20
+PAGE_SIZE = 1000
+REFRESH_EVERY = 30  # сек между догрузками новых строк в локальный индекс
+SNIPPET_WORDS = 30
+TITLE_WEIGHT = 2  # слова заголовка (topic / big picture) весят как два вхождения
+
+TOKEN_RE = re.compile(r"\w{2,}")
+
+def tokenize(text):
+    return TOKEN_RE.findall((text or "").lower())
+
+def _strings(value):
+    """Все строковые значения вложенного JSON (как jsonb_to_tsvector(..., '["string"]'))"""
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, dict):
+        for v in value.values():
+            yield from _strings(v)
+    elif isinstance(value, list):
+        for v in value:
+            yield from _strings(v)
+
+def digest_document(row):
+    content = row.get('structured_content') or {}
+    if isinstance(content, str):
+        try:
+            content = json.loads(content)
+        except ValueError:
+            pass
+    return {
+        "kind": "digest", "id": str(row['id']), "digest_id": str(row['id']),
+        "title": headline(row), "created_at": row.get('created_at'),
+        "title_text": row.get('summary_text') or "",
+        "text": " ".join(_strings(content)),
+    }
+
+def summary_document(row):
+    return {
+        "kind": "summary", "id": str(row['id']),
+        "digest_id": str(row['digest_id']) if row.get('digest_id') else None,
+        "title": row.get('topic') or "Untitled", "created_at": row.get('created_at'),
+        "title_text": row.get('topic') or "",
+        "text": row.get('summary') or "",
+    }
+
+def snippet(text, terms, words=SNIPPET_WORDS):
+    """Окно из `words` слов вокруг первого совпадения, совпадения выделены **...**; "" — совпадений нет"""
+    tokens = (text or "").split()
+    first = next((i for i, t in enumerate(tokens) if terms & set(tokenize(t))), None)
+    if first is None:
+        return ""
+    start = max(0, first - words // 3)
+    window = [f"**{t}**" if terms & set(tokenize(t)) else t for t in tokens[start:start + words]]
+    return ("… " if start else "") + " ".join(window) + (" …" if start + words < len(tokens) else "")
+
+# --- POSTGRES ---
+
+class SupabaseSearch:
+    def __init__(self, supabase):
+        self.supabase = supabase
+
+    def search(self, user_id, text, limit=DEFAULT_LIMIT, since=None):
+        if not tokenize(text):
+            return []
+        rows = self.supabase.rpc("search_briefs", {
+            "p_user_id": user_id, "p_query": text, "p_limit": limit, "p_since": since,
+        }).execute().data or []
+        for row in rows:
+            if row['kind'] == "digest":
+                row['title'] = headline({"summary_text": row['title']})
+        return rows
+
+# --- ЛОКАЛЬНЫЙ ИНВЕРТИРОВАННЫЙ ИНДЕКС ---
+
+class InvertedIndex:
+    """
+    Индекс одного пользователя: term -> {doc_no: вес}, ранжирование BM25.
+    add() инкрементальный; повторный add того же (kind, id) заменяет документ.
+    Запрос — все слова обязательны (как websearch_to_tsquery без операторов).
+    """
+    K1, B = 1.2, 0.75
+
+    def __init__(self):
+        self.docs = []
+        self.lengths = []
+        self.postings = defaultdict(dict)
+        self.by_key = {}
+        self.total_length = 0
+
+    def __len__(self):
+        return len(self.by_key)
+
+    def _terms(self, doc):
+        counts = Counter(tokenize(doc['text']))
+        for term in tokenize(doc['title_text']):
+            counts[term] += TITLE_WEIGHT
+        return counts
+
+    def add(self, doc):
+        key = (doc['kind'], doc['id'])
+        if key in self.by_key:
+            self.remove(key)
+        counts = self._terms(doc)
+        n = len(self.docs)
+        self.docs.append(doc)
+        self.lengths.append(sum(counts.values()))
+        self.total_length += self.lengths[n]
+        for term, tf in counts.items():
+            self.postings[term][n] = tf
+        self.by_key[key] = n
+
+    def remove(self, key):
+        n = self.by_key.pop(key, None)
+        if n is None:
+            return
+        for term in self._terms(self.docs[n]):
+            postings = self.postings.get(term)
+            if postings is not None:
+                postings.pop(n, None)
+                if not postings:
+                    del self.postings[term]
+        self.total_length -= self.lengths[n]
+        self.docs[n], self.lengths[n] = None, 0
+
+    def search(self, text, limit=DEFAULT_LIMIT, since=None):
+        terms = list(dict.fromkeys(tokenize(text)))
+        if not terms or not self.by_key:
+            return []
+        lists = [self.postings.get(t) for t in terms]
+        if not all(lists):
+            return []
+        # Пересечение начинаем с самого короткого списка
+        order = sorted(range(len(terms)), key=lambda i: len(lists[i]))
+        candidates = set(lists[order[0]])
+        for i in order[1:]:
+            candidates.intersection_update(lists[i])
+            if not candidates:
+                return []
+
+        total = len(self.by_key)
+        avg = self.total_length / total
+        idf = [math.log(1 + (total - len(p) + 0.5) / (len(p) + 0.5)) for p in lists]
+        scored = []
+        for n in candidates:
+            doc = self.docs[n]
+            if since and (doc['created_at'] or "") < since:
+                continue
+            norm = self.K1 * (1 - self.B + self.B * self.lengths[n] / avg)
+            score = sum(w * p[n] * (self.K1 + 1) / (p[n] + norm) for w, p in zip(idf, lists))
+            scored.append((score, doc['created_at'] or "", n))
+
+        wanted = set(terms)
+        hits = []
+        for score, _, n in heapq.nlargest(limit, scored):
+            doc = self.docs[n]
+            body = doc['title_text'] if doc['kind'] == "digest" else doc['text']
+            hits.append({
+                "kind": doc['kind'], "id": doc['id'], "digest_id": doc['digest_id'],
+                "title": doc['title'], "created_at": doc['created_at'], "rank": round(score, 4),
+                "snippet": snippet(body, wanted) or snippet(doc['text'], wanted)
+                           or " ".join(body.split()[:SNIPPET_WORDS]),
+            })
+        return hits
+
+class LocalSearch:
+    """InvertedIndex на пользователя поверх Supabase; догружает строки новее водяного знака"""
+
+    def __init__(self, supabase):
+        self.supabase = supabase
+        self._indexes = {}
+        self._watermarks = {}
+        self._refreshed = {}
+        self._lock = threading.Lock()
+
+    def _fetch(self, table, columns, user_id, since):
+        rows, offset = [], 0
+        while True:
+            q = self.supabase.table(table).select(columns).eq("user_id", user_id)
+            if since:
+                q = q.gte("created_at", since)  # gte + замена по id: строки с тем же временем не теряются
+            page = q.order("created_at").order("id").range(offset, offset + PAGE_SIZE - 1).execute().data or []
+            rows.extend(page)
+            if len(page) < PAGE_SIZE:
+                return rows
+            offset += PAGE_SIZE
+
+    def refresh(self, user_id, force=False):
+        with self._lock:
+            if not force and time.monotonic() - self._refreshed.get(user_id, -REFRESH_EVERY) < REFRESH_EVERY:
+                return self._indexes[user_id]
+            index = self._indexes.setdefault(user_id, InvertedIndex())
+            since = self._watermarks.get(user_id)
+            digests = self._fetch("digests", "id, summary_text, structured_content, created_at", user_id, since)
+            summaries = self._fetch("email_summaries", "id, digest_id, topic, summary, created_at", user_id, since)
+            for doc in [digest_document(r) for r in digests] + [summary_document(r) for r in summaries]:
+                index.add(doc)
+                if doc['created_at'] and doc['created_at'] > (self._watermarks.get(user_id) or ""):
+                    self._watermarks[user_id] = doc['created_at']
+            self._refreshed[user_id] = time.monotonic()
+            return index
+
+    def search(self, user_id, text, limit=DEFAULT_LIMIT, since=None):
+        return self.refresh(user_id).search(text, limit, since)
+
+def get_search(supabase):
+    """SEARCH_LOCAL=1 — локальный индекс в памяти вместо RPC search_briefs"""
+    if os.environ.get("SEARCH_LOCAL"):
+        return LocalSearch(supabase)
+    return SupabaseSearch(supabase)
@@ -0,0 +1,156 @@
+import os
+import threading
+import time
+from email.utils import parseaddr
+
+from repository import query, Profile, Subscription
+
+# --- ИНДЕКС ПОДПИСОК НА ВЕБХУКЕ ---
+# Раньше вебхук разбирал и сохранял любое письмо, а summarize.main отбрасывал
+# неподписанных отправителей позже, с запросом в базу на каждое. Теперь процесс
+# вебхука держит в памяти inbox_email -> профиль и user_id -> {sender_email} и
+# проверяет конвертного отправителя до MIME-разбора и до любого запроса в базу:
+# чужое письмо отклоняется за микросекунды и не занимает ни хранилище, ни очередь.
+# Ящика нет в индексе (пользователь зарегистрировался после загрузки) — вебхук
+# ищет профиль в базе и кладет его сюда через remember().
+#
+# Обновление: раз в POLL_SECONDS доливаются строки новее водяного знака updated_at
+# (migrations/013), раз в FULL_REFRESH_SECONDS — полная перезагрузка (удаленные строки,
+# профили).
+# Новая подписка видна в пределах POLL_SECONDS.
+# Пропускаем всегда: пользователей без подписок (онбординг — еще нечего фильтровать)
+# и письма с personal_email пользователя (пересылки самому себе).
+# Индекс не загрузился — пропускаем все: лучше лишнее письмо, чем потерянное.
+# Обычные множества, а не фильтр Блума: подписок десятки тысяч, а Блум не умеет удалять.
+#
+# SENDER_FILTER=0 отключает фильтр.
+
+POLL_SECONDS = 30
+FULL_REFRESH_SECONDS = 600
+PAGE_SIZE = 1000
+
+def normalize_sender(value):
+    """'Name <A@B.com>' -> 'a@b.com' (как в summarize.main)"""
+    _, addr = parseaddr(value or "")
+    return (addr or value or "").strip().lower()
+
+class SenderIndex:
+    def __init__(self, supabase):
+        self.supabase = supabase
+        self._rows = {}         # subscription id -> (user_id, sender, is_active)
+        self._by_user = {}      # user_id -> {subscription id}
+        self._allowed = {}      # user_id -> {sender}, только активные; нет ключа — нет подписок
+        self._profiles = {}     # inbox_email -> {"id", "personal_email"}
+        self._watermark = None
+        self._loaded_at = None
+        self._polled_at = None
+        self._lock = threading.Lock()
+
+    def _pages(self, make_query):
+        rows, offset = [], 0
+        while True:
+            page = make_query().range(offset, offset + PAGE_SIZE - 1).execute().data or []
+            rows.extend(page)
+            if len(page) < PAGE_SIZE:
+                return rows
+            offset += PAGE_SIZE
+
+    def _fetch(self, since):
+        def make_query():
+            q = query(self.supabase, Subscription, "id", "user_id", "sender_email", "is_active", "updated_at")
+            if since:
+                q = q.gte("updated_at", since)  # gte: строки с тем же временем не теряются, применение идемпотентно
+            return q.order("updated_at").order("id")
+        return self._pages(make_query)
+
+    def _fetch_profiles(self):
+        rows = self._pages(lambda: query(self.supabase, Profile, "id", "inbox_email", "personal_email").order("id"))
+        return {normalize_sender(r['inbox_email']): {"id": r['id'], "personal_email": r.get('personal_email')}
+                for r in rows if r.get('inbox_email')}
+
+    def _apply(self, rows):
+        touched = set()
+        for r in rows:
+            if not r.get('user_id') or not r.get('sender_email'):
+                continue
+            old = self._rows.get(r['id'])
+            if old:
+                touched.add(old[0])
+                self._by_user.get(old[0], set()).discard(r['id'])
+            self._rows[r['id']] = (r['user_id'], normalize_sender(r['sender_email']), r.get('is_active') is not False)
+            self._by_user.setdefault(r['user_id'], set()).add(r['id'])
+            touched.add(r['user_id'])
+            if r.get('updated_at') and r['updated_at'] > (self._watermark or ""):
+                self._watermark = r['updated_at']
+        for user_id in touched:
+            ids = self._by_user.get(user_id)
+            if ids:
+                self._allowed[user_id] = {self._rows[i][1] for i in ids if self._rows[i][2]}
+            else:
+                self._by_user.pop(user_id, None)
+                self._allowed.pop(user_id, None)
+
+    def refresh(self, force=False):
+        if not force and self._recently_polled():
+            return
+        # Первую загрузку ждут все; дальше обновляет один запрос, остальные идут по старому снимку
+        if not self._lock.acquire(blocking=self._loaded_at is None):
+            return
+        try:
+            if not force and self._recently_polled():
+                return
+            full = force or self._loaded_at is None or time.monotonic() - self._loaded_at >= FULL_REFRESH_SECONDS
+            if full:
+                # Собираем рядом и подменяем одним присваиванием: читатели не видят полупустой индекс
+                fresh = SenderIndex(self.supabase)
+                fresh._apply(self._fetch(None))
+                profiles = self._fetch_profiles()
+                self._rows, self._by_user, self._watermark = fresh._rows, fresh._by_user, fresh._watermark
+                self._allowed = fresh._allowed
+                self._profiles = profiles
+                self._loaded_at = time.monotonic()
+                print(f"📋 Sender index loaded: {len(self._rows)} subscriptions, {len(self._allowed)} users, "
+                      f"{len(profiles)} inboxes")
+            else:
+                self._apply(self._fetch(self._watermark))
+        except Exception as e:
+            print(f"⚠️ Sender index refresh failed: {e}")
+        finally:
+            # И после неудачи: база лежит — не дергаем ее на каждом письме
+            self._polled_at = time.monotonic()
+            self._lock.release()
+
+    def _recently_polled(self):
+        return self._polled_at is not None and time.monotonic() - self._polled_at < POLL_SECONDS
+
+    def profile(self, inbox_email):
+        """Профиль владельца ящика из памяти или None (промах — искать в базе)"""
+        self.refresh()
+        return self._profiles.get(normalize_sender(inbox_email))
+
+    def remember(self, inbox_email, profile):
+        """Профиль, найденный в базе после промаха: следующее письмо в этот ящик обойдется без запроса"""
+        self._profiles[normalize_sender(inbox_email)] = {"id": profile['id'], "personal_email": profile.get('personal_email')}
+
+    def allows(self, user_id, sender, personal_email=None):
+        self.refresh()
+        allowed = self._allowed.get(user_id)
+        if self._loaded_at is None or allowed is None:
+            return True
+        sender = normalize_sender(sender)
+        if personal_email and sender == normalize_sender(personal_email):
+            return True
+        return sender in allowed
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_sender_index(supabase):
+    """Общий индекс процесса или None, если SENDER_FILTER=0"""
+    global _index
+    if os.environ.get("SENDER_FILTER", "1").lower() in ("0", "false", "no"):
+        return None
+    with _index_lock:
+        if _index is None:
+            _index = SenderIndex(supabase)
+        return _index
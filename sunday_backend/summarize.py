@@ -1,14 +1,16 @@
 import os
 import json
-import smtplib
-import requests
 import google.generativeai as genai
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 from supabase import create_client, Client
 from dotenv import load_dotenv
 from email.utils import parseaddr
 import markdown
+from outbox import enqueue, email_item, telegram_item
+from pipeline import digest_key
+from body_store import load_html
+from repository import query, records, first, Profile, RawEmail, Subscription
+from reducer import reduce_text, describe, SUMMARY_TOKENS
+import deadline
 
 load_dotenv()
 
@@ -17,54 +19,27 @@ SUPABASE_URL = os.environ.get("SUPABASE_URL")
 SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
 
-# Настройки доставки
-TG_TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN")
-EMAIL_USER = os.environ.get("EMAIL_USER")
-EMAIL_PASS = os.environ.get("EMAIL_PASS")
-SMTP_SERVER = os.environ.get("SMTP_SERVER", "smtp.gmail.com")
-SMTP_PORT = int(os.environ.get("SMTP_PORT", 587))
-
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 genai.configure(api_key=GEMINI_API_KEY)
 
-# --- ФУНКЦИИ ОТПРАВКИ ---
-
-def send_telegram_alert(chat_id, text):
-    """Отправляет сообщение в Telegram"""
-    if not TG_TOKEN:
-        print("⚠️ TG Error: TELEGRAM_BOT_TOKEN not found in .env")
-        return False
-    if not chat_id:
-        print("⚠️ TG Error: User has no Chat ID")
-        return False
-    
-    url = f"https://api.telegram.org/bot{TG_TOKEN}/sendMessage"
-    payload = {
-        "chat_id": chat_id,
-        "text": text,
-        "parse_mode": "Markdown"
-    }
+def fetch_html(email_id):
+    """HTML письма по требованию (для писем без body_plain)"""
+    row = first(RawEmail, query(supabase, RawEmail, "body_html", "body_html_ref", "body_plain").eq("id", email_id).execute())
+    if not row:
+        return ""
     try:
-        r = requests.post(url, json=payload)
-        if r.status_code == 200:
-            print(f"✈️ Telegram sent to {chat_id}")
-            return True
-        else:
-            print(f"❌ Telegram Error: {r.text}")
+        return load_html(row)
     except Exception as e:
-        print(f"❌ Telegram Exception: {e}")
-    return False
+        # blob: пропал файл или битое сжатие — суммаризируем тем текстом, что есть
+        print(f"⚠️ HTML body unavailable for {email_id}: {e}")
+        return row.get('body_plain') or ""
 
-def send_email_digest(to_email, subject, markdown_body):
-    """Отправляет дайджест на почту"""
-    if not EMAIL_USER or not EMAIL_PASS:
-        print("⚠️ Email Error: EMAIL_USER or EMAIL_PASS not found in .env")
-        return False
+# --- ШАБЛОН ПИСЬМА ---
 
-    try:
-        html_content = markdown.markdown(markdown_body)
-        
-        full_html = f"""
+def build_digest_html(subject, markdown_body):
+    """HTML письма — один раз на письмо-источник, а не на каждого получателя"""
+    html_content = markdown.markdown(markdown_body or "")
+    return f"""
         <html>
         <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
             <h2 style="color: #2e86de;">☀️ Sunday Digest: {subject}</h2>
@@ -76,34 +51,72 @@ def send_email_digest(to_email, subject, markdown_body):
         </html>
         """
 
-        msg = MIMEMultipart()
-        
-        # ⚠️ ВАЖНОЕ ИЗМЕНЕНИЕ: Отправляем как Alias
-        msg['From'] = "Sunday AI <bot@sundayai.dev>"
-        
-        msg['To'] = to_email
-        msg['Subject'] = f"☀️ Digest: {subject}"
-        msg.attach(MIMEText(full_html, 'html'))
-
-        server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
-        server.starttls()
-        # Логинимся под основной почтой (nikita...), чтобы SMTP пустил
-        server.login(EMAIL_USER, EMAIL_PASS)
-        server.sendmail(EMAIL_USER, to_email, msg.as_string())
-        server.quit()
-        
-        print(f"📧 Email sent to {to_email}")
-        return True
+# --- FAN-OUT ПО ПОЛУЧАТЕЛЯМ ---
+
+def fan_out(email_obj, ai_data, recipients):
+    """
+    Одна вставка digests на всех получателей и одна вставка их доставок в outbox.
+    Отправляет outbox.py (Telegram под лимитом 30 msg/s, email по переиспользуемым SMTP-соединениям).
+    False — дайджесты не сохранились: ничего не ставим в очередь, письмо повторится следующим запуском.
+    Повтор после падения до processed=True не плодит дубли: дайджест ищется по idempotency_key,
+    доставка — по dedupe_key (как в pipeline.deliver_brief).
+    """
+    subject = email_obj.get('subject')
+    # "email:", а не "raw:": недельный дайджест из одного письма (weekly_digest) — другой дайджест
+    keys = {user['id']: digest_key(user['id'], [f"email:{email_obj['id']}"]) for user in recipients}
+
+    # А. Сохраняем в базу (для Сайта) — одним запросом
+    digest_rows = [{
+        "user_id": user['id'],
+        "raw_email_id": email_obj['id'],
+        "subject": subject,
+        "summary_text": ai_data.get('summary_text', 'Error'),
+        "telegram_text": ai_data.get('telegram_text', 'Error'),
+        "is_sent": False,
+        "idempotency_key": keys[user['id']]
+    } for user in recipients]
+    try:
+        supabase.table("digests").upsert(digest_rows, on_conflict="idempotency_key", ignore_duplicates=True).execute()
+        # Вставленные и созданные прошлым запуском — одним запросом
+        saved = supabase.table("digests").select("id, idempotency_key") \
+            .in_("idempotency_key", list(keys.values())).execute().data or []
+        digest_ids = {row['idempotency_key']: row['id'] for row in saved}
+        print(f"   💾 Saved {len(saved)} digests to DB")
     except Exception as e:
-        print(f"❌ Email Sending Error: {e}")
+        # Без digest_id доставки не связать с дайджестом — не отправляем
+        print(f"   ❌ DB Save error, delivery postponed: {e}")
         return False
 
+    # Б + В. Telegram и Email — в outbox, тексты собираются один раз
+    tg_msg = f"{ai_data.get('telegram_text')}\n\n🔗 [Читать на сайте](https://sunday-digest.streamlit.app)"
+    full_html = build_digest_html(subject, ai_data.get('summary_text'))
+
+    items = []
+    for user in recipients:
+        digest_id = digest_ids.get(keys[user['id']])
+        if digest_id is None:
+            print(f"   ⚠️ Digest for user {user.get('email')} was not saved, skipping delivery")
+            continue
+        tg_id = user.get('telegram_chat_id')
+        user_email = user.get('email')
+        if tg_id:
+            items.append(telegram_item(tg_id, tg_msg, digest_id, dedupe_key=f"digest:{digest_id}:telegram"))
+        else:
+            print(f"   ⚠️ No Telegram ID for user {user_email}")
+        # ⚠️ Отправляем как Alias; логинится SMTP под основной почтой
+        items.append(email_item(user_email, f"☀️ Digest: {subject}", full_html, digest_id,
+                                from_addr="Sunday AI <bot@sundayai.dev>", dedupe_key=f"digest:{digest_id}:email"))
+    enqueue(supabase, items)
+    return True
+
 # --- ОСНОВНАЯ ЛОГИКА ---
 
 def generate_summary(text):
     model = genai.GenerativeModel("gemini-2.5-pro")
 
-    safe_text = text[:30000] if text else "No text"
+    safe_text, stats = reduce_text(text, SUMMARY_TOKENS)
+    print(f"✂️ Body reduced: {describe(stats)}")
+    safe_text = safe_text or "No text"
     
     prompt = f"""
     Ты - личный ассистент. Сделай выжимку из текста письма.
@@ -116,7 +129,9 @@ def generate_summary(text):
     Верни ТОЛЬКО JSON.
     """
     try:
-        response = model.generate_content(prompt)
+        response = model.generate_content(
+            prompt, request_options={"timeout": deadline.current().timeout(deadline.LLM_TIMEOUT)}
+        )
         return response.text
     except Exception as e:
         print(f"⚠️ AI Error: {e}")
@@ -127,11 +142,11 @@ def main():
     print("📋 Loading subscriptions & profiles...")
     
     try:
-        all_subs = supabase.table("subscriptions").select("*").execute().data
+        all_subs = query(supabase, Subscription, "user_id", "sender_email", "is_active").execute().data
         user_ids_list = list(set([s['user_id'] for s in all_subs if s.get('user_id')]))
         
         if user_ids_list:
-            profiles_resp = supabase.table("profiles").select("id, email, telegram_chat_id").in_("id", user_ids_list).execute()
+            profiles_resp = query(supabase, Profile, "id", "email", "telegram_chat_id").in_("id", user_ids_list).execute()
             profiles_map = {p['id']: p for p in profiles_resp.data}
         else:
             profiles_map = {}
@@ -156,8 +171,9 @@ def main():
         return
 
     # 2. ИЩЕМ ПИСЬМА
-    response = supabase.table("raw_emails").select("*").eq("processed", False).execute()
-    emails = response.data
+    # HTML не тянем: он нужен, только если у письма нет body_plain
+    response = query(supabase, RawEmail, "id", "sender", "subject", "body_plain").eq("processed", False).execute()
+    emails = records(RawEmail, response)
 
     if not emails:
         print("💤 No new emails.")
@@ -181,7 +197,7 @@ def main():
         
         print(f"✅ Sending to {len(recipients)} recipients...")
 
-        content = email_obj.get('body_plain') or email_obj.get('body_html') or ""
+        content = email_obj.get('body_plain') or fetch_html(email_obj['id'])
         ai_raw = generate_summary(content)
         
         if not ai_raw:
@@ -196,36 +212,8 @@ def main():
             continue
 
         # 3. РАССЫЛКА И СОХРАНЕНИЕ
-        for user in recipients:
-            uid = user['id']
-            tg_id = user.get('telegram_chat_id')
-            user_email = user.get('email')
-            
-            # А. Сохраняем в базу (для Сайта)
-            digest_data = {
-                "user_id": uid,
-                "raw_email_id": email_obj['id'],
-                "subject": email_obj.get('subject'),
-                "summary_text": ai_data.get('summary_text', 'Error'),
-                "telegram_text": ai_data.get('telegram_text', 'Error'),
-                "is_sent": True
-            }
-            try:
-                supabase.table("digests").insert(digest_data).execute()
-                print(f"   💾 Saved to DB for {user_email}")
-            except Exception as e:
-                print(f"   ❌ DB Save error: {e}")
-
-            # Б. Отправляем в Telegram
-            if tg_id:
-                tg_msg = f"{ai_data.get('telegram_text')}\n\n🔗 [Читать на сайте](https://sunday-digest.streamlit.app)"
-                send_telegram_alert(tg_id, tg_msg)
-            else:
-                print(f"   ⚠️ No Telegram ID for user {user_email}")
-            
-            # В. Отправляем на Email
-            if user_email:
-                send_email_digest(user_email, email_obj.get('subject'), ai_data.get('summary_text'))
+        if not fan_out(email_obj, ai_data, recipients):
+            continue
 
         supabase.table("raw_emails").update({"processed": True}).eq("id", email_obj['id']).execute()
 
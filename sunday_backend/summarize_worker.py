@@ -0,0 +1,32 @@
+import argparse
+import threading
+
+from pipeline import get_supabase, get_client, cook_raw_emails
+from email_queue import make_worker_id
+
+# Горизонтальные суммаризаторы: можно запускать сколько угодно процессов
+# (и потоков в каждом) — очередь raw_emails раздает письма без дублей.
+
+def main():
+    parser = argparse.ArgumentParser(description="Sunday AI summarizer worker")
+    parser.add_argument("--workers", type=int, default=1, help="потоков в этом процессе")
+    parser.add_argument("--user", default=None, help="только письма этого user_id")
+    parser.add_argument("--batch", type=int, default=5, help="писем за один claim")
+    args = parser.parse_args()
+
+    if not get_supabase() or not get_client():
+        print("❌ Worker halted: Missing API Keys.")
+        return
+
+    results = [0] * args.workers
+
+    def work(n):
+        results[n] = cook_raw_emails(args.user, worker_id=make_worker_id(n), batch_size=args.batch)
+
+    threads = [threading.Thread(target=work, args=(n,)) for n in range(args.workers)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    print(f"🏁 Summarized {sum(results)} emails with {args.workers} worker(s).")
+
+if __name__ == "__main__":
+    main()
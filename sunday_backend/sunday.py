@@ -0,0 +1,210 @@
+"""
+Единая точка входа бэкенда: каждый этап пайплайна запускается и профилируется отдельно.
+
+    python sunday.py ingest     [--limit N] [--dry-run]            # IMAP -> raw_emails
+    python sunday.py summarize  [--workers 4] [--user UUID]        # raw_emails -> email_summaries
+    python sunday.py synthesize [--workers 4] [--user UUID]        # email_summaries -> digests
+    python sunday.py deliver    [--workers 8] [--limit N]          # delivery_outbox -> email/Telegram
+
+Общие флаги: --workers, --user, --dry-run, --limit, --profile [DIR], --budget SECONDS.
+--profile пишет DIR/<stage>-<время>.prof (cProfile всех рабочих потоков, открывается
+snakeviz/pstats) и печатает топ функций и пик памяти по tracemalloc.
+--budget задает бюджет времени этапа (иначе RUN_BUDGET_SECONDS, см. deadline.py).
+"""
+import argparse
+import cProfile
+import math
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import deadline
+
+# --- ПРОФИЛИРОВАНИЕ ---
+
+class StageProfile:
+    """
+    cProfile + tracemalloc на время этапа. cProfile видит только свой поток,
+    поэтому рабочие функции оборачиваются через wrap() — у каждого потока свой
+    профайлер, в конце все сливаются в один .prof. out_dir=None — профилирование выключено.
+    """
+
+    def __init__(self, stage, out_dir=None, top=15):
+        self.stage = stage
+        self.out_dir = out_dir
+        self.top = top
+        self._profiles = []
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        if self.out_dir:
+            tracemalloc.start()
+            self._main = cProfile.Profile()
+            self._main.enable()
+        return self
+
+    def wrap(self, fn):
+        if not self.out_dir:
+            return fn
+
+        def profiled(*args, **kwargs):
+            profile = cProfile.Profile()
+            profile.enable()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                profile.disable()
+                with self._lock:
+                    self._profiles.append(profile)
+        return profiled
+
+    def __exit__(self, *exc):
+        if not self.out_dir:
+            return False
+        self._main.disable()
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        stats = pstats.Stats(self._main)
+        for profile in self._profiles:
+            stats.add(profile)
+        os.makedirs(self.out_dir, exist_ok=True)
+        path = os.path.join(self.out_dir, f"{self.stage}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.prof")
+        stats.dump_stats(path)
+
+        print(f"\n📊 Profile: {path}")
+        stats.sort_stats("cumulative").print_stats(self.top)
+        print(f"🧠 Peak traced memory: {peak / 1_000_000:.1f} MB")
+        for stat in snapshot.statistics("lineno")[:10]:
+            print(f"    {stat}")
+        return False
+
+def run_parallel(fn, items, workers, profile):
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        return list(pool.map(profile.wrap(fn), items))
+
+# --- ЭТАПЫ ---
+
+def stage_ingest(args, profile):
+    from collect_emails import fetch_emails
+
+    if args.user:
+        print("ℹ️ ingest reads the shared IMAP inbox; --user is ignored.")
+    return fetch_emails(limit=args.limit, dry_run=args.dry_run)
+
+def stage_summarize(args, profile):
+    from pipeline import get_supabase, get_client, cook_raw_emails
+    from email_queue import get_email_queue, make_worker_id
+
+    supabase = get_supabase()
+    if args.dry_run:
+        pending = get_email_queue(supabase).pending_count(args.user) if supabase else 0
+        print(f"🧪 {pending} emails waiting for the Junior Chef.")
+        return pending
+    if not supabase or not get_client():
+        print("❌ Summarize halted: Missing API Keys.")
+        return 0
+
+    # Очередь раздает письма без дублей; limit делим между потоками
+    per_worker = math.ceil(args.limit / args.workers) if args.limit else None
+    results = run_parallel(
+        lambda n: cook_raw_emails(args.user, worker_id=make_worker_id(n), batch_size=args.batch, limit=per_worker),
+        range(args.workers), args.workers, profile,
+    )
+    return sum(results)
+
+def stage_synthesize(args, profile):
+    from pipeline import get_supabase, get_client, run_digest, fetch_pending_summaries, get_draft
+    from repository import query, records, Profile
+
+    supabase = get_supabase()
+    if not supabase:
+        print("❌ Synthesize halted: Missing API Keys.")
+        return 0
+    if args.user:
+        user_ids = [args.user]
+    else:
+        user_ids = [p['id'] for p in records(Profile, query(supabase, Profile, "id").execute())]
+    if args.limit:
+        user_ids = user_ids[:args.limit]
+
+    if args.dry_run:
+        for user_id in user_ids:
+            pending = fetch_pending_summaries(user_id)
+            draft = get_draft(user_id)
+            print(f"  🧪 {user_id}: {len(pending)} pending summaries, draft: {'yes' if draft else 'no'}")
+        return len(user_ids)
+    if not get_client():
+        print("❌ Synthesize halted: Missing API Keys.")
+        return 0
+
+    results = run_parallel(lambda uid: run_digest(uid, incremental=args.incremental),
+                           user_ids, args.workers, profile)
+    return sum(1 for r in results if r)
+
+def stage_deliver(args, profile):
+    from pipeline import get_supabase
+    from outbox import DeliveryWorker, preview, BATCH_SIZE
+
+    supabase = get_supabase()
+    if not supabase:
+        print("❌ Deliver halted: Missing API Keys.")
+        return 0
+    if args.user:
+        print("ℹ️ the outbox is shared across users; --user is ignored.")
+    if args.dry_run:
+        return len(preview(supabase, args.limit or BATCH_SIZE))
+
+    worker = DeliveryWorker(supabase, workers=args.workers)
+    # Отправки идут в пуле воркера — профилируем и их
+    worker._deliver = profile.wrap(worker._deliver)
+    return worker.run(loop=args.loop, max_items=args.limit)
+
+STAGES = {
+    "ingest": (stage_ingest, "IMAP inbox -> raw_emails"),
+    "summarize": (stage_summarize, "raw_emails -> email_summaries (Junior Chef)"),
+    "synthesize": (stage_synthesize, "email_summaries -> digests (Head Chef)"),
+    "deliver": (stage_deliver, "delivery_outbox -> email / Telegram"),
+}
+
+def build_parser():
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--workers", type=int, default=1, help="параллельных потоков")
+    common.add_argument("--user", default=None, help="только этот user_id")
+    common.add_argument("--dry-run", action="store_true", help="ничего не писать и не отправлять")
+    common.add_argument("--limit", type=int, default=None, help="максимум элементов за запуск")
+    common.add_argument("--profile", nargs="?", const="profiles", default=None, metavar="DIR",
+                        help="cProfile + tracemalloc этапа (по умолчанию в ./profiles)")
+    common.add_argument("--budget", type=float, default=None, metavar="SECONDS",
+                        help="бюджет времени этапа (по умолчанию RUN_BUDGET_SECONDS)")
+
+    parser = argparse.ArgumentParser(prog="sunday", description="Sunday AI backend")
+    sub = parser.add_subparsers(dest="stage", required=True)
+    for name, (_, help_text) in STAGES.items():
+        stage = sub.add_parser(name, parents=[common], help=help_text)
+        if name == "summarize":
+            stage.add_argument("--batch", type=int, default=5, help="писем за один claim")
+        if name == "synthesize":
+            stage.add_argument("--incremental", action="store_true", help="финализировать черновики")
+        if name == "deliver":
+            stage.add_argument("--loop", action="store_true", help="не выходить, когда outbox пуст")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    run, _ = STAGES[args.stage]
+    deadline.start(args.budget)
+
+    started = time.perf_counter()
+    with StageProfile(args.stage, args.profile) as profile:
+        result = run(args, profile)
+    print(f"🏁 {args.stage}: {result} in {time.perf_counter() - started:.1f}s")
+    return result
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+from boilerplate import BoilerplateTrimmer, contains_boilerplate, count_boilerplate
+
+PROSE = (
+    "The quarterly overview online shows that the spread online between bond yields widened again. "
+    "Analysts who review online retail data already expect rates to stay flat, and the readership "
+    "of the annual review grew after editors reshared the preview with subscribers.\n\n"
+    "Meanwhile, the unsubscribed accounts were treated as churn in the overview."
+)
+
+def test_phrases_match_whole_words_only():
+    for text in ("overview online", "review online", "spread online", "reshared this newsletter"):
+        assert not contains_boilerplate(text), text
+    assert count_boilerplate(PROSE) == 0
+
+def test_clean_prose_is_left_intact():
+    text, stats = BoilerplateTrimmer().trim(PROSE)
+    assert text == PROSE
+    assert stats["stripped"] == 0
+    assert stats["cutoff"] is None
+
+def test_strip_phrase_is_removed_and_paragraphs_kept():
+    text, stats = BoilerplateTrimmer().trim("View online | Rates held.\n\nMarkets rallied on the news.")
+    assert stats["stripped"] == 1
+    assert text == "Rates held.\n\nMarkets rallied on the news."
+
+def test_footer_is_cut_in_second_half():
+    body = "Markets rallied on the news and bond yields fell. " * 4
+    text, stats = BoilerplateTrimmer().trim(body + "You are receiving this because you signed up. Unsubscribe")
+    assert stats["cutoff"] == "You are receiving this"
+    assert text == body.strip()
+
+def test_cutoff_phrase_in_first_half_is_content():
+    text, stats = BoilerplateTrimmer().trim("How to unsubscribe from a gym contract: read the fine print first.")
+    assert stats["cutoff"] is None
+    assert "unsubscribe" in text
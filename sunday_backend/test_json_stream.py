@@ -0,0 +1,39 @@
+import json
+
+from json_stream import BriefStream
+
+BRIEF = {
+    "big_picture": "Rates \"on hold\", chips {up} and [down] \\ sideways",
+    "trends": [
+        {"title": "AI chips", "details": "Supply \"tight\" } still"},
+        {"title": "Rates", "details": "Flat, for now ]"},
+    ],
+    "quick_hits": ["ignored"],
+}
+
+def feed_in_chunks(text, size):
+    stream, pieces = BriefStream(), []
+    for i in range(0, len(text), size):
+        pieces += stream.feed(text[i:i + size])
+    return stream, pieces
+
+def test_pieces_are_the_same_for_any_chunk_size():
+    text = "```json\n" + json.dumps(BRIEF, ensure_ascii=False) + "\n```"
+    expected = [("big_picture", BRIEF["big_picture"])] + [("trends", t) for t in BRIEF["trends"]]
+    for size in (1, 2, 3, 7, len(text)):
+        stream, pieces = feed_in_chunks(text, size)
+        assert pieces == expected, size
+        assert stream.snapshot() == {"big_picture": BRIEF["big_picture"], "trends": BRIEF["trends"]}
+
+def test_escaped_quote_split_across_chunks():
+    stream = BriefStream()
+    assert stream.feed('{"big_picture": "say \\') == []
+    assert stream.feed('"hi\\"') == []
+    assert stream.feed('"}') == [("big_picture", 'say "hi"')]
+
+def test_on_piece_callback_and_unfinished_item():
+    seen = []
+    stream = BriefStream(on_piece=lambda key, value: seen.append((key, value)))
+    stream.feed('{"trends": [{"title": "A"}, {"title": "B"')
+    assert seen == [("trends", {"title": "A"})]
+    assert stream.snapshot() == {"trends": [{"title": "A"}]}
@@ -0,0 +1,47 @@
+from reducer import reduce_text, density, estimate_tokens, CHARS_PER_TOKEN
+
+ARTICLE = [
+    "Central banks kept rates flat this week, and the overview from analysts points to a slower path of cuts.",
+    "Analysts review online retail sales weekly; demand is holding up and the spread online narrowed.",
+    "Founders are raising smaller rounds, and investors now ask for revenue before they commit fresh capital.",
+]
+
+def test_clean_prose_is_not_boilerplate():
+    for block in ARTICLE:
+        assert density(block) > 0
+    text, stats = reduce_text("\n\n".join(ARTICLE), 1000)
+    assert stats["boilerplate_blocks"] == 0
+    assert text == "\n\n".join(ARTICLE)
+
+def test_short_footer_block_is_dropped():
+    body = "\n\n".join(ARTICLE + ["Unsubscribe | Manage your preferences"])
+    text, stats = reduce_text(body, 1000)
+    assert stats["boilerplate_blocks"] == 1
+    assert "Unsubscribe" not in text
+
+def test_budget_keeps_densest_blocks_in_original_order():
+    links = "\n".join(f"https://click.example.com/track?u={i}" for i in range(8))
+    body = "\n\n".join([ARTICLE[0], links, ARTICLE[1], ARTICLE[2]])
+    budget = (len(ARTICLE[0]) + len(ARTICLE[2]) + 4) // CHARS_PER_TOKEN
+    text, stats = reduce_text(body, budget)
+    assert stats["tokens_out"] <= budget
+    assert "click.example.com" not in text
+    kept = [block for block in ARTICLE if block in text]
+    assert kept and kept == [block for block in ARTICLE if block in kept]
+    assert text == "\n\n".join(kept)
+
+def test_oversized_block_is_cut_to_budget():
+    block = " ".join(["market"] * 400)
+    text, stats = reduce_text(block, 50)
+    assert text == block[:50 * CHARS_PER_TOKEN]
+    assert stats["blocks_kept"] == 1
+
+def test_repeated_lines_are_dropped():
+    text, stats = reduce_text("\n\n".join([ARTICLE[0], ARTICLE[1], ARTICLE[0]]), 1000)
+    assert stats["repeated_lines"] == 1
+    assert text.count(ARTICLE[0]) == 1
+
+def test_empty_text():
+    assert reduce_text("", 100) == ("", {"tokens_in": 0, "tokens_out": 0, "blocks_in": 0, "blocks_kept": 0,
+                                         "repeated_lines": 0, "boilerplate_blocks": 0})
+    assert estimate_tokens("abcde") == 2
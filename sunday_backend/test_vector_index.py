@@ -0,0 +1,84 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from vector_index import VectorIndex
+
+class FakeQuery:
+    """Минимальный построитель запросов supabase: eq/neq/gte/order/range по списку строк"""
+    def __init__(self, rows):
+        self.rows = rows
+        self.filters = []
+        self.bounds = None
+
+    def select(self, *_):
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda r: r.get(column) == value)
+        return self
+
+    def neq(self, column, value):
+        self.filters.append(lambda r: r.get(column) != value)
+        return self
+
+    def gte(self, column, value):
+        self.filters.append(lambda r: r.get(column) >= value)
+        return self
+
+    def order(self, *_):
+        return self
+
+    def range(self, start, end):
+        self.bounds = (start, end)
+        return self
+
+    def execute(self):
+        rows = sorted((r for r in self.rows if all(f(r) for f in self.filters)), key=lambda r: (r['created_at'], r['id']))
+        start, end = self.bounds
+        return type("Result", (), {"data": rows[start:end + 1]})()
+
+class FakeSupabase:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def table(self, name):
+        assert name == "email_summaries"
+        return FakeQuery(self.rows)
+
+def row(id, topic, created_at, category="Tech"):
+    return {"id": id, "user_id": "u1", "topic": topic, "summary": f"{topic} summary", "category": category,
+            "created_at": created_at}
+
+def test_add_and_search(tmp_path):
+    index = VectorIndex("u1", str(tmp_path))
+    assert index.add("1", "nvidia chips supply shortage", topic="chips")
+    assert index.add("2", "central bank keeps interest rates flat", topic="rates")
+    assert not index.add("1", "nvidia chips supply shortage")
+    hits = index.search("chips supply from nvidia", k=1)
+    assert [h['id'] for h in hits] == ["1"]
+    assert index.search("chips supply from nvidia", exclude={"1"}, min_similarity=0.9) == []
+
+def test_index_reopens_from_disk(tmp_path):
+    VectorIndex("u1", str(tmp_path)).add("1", "nvidia chips supply shortage")
+    index = VectorIndex("u1", str(tmp_path))
+    assert len(index) == 1
+    assert index.search("nvidia chips")[0]['id'] == "1"
+
+def test_sync_picks_up_late_rows_inside_overlap_without_duplicates(tmp_path):
+    rows = [row("a", "chips demand", "2026-10-19T10:00:00+00:00"),
+            row("b", "noise promo", "2026-10-19T10:01:00+00:00", category="Noise")]
+    supabase = FakeSupabase(rows)
+    index = VectorIndex("u1", str(tmp_path))
+    assert index.sync(supabase, force=True) == 1
+
+    # Живая вставка новее, потом коммит другого воркера с более ранним created_at
+    index.add_summary(row("c", "rates outlook", "2026-10-19T10:05:00+00:00"))
+    rows.append(row("c", "rates outlook", "2026-10-19T10:05:00+00:00"))
+    rows.append(row("d", "startup funding", "2026-10-19T10:03:00+00:00"))
+    rows.append(row("old", "old history", "2026-10-18T09:00:00+00:00"))
+
+    assert index.sync(supabase, force=True) == 1
+    assert sorted(m['id'] for m in index.meta) == ["a", "c", "d"]
+    assert index.sync(supabase, force=True, full=True) == 1
+    assert sorted(m['id'] for m in index.meta) == ["a", "c", "d", "old"]
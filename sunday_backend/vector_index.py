@@ -0,0 +1,373 @@
+import heapq
+import json
+import math
+import os
+import threading
+import time
+import zlib
+from collections import Counter
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from search import tokenize
+
+# --- ВЕКТОРНЫЙ ИНДЕКС САММАРИ ---
+# "Похожие прошлые саммари" без LLM: для related coverage в дашборде и как prior context
+# для Head Chef (pipeline.prior_context).
+# 1. Эмбеддинг — хэшированные n-граммы (слова, биграммы, символьные 4-граммы) со знаком,
+#    tf сублинейный, вектор нормирован: косинус = скалярное произведение. Только CPU.
+# 2. Индекс на пользователя в VECTOR_INDEX_DIR:
+#      <user>.vec    float32 [capacity, DIM], np.memmap — растет удвоением
+#      <user>.jsonl  метаданные строк (id, topic, summary, created_at), append-only;
+#                    число строк — источник истины для n (вектор пишется раньше строки)
+#      <user>.graph  int32 [capacity, GRAPH_M] — соседи, появляется после GRAPH_MIN векторов
+# 3. Поиск: до GRAPH_MIN — полный перебор (матрица @ запрос, миллисекунды на десятках тысяч);
+#    дальше — граф ближайших соседей в стиле HNSW (один слой, жадный beam search).
+#    Граф достраивается порциями по GRAPH_BUILD_STEP вершин на каждый add(), пока он
+#    не догнал индекс — поиск идет перебором; сразу целиком — build_graph() / --build-graph.
+# Писатель один на каталог (потоки одного процесса — под локом). sync() дотягивает из
+# email_summaries строки после водяного знака с окном SYNC_OVERLAP_SECONDS; всю историю
+# заливает только `python vector_index.py <user>` (sync(full=True)). На кроне каталог
+# переживает запуски через actions/cache (digest_cron.yml).
+
+DIM = 512
+GRAPH_MIN = 50_000
+GRAPH_M = 32            # соседей у вершины (как M0 нижнего слоя HNSW)
+EF_CONSTRUCTION = 64
+EF_SEARCH = 64
+GRAPH_BUILD_STEP = 200  # вершин, достраиваемых в граф за один add()
+ENTRY_SAMPLE = 32       # случайные вершины, лучшая из которых — точка входа
+INITIAL_CAPACITY = 1024
+MIN_SIMILARITY = 0.25
+SYNC_EVERY = 60         # сек между sync() одного индекса
+SYNC_OVERLAP_SECONDS = 600  # окно перед водяным знаком sync(): строки, закоммиченные с опозданием
+PAGE_SIZE = 1000
+
+STOPWORDS = frozenset(
+    "the and for with that this from are was were has have will its their about into over more than "
+    "new how what why who you your our not but can all also been they them which when".split()
+)
+
+def _index_dir():
+    return os.environ.get("VECTOR_INDEX_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".vector_index"))
+
+# --- ЭМБЕДДИНГ ---
+
+def _features(text):
+    words = [w for w in tokenize(text) if w not in STOPWORDS]
+    feats = Counter(words)
+    feats.update(f"{a} {b}" for a, b in zip(words, words[1:]))
+    for w in words:
+        padded = f"<{w}>"
+        feats.update(f"#{padded[i:i + 4]}" for i in range(max(1, len(padded) - 3)))
+    return feats
+
+def embed(text, dim=DIM):
+    """Нормированный float32-вектор; пустой текст — нулевой вектор"""
+    vec = np.zeros(dim, np.float32)
+    feats = _features(text)
+    if not feats:
+        return vec
+    hashes = np.fromiter((zlib.crc32(f.encode()) for f in feats), np.uint32, len(feats))
+    weights = np.fromiter(((1 + math.log(c)) * (0.5 if f[0] == "#" else 1.0) for f, c in feats.items()),
+                          np.float32, len(feats))
+    signs = np.where(hashes & 0x80000000, 1.0, -1.0).astype(np.float32)
+    np.add.at(vec, hashes % dim, signs * weights)
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else vec
+
+def summary_text(row):
+    return f"{row.get('topic') or ''}. {row.get('summary') or ''}"
+
+def brief_queries(brief):
+    """Запросы для "related coverage" брифа: big picture и каждый тренд отдельно"""
+    trends = [t for t in brief.get('trends') or [] if isinstance(t, dict)]
+    texts = [brief.get('big_picture') or ""] + [f"{t.get('title', '')}. {t.get('insight', '')}" for t in trends]
+    return [t for t in texts if t.strip(". ")]
+
+# --- ИНДЕКС ---
+
+class VectorIndex:
+    def __init__(self, user_id, directory=None, dim=DIM):
+        self.user_id = user_id
+        self.dim = dim
+        self.dir = directory or _index_dir()
+        os.makedirs(self.dir, exist_ok=True)
+        base = os.path.join(self.dir, str(user_id))
+        self.vec_path, self.meta_path, self.graph_path = base + ".vec", base + ".jsonl", base + ".graph"
+        self._lock = threading.RLock()
+        self._synced = None
+
+        self.meta = []
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, encoding="utf-8") as f:
+                lines = f.readlines()
+            for line in lines:
+                try:
+                    self.meta.append(json.loads(line))
+                except ValueError:
+                    # Оборванная последняя строка после падения: переписываем файл без нее
+                    with open(self.meta_path, "w", encoding="utf-8") as f:
+                        f.writelines(json.dumps(m, ensure_ascii=False) + "\n" for m in self.meta)
+                    break
+        self.ids = {m['id']: i for i, m in enumerate(self.meta)}
+        self.vectors = self._open(self.vec_path, np.float32, self.dim, max(INITIAL_CAPACITY, len(self.meta)))
+        self.graph, self.linked = None, 0
+        if os.path.exists(self.graph_path):
+            self._open_graph()
+
+    def __len__(self):
+        return len(self.meta)
+
+    def _open(self, path, dtype, width, min_rows, fill=0):
+        """memmap [capacity, width]; capacity — не меньше min_rows, удвоением"""
+        row_bytes = np.dtype(dtype).itemsize * width
+        rows = os.path.getsize(path) // row_bytes if os.path.exists(path) else 0
+        if rows < min_rows:
+            capacity = max(rows, INITIAL_CAPACITY)
+            while capacity < min_rows:
+                capacity *= 2
+            with open(path, "ab") as f:
+                f.truncate(capacity * row_bytes)
+            if fill:
+                mm = np.memmap(path, dtype, "r+", shape=(capacity, width))
+                mm[rows:] = fill
+                mm.flush()
+            rows = capacity
+        return np.memmap(path, dtype, "r+", shape=(rows, width))
+
+    def _grow(self):
+        n = len(self.meta)
+        if n < self.vectors.shape[0]:
+            return
+        self.vectors.flush()
+        self.vectors = self._open(self.vec_path, np.float32, self.dim, n + 1)
+        if self.graph is not None:
+            self.graph.flush()
+            self.graph = self._open(self.graph_path, np.int32, GRAPH_M, n + 1, fill=-1)
+
+    # --- ЗАПИСЬ ---
+
+    def add(self, summary_id, text, **meta):
+        """Добавляет саммари; повторный id игнорируется. meta — topic, summary, created_at."""
+        summary_id = str(summary_id)
+        vec = embed(text, self.dim)
+        with self._lock:
+            if summary_id in self.ids or not vec.any():
+                return False
+            self._grow()
+            n = len(self.meta)
+            self.vectors[n] = vec
+            self.vectors.flush()
+            row = {"id": summary_id, **meta}
+            with open(self.meta_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+            self.meta.append(row)
+            self.ids[summary_id] = n
+            if self.graph is None and n + 1 >= GRAPH_MIN:
+                self._open_graph()
+            if self.graph is not None:
+                self._catch_up(GRAPH_BUILD_STEP)
+            return True
+
+    def add_summary(self, row):
+        return self.add(row['id'], summary_text(row), topic=row.get('topic'),
+                        summary=(row.get('summary') or "")[:500], created_at=row.get('created_at'))
+
+    def _since(self):
+        """Водяной знак: последний created_at минус SYNC_OVERLAP_SECONDS.
+        created_at ставится при вставке, а коммит другого воркера может прийти позже —
+        его строка окажется раньше уже проиндексированной. Окно ловит такие строки,
+        а повторы из окна add() отбрасывает по id."""
+        latest = max((m.get('created_at') or "" for m in self.meta), default="")
+        if not latest:
+            return ""
+        try:
+            since = datetime.fromisoformat(latest.replace("Z", "+00:00")) - timedelta(seconds=SYNC_OVERLAP_SECONDS)
+        except ValueError:
+            return ""  # непонятный формат — полный проход, дубли все равно отсеются
+        return since.isoformat()
+
+    def sync(self, supabase, force=False, full=False):
+        """Дотягивает из email_summaries новые строки (кроме Noise); full — вся история"""
+        with self._lock:
+            if not force and self._synced and time.monotonic() - self._synced < SYNC_EVERY:
+                return 0
+            since = "" if full else self._since()
+            added, offset = 0, 0
+            while True:
+                q = supabase.table("email_summaries").select("id, topic, summary, category, created_at") \
+                    .eq("user_id", self.user_id).neq("category", "Noise")
+                if since:
+                    q = q.gte("created_at", since)
+                page = q.order("created_at").order("id").range(offset, offset + PAGE_SIZE - 1).execute().data or []
+                added += sum(1 for row in page if self.add_summary(row))
+                if len(page) < PAGE_SIZE:
+                    break
+                offset += PAGE_SIZE
+            self._synced = time.monotonic()
+            return added
+
+    # --- ГРАФ ---
+
+    def _open_graph(self):
+        self.graph = self._open(self.graph_path, np.int32, GRAPH_M, self.vectors.shape[0], fill=-1)
+        # Вершины вставляются по порядку: связанные — префикс (у вершины 0 соседи появятся с вершиной 1)
+        self.linked = min(len(self.meta), max(1, int((self.graph[:len(self.meta), 0] >= 0).sum())))
+
+    def _catch_up(self, budget=None):
+        """Вставляет в граф следующие budget вершин (None — все недостающие)"""
+        end = len(self.meta) if budget is None else min(len(self.meta), self.linked + budget)
+        for n in range(max(self.linked, 1), end):
+            self._link(n)
+        if end > self.linked:
+            self.linked = end
+            self.graph.flush()
+
+    def build_graph(self):
+        """Граф целиком сейчас, не дожидаясь порций из add()"""
+        with self._lock:
+            if self.graph is None:
+                self._open_graph()
+            self._catch_up()
+
+    def _neighbors(self, n):
+        return [x for x in self.graph.view(np.ndarray)[n].tolist() if x >= 0]
+
+    def _beam(self, query, ef, limit_n=None):
+        """Жадный beam search по графу: [(sim, вершина)] лучших ef, по убыванию"""
+        # view(ndarray): индексация memmap создает memmap-объекты и в цикле заметно дороже
+        vectors, graph = self.vectors.view(np.ndarray), self.graph.view(np.ndarray)
+        n_total = limit_n if limit_n is not None else len(self.meta)
+        rng = np.random.default_rng(n_total)
+        sample = np.unique(np.append(rng.integers(0, n_total, min(ENTRY_SAMPLE, n_total)), 0))
+        sims = vectors[sample] @ query
+        entry = int(sample[int(np.argmax(sims))])
+
+        visited = {entry}
+        start = float(sims.max())
+        candidates = [(-start, entry)]
+        best = [(start, entry)]
+        while candidates:
+            neg, node = heapq.heappop(candidates)
+            if len(best) >= ef and -neg < best[0][0]:
+                break
+            nbrs = [x for x in graph[node].tolist() if 0 <= x < n_total and x not in visited]
+            if not nbrs:
+                continue
+            visited.update(nbrs)
+            for sim, nb in zip((vectors[nbrs] @ query).tolist(), nbrs):
+                if len(best) < ef or sim > best[0][0]:
+                    heapq.heappush(candidates, (-sim, nb))
+                    heapq.heappush(best, (sim, nb))
+                    if len(best) > ef:
+                        heapq.heappop(best)
+        return sorted(best, reverse=True)
+
+    def _select(self, base, candidates):
+        """
+        Эвристика отбора соседей HNSW: кандидат берется, если он ближе к base, чем к уже
+        выбранным, — ребра расходятся в разные стороны и граф остается связным.
+        Оставшиеся места добиваются ближайшими из отброшенных.
+        """
+        candidates = np.array(sorted(set(candidates)), dtype=np.int64)
+        vecs = self.vectors.view(np.ndarray)[candidates]
+        order = np.argsort(-(vecs @ base))
+        candidates, vecs = candidates[order], vecs[order]
+        to_base = vecs @ base
+        pairwise = vecs @ vecs.T
+        closest = np.full(len(candidates), -np.inf, np.float32)  # сходство с ближайшим выбранным
+        chosen, skipped = [], []
+        for i in range(len(candidates)):
+            if len(chosen) >= GRAPH_M:
+                break
+            if to_base[i] > closest[i]:
+                chosen.append(i)
+                np.maximum(closest, pairwise[i], out=closest)
+            else:
+                skipped.append(i)
+        picked = chosen + skipped[:GRAPH_M - len(chosen)]
+        return [int(candidates[i]) for i in picked]
+
+    def _link(self, n):
+        vectors = self.vectors.view(np.ndarray)
+        vec = vectors[n]
+        found = [m for _, m in self._beam(vec, EF_CONSTRUCTION, limit_n=n) if m != n]
+        chosen = self._select(vec, found)
+        self.graph[n] = -1
+        self.graph[n, :len(chosen)] = chosen
+        for m in chosen:
+            nbrs = self._neighbors(m)
+            if len(nbrs) < GRAPH_M:
+                self.graph[m, len(nbrs)] = n
+                continue
+            # Список полон: если n ближе самого далекого соседа — заново отбираем соседей m
+            if float(vec @ vectors[m]) <= float((vectors[nbrs] @ vectors[m]).min()):
+                continue
+            kept = self._select(vectors[m], nbrs + [n])
+            self.graph[m] = -1
+            self.graph[m, :len(kept)] = kept
+
+    # --- ПОИСК ---
+
+    def search(self, text_or_vector, k=10, exclude=(), before=None, min_similarity=MIN_SIMILARITY):
+        """
+        top-k похожих саммари: [{id, topic, summary, created_at, score}].
+        exclude — id, которые не возвращать; before — только created_at < before (ISO).
+        """
+        query = embed(text_or_vector, self.dim) if isinstance(text_or_vector, str) else text_or_vector
+        with self._lock:
+            n = len(self.meta)
+            if not n or not query.any():
+                return []
+            exclude = {str(x) for x in exclude}
+
+            def keep(i):
+                m = self.meta[i]
+                return m['id'] not in exclude and (not before or (m.get('created_at') or "") < before)
+
+            if self.graph is not None and self.linked == n:
+                scored = [(s, i) for s, i in self._beam(query, max(EF_SEARCH, k * 4)) if keep(i)]
+            else:
+                sims = np.asarray(self.vectors[:n] @ query)
+                top = min(n, k * 4 + len(exclude))
+                order = np.argpartition(-sims, top - 1)[:top] if top < n else np.arange(n)
+                scored = sorted(((float(sims[i]), int(i)) for i in order if keep(int(i))), reverse=True)
+
+            return [{**self.meta[i], "score": round(s, 4)} for s, i in scored[:k] if s >= min_similarity]
+
+    def related_to(self, texts, k=8, per_text=3, exclude=(), before=None):
+        """Похожее сразу на несколько текстов: лучший score на саммари, общий top-k"""
+        best = {}
+        for text in texts:
+            for hit in self.search(text, per_text, exclude, before):
+                if hit['score'] > best.get(hit['id'], {}).get('score', -1):
+                    best[hit['id']] = hit
+        return sorted(best.values(), key=lambda h: -h['score'])[:k]
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def get_vector_index(user_id):
+    """Один VectorIndex на пользователя и процесс"""
+    with _indexes_lock:
+        if user_id not in _indexes:
+            _indexes[user_id] = VectorIndex(user_id)
+        return _indexes[user_id]
+
+if __name__ == "__main__":
+    import argparse
+    from pipeline import get_supabase
+
+    parser = argparse.ArgumentParser(description="Build / refresh a user's summary vector index")
+    parser.add_argument("user_id")
+    parser.add_argument("--build-graph", action="store_true", help="достроить граф сразу целиком")
+    args = parser.parse_args()
+
+    index = get_vector_index(args.user_id)
+    added = index.sync(get_supabase(), force=True, full=True)
+    if args.build_graph:
+        index.build_graph()
+    print(f"🧮 {args.user_id}: +{added}, {len(index)} vectors, graph: "
+          f"{f'{index.linked}/{len(index)}' if index.graph is not None else 'off'}")
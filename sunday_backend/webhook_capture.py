@@ -0,0 +1,46 @@
+import hashlib
+import json
+import os
+import re
+import threading
+
+# --- ЗАПИСЬ ВХОДЯЩИХ ПИСЕМ ДЛЯ НАГРУЗОЧНЫХ ТЕСТОВ ---
+# WEBHOOK_CAPTURE=path.jsonl — main.py дописывает туда каждый EmailPayload
+# (после обезличивания) для benchmarks/webhook_load.py.
+# Адреса заменяются на стабильные псевдонимы, query-строки ссылок (трекинг, токены
+# отписки) — на X той же длины: размер и структура MIME сохраняются, персональные данные — нет.
+
+EMAIL_RE = re.compile(r"[\w.+-]+@([\w-]+\.)+[\w-]+")
+QUERY_RE = re.compile(r"(https?://[^\s\"'<>?]+)\?([^\s\"'<>]+)")
+
+_lock = threading.Lock()
+
+def _alias(match):
+    digest = hashlib.sha1(match.group(0).lower().encode()).hexdigest()[:10]
+    return f"u{digest}@example.com"
+
+def sanitize_text(text):
+    if not text:
+        return text
+    text = EMAIL_RE.sub(_alias, text)
+    return QUERY_RE.sub(lambda m: f"{m.group(1)}?{'X' * len(m.group(2))}", text)
+
+def sanitize_payload(payload):
+    """dict EmailPayload -> обезличенная копия"""
+    clean = dict(payload)
+    for field in ("sender", "recipient", "subject", "raw_email"):
+        if clean.get(field):
+            clean[field] = sanitize_text(clean[field])
+    return clean
+
+def capture(payload):
+    """Дописывает payload в WEBHOOK_CAPTURE, если переменная задана. Никогда не бросает."""
+    path = os.environ.get("WEBHOOK_CAPTURE")
+    if not path:
+        return
+    try:
+        line = json.dumps(sanitize_payload(payload), ensure_ascii=False)
+        with _lock, open(path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    except Exception as e:
+        print(f"⚠️ Capture error: {e}")
@@ -1,12 +1,18 @@
 import os
 import json
-import smtplib
+import argparse
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from google import genai
-from supabase import create_client, Client
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+from supabase import create_client, Client, ClientOptions
+from render import render_digest
+from outbox import enqueue, email_item
+from pipeline import digest_key
+from scheduler import shard_of, parse_shard
+from repository import query, records, Profile, RawEmail
+from reducer import reduce_text, WEEKLY_TOKENS
+import deadline
 
 # Загрузка переменных окружения
 load_dotenv()
@@ -14,11 +20,19 @@ load_dotenv()
 # --- ИНИЦИАЛИЗАЦИЯ КЛИЕНТОВ ---
 supabase: Client = create_client(
     os.environ.get("SUPABASE_URL"), 
-    os.environ.get("SUPABASE_KEY")
+    os.environ.get("SUPABASE_KEY"),
+    options=ClientOptions(postgrest_client_timeout=deadline.DB_TIMEOUT)
 )
 
 client = genai.Client(api_key=os.environ.get("GEMINI_API_KEY"))
 
+# Метки запуска для run_logs: по ним шаг merge сводит результаты всех шардов
+RUN_ID = os.environ.get("GITHUB_RUN_ID", "local")
+SHARD = "0/1"
+# Не начинаем пользователя, если от бюджета шарда (RUN_BUDGET_SECONDS) осталось меньше:
+# его непрочитанные письма (processed = False) просто дождутся следующего часа
+USER_RESERVE_SECONDS = 180
+
 def log_event(user_id, status, emails_count=0, error_msg=None):
     """Запись логов"""
     try:
@@ -26,29 +40,13 @@ def log_event(user_id, status, emails_count=0, error_msg=None):
             "user_id": user_id,
             "status": status,
             "emails_processed": emails_count,
-            "error_message": error_msg
+            "error_message": error_msg,
+            "run_id": RUN_ID,
+            "shard": SHARD
         }).execute()
     except Exception as e:
         print(f"   ⚠️ Ошибка записи лога: {e}")
 
-def send_email(to_email, subject, html_body):
-    """Отправка HTML-письма"""
-    try:
-        msg = MIMEMultipart()
-        msg['From'] = f"Sunday AI <{os.environ.get('EMAIL_USER')}>"
-        msg['To'] = to_email
-        msg['Subject'] = subject
-        msg.attach(MIMEText(html_body, 'html'))
-        
-        with smtplib.SMTP(os.environ.get("SMTP_SERVER", "smtp.gmail.com"), 587) as server:
-            server.starttls()
-            server.login(os.environ.get("EMAIL_USER"), os.environ.get("EMAIL_PASS"))
-            server.sendmail(os.environ.get("EMAIL_USER"), to_email, msg.as_string())
-        return True
-    except Exception as e:
-        print(f"   ❌ SMTP Error: {e}")
-        return False
-
 def get_ai_synthesis(emails_text, profile):
     """Генерация через Gemini"""
     role = profile.get('role', 'Professional')
@@ -80,7 +78,8 @@ def get_ai_synthesis(emails_text, profile):
             contents=prompt,
             config={
                 'response_mime_type': 'application/json',
-                'temperature': 0.2
+                'temperature': 0.2,
+                'http_options': deadline.llm_http_options()
             }
         )
         return json.loads(response.text)
@@ -88,106 +87,157 @@ def get_ai_synthesis(emails_text, profile):
         print(f"   ❌ AI Synthesis Error: {e}")
         return None
 
-def get_html_template(synthesis):
-    """HTML шаблон (сокращен для экономии места, логика та же)"""
-    trends_html = "".join([f"""
-        <div style="margin-bottom: 24px; padding: 20px; border-radius: 12px; border: 1px solid #eef2f6; background-color: #ffffff;">
-            <h3 style="margin: 0 0 10px 0; color: #1a73e8; font-size: 18px;">{t['title']}</h3>
-            <div style="color: #3c4043; font-size: 15px;">{t['insight']}</div>
-        </div>
-    """ for t in synthesis.get('trends', [])])
+def process_user(user, now):
+    # Проверка времени (раскомментируй для продакшена)
+    # if user.get('digest_day') != now.strftime("%A"): return
+    
+    # ВАЖНО: Используем personal_email, так как ты чистил таблицу
+    email_addr = user.get('personal_email')
+    if not email_addr:
+        print(f"⚠️ У пользователя {user['id']} нет email, пропускаем.")
+        return
+
+    budget = deadline.current()
+    if not budget.allows(USER_RESERVE_SECONDS):
+        print(f"⏳ {email_addr}: бюджет запуска на исходе ({budget}), переносим на следующий час")
+        log_event(user['id'], "deferred")
+        return
 
-    actions_list = "".join([f"<li>{item}</li>" for item in synthesis.get('action_items', [])])
+    print(f"👤 Обработка: {email_addr}")
     
-    return f"""
-    <div style="font-family: sans-serif; background-color: #f4f7f9; padding: 20px;">
-        <div style="max-width: 600px; margin: auto; background: white; border-radius: 12px; padding: 30px;">
-            <h1 style="color: #1a73e8;">Sunday Brief</h1>
-            <p style="font-size: 18px;">{synthesis.get('big_picture')}</p>
-            <hr>
-            {trends_html}
-            <h3>⚠️ Actions</h3>
-            <ul>{actions_list}</ul>
-        </div>
-    </div>
-    """
+    # 2. Ищем новые письма
+    emails = records(RawEmail, query(supabase, RawEmail, "id", "sender", "subject", "body_plain")
+        .eq("user_id", user['id'])
+        .eq("processed", False)
+        .execute())
+    
+    if not emails:
+        print("   📪 Новых писем нет.")
+        return
 
-def main():
+    print(f"   📨 Писем: {len(emails)}")
+    
+    email_context = ""
+    tokens_in = tokens_out = 0
+    for e in emails:
+        body, stats = reduce_text(e['body_plain'], WEEKLY_TOKENS)
+        tokens_in += stats['tokens_in']
+        tokens_out += stats['tokens_out']
+        email_context += f"FROM: {e['sender']}\nSUBJ: {e['subject']}\nBODY: {body}\n---\n"
+    print(f"   ✂️ Контекст: {tokens_in}→{tokens_out} токенов")
+
+    # 3. Генерация
+    synthesis = get_ai_synthesis(email_context, user)
+    
+    if synthesis and "big_picture" in synthesis:
+        rendered = render_digest(synthesis)
+        html_email = rendered['email_html']
+        subject = f"Sunday Brief: {synthesis['big_picture'][:50]}..."
+        
+        # 4. Сохранение + постановка письма в outbox (отправляет outbox.py отдельным шагом).
+        # Ключи идемпотентности как в pipeline.deliver_brief (migrations/011): падение между
+        # шагами и повторный запуск на тех же письмах не дают второго дайджеста и второго письма
+        key = digest_key(user['id'], [f"raw:{e['id']}" for e in emails])
+        try:
+            digest_res = supabase.table("digests").upsert({
+                "user_id": user['id'],
+                "user_email": email_addr, # <--- ВАЖНО: Добавили email (он теперь required)
+                "summary_text": synthesis.get('big_picture'), # <--- ВАЖНО: Заполняем колонку
+                "structured_content": synthesis, # Весь json: дашборды показывают и тренды, и action items
+                "rendered": rendered, # Готовые HTML/текст — дашборды не рендерят заново
+                "is_sent": False, # <--- Галочку ставит outbox.py после реальной отправки
+                "period_start": (now - timedelta(days=7)).isoformat(),
+                "period_end": now.isoformat(),
+                "idempotency_key": key
+            }, on_conflict="idempotency_key", ignore_duplicates=True).execute()
+            if digest_res.data:
+                digest_id = digest_res.data[0]['id']
+            else:
+                # Дайджест создал прошлый запуск — шлем то, что сохранено тогда
+                existing = supabase.table("digests").select("id, rendered, summary_text") \
+                    .eq("idempotency_key", key).execute().data[0]
+                digest_id = existing['id']
+                html_email = (existing.get('rendered') or {}).get('email_html') or html_email
+                subject = f"Sunday Brief: {(existing.get('summary_text') or '')[:50]}..."
+                print("   ♻️ Дайджест уже создан прошлым запуском, продолжаем доставку")
+            enqueue(supabase, [email_item(email_addr, subject, html_email, digest_id,
+                                          dedupe_key=f"digest:{digest_id}:email")])
+            
+            # Помечаем письма как обработанные
+            supabase.table("raw_emails").update({"processed": True}).in_("id", [e['id'] for e in emails]).execute()
+            
+            log_event(user['id'], "success", len(emails))
+            print("   ✅ Успех!")
+        except Exception as db_err:
+            print(f"   ⚠️ Ошибка базы данных: {db_err}")
+            log_event(user['id'], "error", error_msg=str(db_err))
+    else:
+        print("   ❌ ИИ вернул пустой ответ")
+
+def main(shard=(0, 1), concurrency=1):
     now = datetime.utcnow()
     # ДЛЯ ТЕСТОВ: Если хочешь запустить принудительно, закомментируй проверку времени ниже
     cur_day, cur_hour = now.strftime("%A"), now.strftime("%H:00")
-    print(f"🚀 Sunday AI Run | {cur_day} {cur_hour} UTC")
+    shard_index, shard_count = shard
+    budget = deadline.start()
+    print(f"🚀 Sunday AI Run | {cur_day} {cur_hour} UTC | shard {shard_index}/{shard_count} | budget {budget}")
 
     # 1. Берем пользователей (убедись, что колонки digest_day существуют, или убери фильтр для теста)
-    users = supabase.table("profiles").select("*").execute()
+    users = records(Profile, query(supabase, Profile, "id", "personal_email", "role", "focus_areas", "digest_day").execute())
     
-    if not users.data:
+    if not users:
         print("💤 Нет пользователей.")
         return
 
-    for user in users.data:
-        # Проверка времени (раскомментируй для продакшена)
-        # if user.get('digest_day') != cur_day: continue
-        
-        # ВАЖНО: Используем personal_email, так как ты чистил таблицу
-        email_addr = user.get('personal_email')
-        if not email_addr:
-            print(f"⚠️ У пользователя {user['id']} нет email, пропускаем.")
-            continue
-
-        print(f"👤 Обработка: {email_addr}")
-        
-        # 2. Ищем новые письма
-        emails_query = supabase.table("raw_emails") \
-            .select("*") \
-            .eq("user_id", user['id']) \
-            .eq("processed", False) \
-            .execute()
-        
-        if not emails_query.data:
-            print("   📪 Новых писем нет.")
-            continue
-
-        print(f"   📨 Писем: {len(emails_query.data)}")
-        
-        email_context = ""
-        for e in emails_query.data:
-            email_context += f"FROM: {e['sender']}\nSUBJ: {e['subject']}\nBODY: {e['body_plain'][:1000]}\n---\n"
-
-        # 3. Генерация
-        synthesis = get_ai_synthesis(email_context, user)
-        
-        if synthesis and "big_picture" in synthesis:
-            html_email = get_html_template(synthesis)
-            subject = f"Sunday Brief: {synthesis['big_picture'][:50]}..."
-            
-            # 4. Отправка
-            if send_email(email_addr, subject, html_email):
-                
-                # --- ИСПРАВЛЕННАЯ ВСТАВКА В БАЗУ ---
-                try:
-                    supabase.table("digests").insert({
-                        "user_id": user['id'],
-                        "user_email": email_addr, # <--- ВАЖНО: Добавили email (он теперь required)
-                        "summary_text": synthesis.get('big_picture'), # <--- ВАЖНО: Заполняем колонку
-                        "structured_content": synthesis.get('trends', []), # Сохраняем только тренды или весь json
-                        "is_sent": True, # <--- ВАЖНО: Ставим галочку
-                        "period_start": (now - timedelta(days=7)).isoformat(),
-                        "period_end": now.isoformat()
-                    }).execute()
-                    
-                    # Помечаем письма как обработанные
-                    for e in emails_query.data:
-                        supabase.table("raw_emails").update({"processed": True}).eq("id", e['id']).execute()
-                    
-                    log_event(user['id'], "success", len(emails_query.data))
-                    print("   ✅ Успех!")
-                except Exception as db_err:
-                    print(f"   ⚠️ Ошибка базы данных: {db_err}")
-            else:
-                log_event(user['id'], "error", error_msg="SMTP Fail")
-        else:
-            print("   ❌ ИИ вернул пустой ответ")
+    my_users = [u for u in users if shard_of(u['id'], shard_count) == shard_index]
+    print(f"👥 Пользователей в шарде: {len(my_users)} из {len(users)}")
+
+    if concurrency > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(lambda u: process_user(u, now), my_users))
+    else:
+        for user in my_users:
+            process_user(user, now)
+
+def report(run_id):
+    """Сводка run_logs по всем шардам одного запуска (шаг merge в GitHub Actions)"""
+    res = supabase.table("run_logs") \
+        .select("shard, status, emails_processed") \
+        .eq("run_id", run_id) \
+        .execute()
+    rows = res.data or []
+
+    by_shard = {}
+    for r in rows:
+        stats = by_shard.setdefault(r.get('shard') or "-", {"success": 0, "error": 0, "deferred": 0, "emails": 0})
+        stats[r['status'] if r['status'] in ("success", "deferred") else "error"] += 1
+        stats["emails"] += r.get('emails_processed') or 0
+
+    lines = [f"### Sunday AI run {run_id}", "", "| shard | success | error | deferred | emails |", "|---|---|---|---|---|"]
+    for shard in sorted(by_shard):
+        stats = by_shard[shard]
+        lines.append(f"| {shard} | {stats['success']} | {stats['error']} | {stats['deferred']} | {stats['emails']} |")
+    total = {k: sum(stats[k] for stats in by_shard.values()) for k in ("success", "error", "deferred", "emails")}
+    lines.append(f"| **total** | {total['success']} | {total['error']} | {total['deferred']} | {total['emails']} |")
+    summary = "\n".join(lines)
+    print(summary)
+
+    # В GitHub Actions сводка попадает на страницу запуска
+    step_summary = os.environ.get("GITHUB_STEP_SUMMARY")
+    if step_summary:
+        with open(step_summary, "a") as f:
+            f.write(summary + "\n")
+    return total
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Sunday AI hourly digest run")
+    parser.add_argument("--shard", type=parse_shard, default=(0, 1), help="i/N: обработать только свой шард пользователей")
+    parser.add_argument("--concurrency", type=int, default=1, help="пользователей параллельно внутри шарда")
+    parser.add_argument("--report", action="store_true", help="только свести run_logs текущего RUN_ID")
+    args = parser.parse_args()
+
+    if args.report:
+        report(RUN_ID)
+    else:
+        SHARD = f"{args.shard[0]}/{args.shard[1]}"
+        main(args.shard, args.concurrency)
\ No newline at end of file
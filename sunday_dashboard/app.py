@@ -2,24 +2,33 @@ import sys
 import os
 
 # --- 1. НАСТРОЙКА ПУТЕЙ ---
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+backend_path = os.path.join(parent_dir, 'sunday_backend')
+sys.path.append(backend_path)
+
 try:
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    parent_dir = os.path.dirname(current_dir)
-    backend_path = os.path.join(parent_dir, 'sunday_backend')
-    sys.path.append(backend_path)
-    from pipeline import run_digest 
+    from render import get_rendered
+    from digest_index import index_label
 except Exception as e:
     print(f"⚠️ Warning: Could not import backend logic. Error: {e}")
-    def run_digest(uid): return False
+
+    def get_rendered(digest_row):
+        # Без бэкенда — только то, что уже отрендерено при создании дайджеста
+        rendered = digest_row.get('rendered')
+        if isinstance(rendered, dict) and rendered.get('dashboard_html'):
+            return rendered
+        return {"dashboard_html": digest_row.get('summary_text') or ""}
+
+    def index_label(row):
+        date = (row.get('period_start') or row.get('created_at') or "")[:10]
+        return f"{date} · #{str(row.get('id', '0'))[:4]}"
 
 # --- 2. ИМПОРТЫ ---
 import streamlit as st
-import streamlit_shadcn_ui as ui
-from supabase import create_client
 from dotenv import load_dotenv
-import pandas as pd
-import uuid
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, time as dt_time
+from collections import Counter
 import extra_streamlit_components as stx
 
 # --- 3. CONFIG ---
@@ -71,79 +80,175 @@ url = os.environ.get("SUPABASE_URL")
 key = os.environ.get("SUPABASE_KEY")
 if not url or not key: st.error("Supabase keys missing!"); st.stop()
 
-@st.cache_resource
-def init_connection():
-    return create_client(url, key)
+# Все чтения/записи Supabase идут через data layer с кэшем (db.py)
+from db import (
+    get_user_uuid, get_digest_index, get_digest, get_user_profile, update_user_profile,
+    create_user_profile, get_live_demo_data, begin_rerun, invalidate_user, get_weekly_stats,
+    search_briefs, get_related_coverage, ADMIN_UUID
+)
 
-supabase = init_connection()
+# --- ЛЕНИВЫЕ ИМПОРТЫ ---
+# Бэкенд (pipeline -> genai, supabase) и shadcn-компоненты нужны не на каждой странице:
+# грузим при первом использовании, холодный старт дашборда их не ждет.
 
-# --- HELPERS ---
+_jobs = None
 
-def get_user_uuid(email):
-    try:
-        email = email.strip().lower()
-        response = supabase.table("profiles").select("id") \
-            .or_(f"personal_email.eq.{email},inbox_email.eq.{email}").execute()
-        return response.data[0]['id'] if response.data else None
-    except: return None
+def _backend_jobs():
+    global _jobs
+    if _jobs is None:
+        try:
+            import jobs
+            _jobs = jobs
+        except Exception as e:
+            print(f"⚠️ Warning: Could not import backend logic. Error: {e}")
+            _jobs = False
+    return _jobs
 
-def get_user_digests(user_uuid):
-    try:
-        response = supabase.table("digests").select("*").eq("user_id", user_uuid).order("period_start", desc=True).execute()
-        return response.data
-    except: return []
+def submit_digest_job(uid):
+    jobs = _backend_jobs()
+    return jobs.submit_digest_job(uid) if jobs else None
 
-def get_user_profile(user_uuid):
-    try:
-        response = supabase.table("profiles").select("*").eq("id", user_uuid).execute()
-        return response.data[0] if response.data else {}
-    except: return {}
+def get_user_job(uid):
+    jobs = _backend_jobs()
+    return jobs.get_user_job(uid) if jobs else None
 
-def update_user_profile(user_uuid, updates):
-    try:
-        supabase.table("profiles").update(updates).eq("id", user_uuid).execute()
-        return True
-    except Exception as e: st.error(f"Error: {e}"); return False
+def card(**kwargs):
+    import streamlit_shadcn_ui as ui
+    ui.card(**kwargs)
 
-def create_user_profile(email):
-    """Создает пользователя И генерирует ему адрес для пересылки"""
-    try:
-        new_id = str(uuid.uuid4())
-        existing = get_user_uuid(email)
-        if existing: return None, "User exists. Please login."
-        
-        # Генерируем уникальный inbox (берем первые 8 символов ID)
-        inbox_email = f"{new_id[:8]}@sundayai.dev"
-        
-        data = {
-            "id": new_id, 
-            "personal_email": email, 
-            "inbox_email": inbox_email, # <--- ВАЖНО: Сразу сохраняем
-            "role": "Founder", 
-            "focus_areas": ["General Tech"]
-        }
-        supabase.table("profiles").insert(data).execute()
-        return new_id, None
-    except Exception as e: return None, str(e)
-
-# --- DEMO HELPER ---
-def get_live_demo_data():
-    # 👇👇👇 ВСТАВЬ СЮДА СВОЙ UUID (АДМИНА) 👇👇👇
-    ADMIN_UUID = "aa1a97d8-a102-4945-9390-239a6b6c5d68" 
+def parse_time(value):
+    """'09:00:00' / '09:00' из profiles.digest_time (вместо pd.to_datetime ради одного поля)"""
     try:
-        response = supabase.table("digests").select("*").eq("user_id", ADMIN_UUID).order("period_start", desc=True).limit(1).execute()
-        if response.data: return response.data[0]
-        return get_fallback_data()
-    except: return get_fallback_data()
-
-def get_fallback_data():
-    return {
-        "id": "fake", "summary_text": "<b>Demo Offline.</b> Could not fetch live data.",
-        "structured_content": {"trends": [{"title": "Welcome", "insight": "This is a placeholder because the live demo fetch failed."}]}
-    }
+        return dt_time.fromisoformat(str(value))
+    except ValueError:
+        return dt_time(9, 0)
+
+# --- STATS (из предпосчитанных роллапов, rollups.py) ---
+def render_stats(stats):
+    import pandas as pd  # только на этой странице
+
+    df = pd.DataFrame(stats).set_index("week_start")
+    summaries = int(df["summaries"].sum())
+    c1, c2, c3 = st.columns(3)
+    c1.metric("Emails", int(df["emails"].sum()))
+    c2.metric("Noise ratio", f"{df['noise'].sum() / summaries:.0%}" if summaries else "—")
+    avg = (df["avg_importance"].fillna(0) * df["summaries"]).sum() / summaries if summaries else None
+    c3.metric("Avg importance", f"{avg:.1f} / 5" if avg else "—")
+
+    st.markdown("#### Weekly volume")
+    st.bar_chart(df[["emails", "summaries"]])
+
+    st.markdown("#### Importance distribution")
+    hist = [sum(week[i] for week in df["importance_hist"]) for i in range(5)]
+    st.bar_chart(pd.DataFrame({"items": hist}, index=["1", "2", "3", "4", "5"]))
+
+    st.markdown("#### Top senders")
+    senders = Counter()
+    for week in df["top_senders"]:
+        senders.update(week or {})
+    if senders:
+        top = senders.most_common(10)
+        st.bar_chart(pd.DataFrame({"emails": [n for _, n in top]}, index=[s for s, _ in top]))
+
+# --- ПОИСК ПО БРИФАМ (search.py) ---
+SEARCH_PERIODS = {"Any time": None, "Last 7 days": 7, "Last 30 days": 30, "Last 90 days": 90}
+
+def render_search(user_uuid):
+    """Строка поиска над селектбоксом; "Open" подменяет выбранный бриф найденным"""
+    s1, s2 = st.columns([3, 1])
+    text = s1.text_input("🔎 Search your briefs", placeholder="e.g. OpenAI funding", key="brief_search")
+    period = s2.selectbox("Period", list(SEARCH_PERIODS), key="brief_search_period")
+    if not text.strip():
+        return
+
+    days = SEARCH_PERIODS[period]
+    since = (datetime.utcnow() - timedelta(days=days)).date().isoformat() if days else None  # по дням — ключ кэша стабилен
+    hits = search_briefs(user_uuid, text, since)
+    if not hits:
+        st.caption("Nothing found.")
+        return
+    st.caption(f"{len(hits)} results")
+    for hit in hits:
+        icon = "📦" if hit['kind'] == "digest" else "✉️"
+        date = (hit.get('created_at') or "")[:10]
+        c1, c2 = st.columns([5, 1])
+        c1.markdown(f"{icon} **{hit['title']}** · {date}  \n{hit.get('snippet') or ''}")
+        if hit.get('digest_id') and c2.button("Open", key=f"open_{hit['kind']}_{hit['id']}"):
+            st.session_state.open_digest_id = hit['digest_id']
+            st.rerun()
+    st.divider()
+
+# --- БРИФ + RELATED COVERAGE (vector_index.py) ---
+def render_brief(brief, user_uuid):
+    # Артефакты отрендерены один раз при создании дайджеста (render.py)
+    st.markdown(get_rendered(brief)['dashboard_html'], unsafe_allow_html=True)
+    if not brief.get('id') or brief['id'] == "fake":
+        return
+    related = get_related_coverage(user_uuid, brief['id'])
+    if related:
+        with st.expander(f"🔗 Related coverage from earlier weeks ({len(related)})"):
+            for item in related:
+                st.markdown(f"**{item.get('topic') or 'Untitled'}** · {(item.get('created_at') or '')[:10]}  \n"
+                            f"{item.get('summary') or ''}")
+
+# --- GENERATE NOW (фоновая задача) ---
+JOB_PHASES = {
+    "summarizing": "🍳 Summarizing emails",
+    "synthesizing": "👨‍🍳 Chef is writing your brief",
+    "delivering": "📨 Saving & sending",
+}
+
+def render_partial_brief(partial):
+    """Бриф, пока Head Chef его пишет (потоковый синтез): big_picture и готовые тренды"""
+    if partial.get('big_picture'):
+        st.markdown(f"**🌍 The Big Picture**  \n{partial['big_picture']}")
+    for trend in partial.get('trends') or []:
+        st.markdown(f"**{trend.get('title') or 'Untitled'}**  \n{trend.get('insight') or ''}")
+
+@st.fragment(run_every=2)
+def manual_trigger(user_uuid):
+    """Кнопка + опрос статуса задачи: перерисовывается только этот фрагмент"""
+    job = get_user_job(user_uuid)
+    running = bool(job) and job['status'] in ("queued", "running")
+
+    if st.button("Generate Now", type="secondary", use_container_width=True, disabled=running):
+        # Повторные клики склеиваются в одну задачу (jobs.submit_digest_job)
+        if not submit_digest_job(user_uuid):
+            st.error("Backend is not available.")
+            return
+        job = get_user_job(user_uuid)
+        running = True
+
+    if not job:
+        return
+
+    if running:
+        progress = job.get('progress') or {}
+        label = JOB_PHASES.get(job.get('phase'), "⏳ Queued")
+        if job.get('phase') == "summarizing" and progress.get('total'):
+            st.progress(progress['done'] / progress['total'], text=f"{label}: {progress['done']}/{progress['total']}")
+        else:
+            st.info(f"{label}...")
+        if job.get('phase') == "synthesizing" and progress.get('partial'):
+            render_partial_brief(progress['partial'])
+        return
+
+    # Задача завершилась: показываем результат один раз
+    if st.session_state.get('seen_job_id') == job['id']:
+        return
+    st.session_state.seen_job_id = job['id']
+    if job['status'] == "done" and job.get('result'):
+        invalidate_user(user_uuid)
+        st.success("Done! Check 'My Briefs'.")
+        st.balloons()
+    elif job['status'] == "failed":
+        st.error(f"Generation failed: {job.get('error')}")
+    else:
+        st.warning("Not enough new emails found yet.")
 
 # --- MAIN APP ---
 def main():
+    begin_rerun()
     cookie_manager = stx.CookieManager()
     
     # Инициализация состояний
@@ -197,7 +302,7 @@ def main():
 
         # МЕНЮ НАВИГАЦИИ (Видно всегда, если есть доступ к контенту)
         if st.session_state.user_email or st.session_state.demo_mode:
-             page = st.radio("Menu", ["My Briefs", "Settings"], label_visibility="collapsed")
+             page = st.radio("Menu", ["My Briefs", "Stats", "Settings"], label_visibility="collapsed")
         else:
              page = "Welcome"
 
@@ -329,42 +434,59 @@ def main():
                             st.rerun()
                 st.divider()
 
-        # 3. Логика загрузки дайджестов (как было)
+        # 3. Поиск по всем брифам и саммари; открытый из поиска бриф показываем вместо списка
+        search_user = ADMIN_UUID if st.session_state.demo_mode else st.session_state.user_uuid
+        render_search(search_user)
+        open_id = st.session_state.get('open_digest_id')
+        if open_id:
+            if st.button("← Back to reports", key="close_search_brief"):
+                st.session_state.open_digest_id = None
+                st.rerun()
+            brief = get_digest(open_id)
+            if brief:
+                render_brief(brief, search_user)
+            else:
+                st.warning("Could not load this brief. Please try again.")
+
+        # 4. Логика загрузки дайджестов: сначала легкий индекс, тело — только выбранного
         if st.session_state.demo_mode:
-            digest_data = get_live_demo_data()
-            digests = [digest_data]
-            ui.card(title="👋 Welcome!", content="This is a REAL digest generated from the admin's inbox.", key="welcome")
+            demo = get_live_demo_data()
+            index = [demo]
+            has_more = False
+            card(title="👋 Welcome!", content="This is a REAL digest generated from the admin's inbox.", key="welcome")
         else:
-            digests = get_user_digests(st.session_state.user_uuid)
-            if not digests:
-                ui.card(title="No Briefs Yet", content="Forward emails to your Inbox address.", key="empty")
+            # Число страниц — на пользователя: после смены аккаунта начинаем с первой
+            pages_key = f"digest_pages:{st.session_state.user_uuid}"
+            pages = st.session_state.setdefault(pages_key, 1)
+            index, has_more = get_digest_index(st.session_state.user_uuid, pages)
+            if not index:
+                card(title="No Briefs Yet", content="Forward emails to your Inbox address.", key="empty")
 
-        if digests:
-            # FIX: Превращаем ID в строку
-            options = {f"Digest #{str(d.get('id', '0'))[:4]}": d for d in digests}
+        if index and not open_id:
+            options = {index_label(d): d for d in index}
             sel = st.selectbox("Select Report:", list(options.keys()))
-            brief = options[sel]
-            
-            raw = brief.get('structured_content', {})
-            big_pic = brief.get('summary_text')
-            
-            if big_pic:
-                st.markdown("### 🌍 The Big Picture")
-                st.markdown(f'<div class="big-picture-box">{big_pic}</div>', unsafe_allow_html=True)
-            
-            st.divider()
-            st.markdown("### 📊 Key Insights")
+            if has_more and st.button("Load older briefs", key="load_older"):
+                st.session_state[pages_key] += 1
+                st.rerun()
+
+            selected = options[sel]
+            brief = selected if st.session_state.demo_mode else get_digest(selected['id'])
             
-            trends = raw.get('trends', []) if isinstance(raw, dict) else []
-            if trends:
-                for t in trends:
-                    st.markdown(f"""<div class="insight-card"><div class="insight-title">{t.get('title','')}</div><div class="insight-body">{t.get('insight','')}</div></div>""", unsafe_allow_html=True)
-            else: st.info("No trends found.")
+            if brief:
+                render_brief(brief, search_user)
+            else:
+                st.warning("Could not load this brief. Please try again.")
 
-            st.divider()
-            st.markdown("### 🚀 Action Items")
-            actions = raw.get('action_items', []) if isinstance(raw, dict) else []
-            for act in actions: st.markdown(f'<div class="action-item">☐ {act}</div>', unsafe_allow_html=True)
+    # --- PAGE: STATS ---
+    elif page == "Stats":
+        st.title("📊 Inbox Stats")
+        stats_user = ADMIN_UUID if st.session_state.demo_mode else st.session_state.user_uuid
+        stats = get_weekly_stats(stats_user)
+        if stats:
+            st.caption(f"Last {len(stats)} weeks · updated hourly")
+            render_stats(stats)
+        else:
+            card(title="No Stats Yet", content="Stats appear after your first emails are processed.", key="no_stats")
 
     # --- PAGE: SETTINGS (ТЕПЕРЬ ДОСТУПНА ВСЕМ) ---
     elif page == "Settings":
@@ -398,7 +520,7 @@ def main():
                         day = st.selectbox("Day", ["Monday", "Sunday"], index=0 if prof.get('digest_day') == "Monday" else 1)
                     with c2:
                         focus = st.text_area("Focus Areas", value=", ".join(prof.get('focus_areas', [])))
-                        time_val = st.time_input("Time (UTC)", value=pd.to_datetime(str(prof.get('digest_time', '09:00:00'))).time())
+                        time_val = st.time_input("Time (UTC)", value=parse_time(prof.get('digest_time', '09:00:00')))
                     
                     if st.form_submit_button("Save Changes", type="primary"):
                         update_user_profile(st.session_state.user_uuid, {
@@ -412,13 +534,7 @@ def main():
                 
                 st.divider()
                 st.markdown("### ⚡️ Manual Trigger")
-                if st.button("Generate Now", type="secondary", use_container_width=True):
-                    with st.spinner("Chef is cooking... (30-60s)"):
-                        if run_digest(st.session_state.user_uuid):
-                            st.success("Done! Check 'My Briefs'.")
-                            st.balloons()
-                        else:
-                            st.warning("Not enough new emails found yet.")
+                manual_trigger(st.session_state.user_uuid)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
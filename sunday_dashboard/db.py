@@ -0,0 +1,198 @@
+import os
+import uuid
+
+import streamlit as st
+
+from digest_index import list_digest_index, fetch_digest
+
+# --- DATA LAYER ДАШБОРДА ---
+# Каждый клик в Streamlit = полный rerun скрипта. Чтобы rerun не стоил 2-4 запроса
+# в Supabase, чтения кэшируются на пользователя (TTL) и сбрасываются явно после записи.
+
+PROFILE_TTL = 300  # сек
+DIGESTS_TTL = 300
+DIGEST_BODY_TTL = 3600  # тело дайджеста после создания не меняется
+DEMO_TTL = 600
+STATS_TTL = 900  # user_weekly_stats пересчитывается кроном (rollups.py)
+STATS_WEEKS = 12
+SEARCH_TTL = 60
+RELATED_TTL = 600
+
+ADMIN_UUID = "aa1a97d8-a102-4945-9390-239a6b6c5d68" # 👈 UUID админа для Live Demo
+
+@st.cache_resource
+def get_client():
+    from supabase import create_client  # тяжелый импорт — только при первом запросе к БД
+    return create_client(os.environ.get("SUPABASE_URL"), os.environ.get("SUPABASE_KEY"))
+
+@st.cache_resource
+def get_search_backend():
+    """RPC search_briefs или локальный индекс (SEARCH_LOCAL=1) — один на процесс"""
+    from search import get_search
+    return get_search(get_client())
+
+# --- ИНВАЛИДАЦИЯ ---
+
+@st.cache_resource
+def _user_versions():
+    """Общий для всех сессий счетчик версий: user_uuid -> int. Входит в ключ кэша."""
+    return {}
+
+def _version(user_uuid):
+    return _user_versions().get(user_uuid, 0)
+
+def invalidate_user(user_uuid):
+    """Сбросить кэш пользователя (после update_user_profile или run_digest)"""
+    versions = _user_versions()
+    versions[user_uuid] = versions.get(user_uuid, 0) + 1
+    st.session_state.pop('_db_memo', None)
+
+# --- ДЕДУПЛИКАЦИЯ В РАМКАХ ОДНОГО RERUN ---
+
+def begin_rerun():
+    """Вызывается в начале каждого rerun: повторные чтения внутри него берутся из памяти"""
+    st.session_state['_db_memo'] = {}
+
+def _memo(key, fetch):
+    memo = st.session_state.setdefault('_db_memo', {})
+    if key not in memo:
+        memo[key] = fetch()
+    return memo[key]
+
+# --- КЭШИРОВАННЫЕ ЧТЕНИЯ ---
+# Ошибки не ловятся внутри: исключение не попадает в кэш, следующий rerun повторит запрос.
+
+@st.cache_data(ttl=PROFILE_TTL, show_spinner=False)
+def _fetch_profile(user_uuid, version):
+    response = get_client().table("profiles").select("*").eq("id", user_uuid).execute()
+    return response.data[0] if response.data else {}
+
+@st.cache_data(ttl=DIGESTS_TTL, show_spinner=False)
+def _fetch_digest_page(user_uuid, cursor, version):
+    return list_digest_index(get_client(), user_uuid, cursor)
+
+@st.cache_data(ttl=DIGEST_BODY_TTL, show_spinner=False)
+def _fetch_digest(digest_id):
+    return fetch_digest(get_client(), digest_id)
+
+@st.cache_data(ttl=DEMO_TTL, show_spinner=False)
+def _fetch_demo_digest():
+    response = get_client().table("digests").select("*").eq("user_id", ADMIN_UUID).order("period_start", desc=True).limit(1).execute()
+    return response.data[0] if response.data else None
+
+@st.cache_data(ttl=STATS_TTL, show_spinner=False)
+def _fetch_weekly_stats(user_uuid, weeks):
+    response = get_client().table("user_weekly_stats") \
+        .select("week_start, emails, summaries, noise, noise_ratio, avg_importance, importance_hist, categories, top_senders") \
+        .eq("user_id", user_uuid) \
+        .order("week_start", desc=True) \
+        .limit(weeks) \
+        .execute()
+    return list(reversed(response.data or []))
+
+@st.cache_data(ttl=SEARCH_TTL, show_spinner=False)
+def _fetch_search(user_uuid, text, since, version):
+    return get_search_backend().search(user_uuid, text, since=since)
+
+@st.cache_data(ttl=RELATED_TTL, show_spinner=False)
+def _fetch_related(user_uuid, digest_id, version):
+    from render import normalize_brief
+    from vector_index import get_vector_index, brief_queries  # numpy — только на этом пути
+
+    brief = _fetch_digest(digest_id)
+    if not brief:
+        return []
+    index = get_vector_index(user_uuid)
+    index.sync(get_client())
+    before = brief.get('period_start') or brief.get('created_at')
+    return index.related_to(brief_queries(normalize_brief(brief)), k=5, before=before)
+
+def get_user_profile(user_uuid):
+    try: return _memo(("profile", user_uuid), lambda: _fetch_profile(user_uuid, _version(user_uuid)))
+    except: return {}
+
+def get_digest_index(user_uuid, pages=1):
+    """
+    Первые `pages` страниц индекса (id, период, заголовок).
+    Возвращает (rows, has_more).
+    """
+    def fetch():
+        rows, cursor = [], None
+        for _ in range(pages):
+            page, cursor = _fetch_digest_page(user_uuid, cursor, _version(user_uuid))
+            rows.extend(page)
+            if not cursor: break
+        return rows, cursor is not None
+    try: return _memo(("digest_index", user_uuid, pages), fetch)
+    except: return [], False
+
+def get_digest(digest_id):
+    """Полный дайджест — грузится лениво, только когда его выбрали"""
+    try: return _memo(("digest", digest_id), lambda: _fetch_digest(digest_id))
+    except: return None
+
+def get_weekly_stats(user_uuid, weeks=STATS_WEEKS):
+    """Последние `weeks` недель из роллапов, от старых к новым"""
+    try: return _memo(("stats", user_uuid, weeks), lambda: _fetch_weekly_stats(user_uuid, weeks))
+    except: return []
+
+def search_briefs(user_uuid, text, since=None):
+    """Полнотекстовый поиск по дайджестам и саммари пользователя (search.py)"""
+    text = " ".join(text.split())
+    if not text: return []
+    try: return _memo(("search", user_uuid, text, since), lambda: _fetch_search(user_uuid, text, since, _version(user_uuid)))
+    except: return []
+
+def get_related_coverage(user_uuid, digest_id):
+    """Саммари из более ранних недель, похожие на бриф (vector_index.py)"""
+    try: return _memo(("related", user_uuid, digest_id), lambda: _fetch_related(user_uuid, digest_id, _version(user_uuid)))
+    except: return []
+
+def get_live_demo_data():
+    try: return _memo(("demo",), _fetch_demo_digest) or get_fallback_data()
+    except: return get_fallback_data()
+
+def get_fallback_data():
+    return {
+        "id": "fake", "summary_text": "Demo Offline. Could not fetch live data.",
+        "structured_content": {"trends": [{"title": "Welcome", "insight": "This is a placeholder because the live demo fetch failed."}]}
+    }
+
+# --- ЗАПИСИ И ЛОГИН (без кэша) ---
+
+def get_user_uuid(email):
+    try:
+        email = email.strip().lower()
+        response = get_client().table("profiles").select("id") \
+            .or_(f"personal_email.eq.{email},inbox_email.eq.{email}").execute()
+        return response.data[0]['id'] if response.data else None
+    except: return None
+
+def update_user_profile(user_uuid, updates):
+    try:
+        get_client().table("profiles").update(updates).eq("id", user_uuid).execute()
+        invalidate_user(user_uuid)
+        return True
+    except Exception as e: st.error(f"Error: {e}"); return False
+
+def create_user_profile(email):
+    """Создает пользователя И генерирует ему адрес для пересылки"""
+    try:
+        new_id = str(uuid.uuid4())
+        existing = get_user_uuid(email)
+        if existing: return None, "User exists. Please login."
+
+        # Генерируем уникальный inbox (берем первые 8 символов ID)
+        inbox_email = f"{new_id[:8]}@sundayai.dev"
+
+        data = {
+            "id": new_id,
+            "personal_email": email,
+            "inbox_email": inbox_email, # <--- ВАЖНО: Сразу сохраняем
+            "role": "Founder",
+            "focus_areas": ["General Tech"]
+        }
+        get_client().table("profiles").insert(data).execute()
+        invalidate_user(new_id)
+        return new_id, None
+    except Exception as e: return None, str(e)